@@ -0,0 +1,163 @@
+import json
+import os
+import smtplib
+import threading
+from datetime import datetime
+from email.message import EmailMessage
+
+import database
+
+# Where the default FileSink appends alerts, one JSON object per line. None
+# means alerts.jsonl next to the database (database.DB_PATH) at send time.
+ALERT_LOG_PATH = os.environ.get('GIRLMATH_ALERT_LOG')
+
+
+def default_log_path():
+    """ALERT_LOG_PATH, or alerts.jsonl in the directory of database.DB_PATH"""
+    if ALERT_LOG_PATH:
+        return ALERT_LOG_PATH
+    return os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), 'alerts.jsonl')
+
+
+class AlertSink:
+    """Where triggered price alerts are delivered
+
+    Subclasses implement send(alert) for one alert dict (see
+    database.get_triggered_alerts). deliver() is what the evaluator calls
+    with a whole batch; override it to share a connection across the batch.
+    """
+
+    def send(self, alert):
+        raise NotImplementedError
+
+    def deliver(self, alerts):
+        """Send each alert and return the ones that went out"""
+        return _deliver_each(alerts, self.send)
+
+
+def _deliver_each(alerts, send):
+    """Call send(alert) for each alert, logging failures, and return the ones sent"""
+    delivered = []
+    for alert in alerts:
+        try:
+            send(alert)
+        except Exception as e:
+            print(f"Error sending price alert for {alert['asin']} to user {alert['user_id']}: {str(e)}")
+            continue
+        delivered.append(alert)
+    return delivered
+
+
+class FileSink(AlertSink):
+    """Appends each alert as a JSON line to a local file (default: default_log_path())"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        self.deliver([alert])
+
+    def deliver(self, alerts):
+        if not alerts:
+            return []
+        stamp = datetime.now().isoformat()
+        with self._lock, open(self.path or default_log_path(), 'a', encoding='utf-8') as f:
+            for alert in alerts:
+                f.write(json.dumps({**alert, 'sent_at': stamp}) + '\n')
+        return list(alerts)
+
+
+def format_alert(alert):
+    """Subject and body of the email for an alert"""
+    subject = f"Price drop: {alert['title']} is now ${alert['current_price']:.2f}"
+    body = (
+        f"Hi {alert['username']}!\n\n"
+        f"{alert['title']} just dropped to ${alert['current_price']:.2f}, "
+        f"at or below your ${alert['target_price']:.2f} alert. "
+        f"By girl math that's basically free! 💅\n\n"
+        f"https://www.amazon.com/dp/{alert['asin']}\n"
+    )
+    return subject, body
+
+
+class SMTPSink(AlertSink):
+    """Emails alerts through an SMTP server, one connection per batch
+
+    `smtp_factory(host, port)` returns the connection and defaults to
+    smtplib.SMTP; pass a stand-in to test without a mail server.
+    """
+
+    def __init__(self, host='localhost', port=25, sender='alerts@girlmath.app', smtp_factory=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.smtp_factory = smtp_factory
+
+    def _message(self, alert):
+        subject, body = format_alert(alert)
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = alert['email']
+        message['Subject'] = subject
+        message.set_content(body)
+        return message
+
+    def send(self, alert):
+        with self.smtp_factory(self.host, self.port) as smtp:
+            smtp.send_message(self._message(alert))
+
+    def deliver(self, alerts):
+        if not alerts:
+            return []
+        with self.smtp_factory(self.host, self.port) as smtp:
+            return _deliver_each(alerts, lambda alert: smtp.send_message(self._message(alert)))
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """The sink alerts go to, a FileSink on default_log_path() unless set_sink() chose another"""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = FileSink()
+    return _sink
+
+
+def set_sink(sink):
+    """Send alerts to `sink` from now on (None goes back to the default)"""
+    global _sink
+    with _sink_lock:
+        _sink = sink
+
+
+def alert_tiers():
+    """The tiers whose features include price alerts"""
+    return [tier for tier in database.USER_TIERS if database.get_user_tier_features(tier).get('price_alerts')]
+
+
+def evaluate_alerts(asins, sink=None):
+    """Fire the price alerts on a batch of just-saved products
+
+    Call after each save of refreshed products with their ASINs. Alerts
+    whose price went back above target are re-armed, the ones that should
+    fire are found with one set-based query per chunk of ASINs
+    (database.get_triggered_alerts), handed to the sink in one batch, and
+    the ones it delivered are marked so they don't fire again at the same
+    price. Alerts the sink failed on are retried on the next evaluation.
+
+    Returns {'checked', 'triggered', 'delivered', 'rearmed'}.
+    """
+    asins = list(dict.fromkeys(asins))
+    if not asins:
+        return {'checked': 0, 'triggered': 0, 'delivered': 0, 'rearmed': 0}
+    rearmed = database.rearm_price_alerts(asins)
+    triggered = database.get_triggered_alerts(asins, alert_tiers())
+    delivered = (sink or get_sink()).deliver(triggered) if triggered else []
+    if delivered:
+        database.mark_alerts_notified(delivered)
+    return {'checked': len(asins), 'triggered': len(triggered), 'delivered': len(delivered), 'rearmed': rearmed}
@@ -2,12 +2,16 @@
 import streamlit as st
 from database import *
 from utils import *
+import scheduler
 import run_tests
 import test_functions
 
 st.set_page_config(page_title="Girl Math App", layout="centered")
 
 def main():
+    init_db()
+    # Tracked products are re-scraped in the background; pages read them from SQLite
+    scheduler.get_scheduler().start()
     st.title("Girl Math App")
 
     # Directly run the original app.py content
@@ -0,0 +1,742 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for Girl Math Deal Finder.
+Run `python benchmarks.py` for everything or `python benchmarks.py <name>` for one.
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import heapq
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+from bs4 import BeautifulSoup
+
+import database
+import parsers
+import simulator
+import utils
+
+
+def _temp_database(directory):
+    """Point the database module at a fresh file inside directory"""
+    database.close_connections()
+    database.DB_PATH = os.path.join(directory, 'bench.db')
+    database.init_db()
+
+
+def _seed_products(count):
+    """Insert count synthetic products"""
+    for i in range(count):
+        database.save_product({
+            'asin': f'B0BENCH{i:03d}',
+            'title': f'Benchmark Product {i}',
+            'current_price': 19.99,
+            'peak_price': 24.99,
+            'lowest_price': 17.99,
+            'price_data': [24.99, 21.5, 19.99] * 30,
+        })
+
+
+@contextmanager
+def _read_caches(enabled):
+    """Start PRODUCT_CACHE and FAVORITE_CACHE empty, and with enabled=False keep them that way"""
+    caches = (database.PRODUCT_CACHE, database.FAVORITE_CACHE)
+    original_sizes = [cache.maxsize for cache in caches]
+    for cache in caches:
+        cache.clear()
+        if not enabled:
+            cache.maxsize = 0  # every set() is evicted at once, so every read goes to SQLite
+    try:
+        yield caches
+    finally:
+        for cache, maxsize in zip(caches, original_sizes):
+            cache.maxsize = maxsize
+            cache.clear()
+
+
+def _run_sessions(sessions, calls_per_session, asins):
+    """Simulate concurrent Streamlit sessions doing a typical rerun's reads"""
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        local = []
+        for i in range(calls_per_session):
+            asin = asins[i % len(asins)]
+            start = time.perf_counter()
+            database.get_product(asin)
+            database.is_favorite(asin)
+            database.get_recent_searches(5)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def bench_pool(sessions=8, calls_per_session=200):
+    """Per-call latency with connect/close per call vs the per-thread pool
+
+    The read-through caches are off for both runs, so every call reaches
+    get_connection() (see bench_read_cache for what the caches add).
+    """
+    original_path = database.DB_PATH
+    original_get_connection = database.get_connection
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _temp_database(tmp)
+            _seed_products(50)
+            asins = [f'B0BENCH{i:03d}' for i in range(50)]
+
+            # Before: a brand new connection per call, closed when the function returns
+            database.get_connection = lambda: sqlite3.connect(database.DB_PATH)
+            with _read_caches(enabled=False):
+                before = _run_sessions(sessions, calls_per_session, asins)
+
+            database.get_connection = original_get_connection
+            with _read_caches(enabled=False):
+                after = _run_sessions(sessions, calls_per_session, asins)
+        finally:
+            database.get_connection = original_get_connection
+            database.close_connections()
+            database.DB_PATH = original_path
+
+    print(f"Connection pool ({sessions} sessions x {calls_per_session} reruns)")
+    print(f"  connect per call: mean {before['mean_ms']:.3f} ms, p95 {before['p95_ms']:.3f} ms")
+    print(f"  pooled:           mean {after['mean_ms']:.3f} ms, p95 {after['p95_ms']:.3f} ms")
+    return {'before': before, 'after': after}
+
+
+def bench_read_cache(sessions=8, calls_per_session=200):
+    """Per-call latency on the pooled connection with the LRU read caches off vs on"""
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _temp_database(tmp)
+            _seed_products(50)
+            asins = [f'B0BENCH{i:03d}' for i in range(50)]
+
+            with _read_caches(enabled=False):
+                before = _run_sessions(sessions, calls_per_session, asins)
+
+            with _read_caches(enabled=True) as caches:
+                hits = [(cache.hits, cache.misses) for cache in caches]
+                after = _run_sessions(sessions, calls_per_session, asins)
+                hit_rates = []
+                for cache, (hits_before, misses_before) in zip(caches, hits):
+                    lookups = cache.hits - hits_before + cache.misses - misses_before
+                    hit_rates.append((cache.hits - hits_before) / lookups if lookups else 0.0)
+        finally:
+            database.close_connections()
+            database.DB_PATH = original_path
+
+    print(f"Read-through caches ({sessions} sessions x {calls_per_session} reruns)")
+    print(f"  uncached: mean {before['mean_ms']:.3f} ms, p95 {before['p95_ms']:.3f} ms")
+    print(f"  cached:   mean {after['mean_ms']:.3f} ms, p95 {after['p95_ms']:.3f} ms "
+          f"(hit rate: products {hit_rates[0]:.2f}, favorites {hit_rates[1]:.2f})")
+    return {'before': before, 'after': after, 'hit_rates': hit_rates}
+
+
+def _legacy_save_product(conn, product_info):
+    """The old check-then-write save_product, one transaction per product"""
+    now = datetime.now().isoformat()
+    c = conn.cursor()
+    c.execute("SELECT asin FROM products WHERE asin=?", (product_info['asin'],))
+    price_data_json = json.dumps(product_info['price_data'])
+    if c.fetchone():
+        c.execute('''
+        UPDATE products
+        SET title=?, current_price=?, peak_price=?, lowest_price=?, price_data=?, updated_at=?
+        WHERE asin=?
+        ''', (product_info['title'], product_info['current_price'], product_info['peak_price'],
+              product_info['lowest_price'], price_data_json, now, product_info['asin']))
+    else:
+        c.execute('''
+        INSERT INTO products
+        (asin, title, current_price, peak_price, lowest_price, price_data, category, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (product_info['asin'], product_info['title'], product_info['current_price'],
+              product_info['peak_price'], product_info['lowest_price'], price_data_json,
+              product_info.get('category', 'unknown'), now, now))
+    conn.commit()
+
+
+def _backfill(count, offset=0):
+    """Generate count synthetic products for a backfill"""
+    for i in range(count):
+        yield {
+            'asin': f'B{i + offset:09d}',
+            'title': f'Backfill Product {i}',
+            'current_price': 19.99,
+            'peak_price': 24.99,
+            'lowest_price': 17.99,
+            'price_data': [24.99, 21.5, 19.99] * 30,
+            'category': 'home',
+        }
+
+
+def _legacy_save_product_with_history(conn, product_info):
+    """_legacy_save_product plus the 90 price_points, one statement each, like a per-product save with history"""
+    today = datetime.now().date()
+    for ts, price in zip(database._day_labels(today, len(product_info['price_data'])), product_info['price_data']):
+        conn.execute("INSERT OR REPLACE INTO price_points (asin, ts, price, source) VALUES (?, ?, ?, 'amazon')",
+                     (product_info['asin'], ts, price))
+    _legacy_save_product(conn, product_info)
+
+
+def _moved(products):
+    """The same products with today's price changed, like a daily refresh"""
+    for product_info in products:
+        product_info['price_data'][-1] = 18.49
+        yield product_info
+
+
+def bench_upsert(count=5000):
+    """Backfill and daily re-save throughput: per-product saves vs save_products
+
+    The products-only loop is the old save_product, which kept no price
+    history, so it does a fraction of the work; the like-for-like baseline
+    is the per-product loop that also writes the 90 price_points.
+    """
+    original_path = database.DB_PATH
+    results = {}
+    workloads = [
+        ('products only (no history)', _legacy_save_product),
+        ('with price history', _legacy_save_product_with_history),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _temp_database(tmp)
+            conn = database.get_connection()
+            for offset, (name, save) in enumerate(workloads):
+                start = time.perf_counter()
+                for product_info in _backfill(count, offset=offset * count):
+                    save(conn, product_info)
+                new_rate = count / (time.perf_counter() - start)
+                start = time.perf_counter()
+                for product_info in _moved(_backfill(count, offset=offset * count)):
+                    save(conn, product_info)
+                results[name] = (new_rate, count / (time.perf_counter() - start))
+
+            offset = len(workloads) * count
+            new_stats = database.save_products(_backfill(count, offset=offset))
+            resave_stats = database.save_products(_moved(_backfill(count, offset=offset)))
+            results['save_products'] = (new_stats['rows_per_sec'], resave_stats['rows_per_sec'])
+        finally:
+            database.close_connections()
+            database.DB_PATH = original_path
+
+    print(f"Product upsert ({count} products x 90 days, rows/sec: new / re-saved with today's price moved)")
+    for name, (new_rate, resave_rate) in results.items():
+        label = name if name == 'save_products' else f"per-product, {name}"
+        print(f"  {label:38} {new_rate:8,.0f} / {resave_rate:8,.0f}")
+    print("  (the products-only loop keeps no price history or aggregates, so it isn't comparable)")
+    return {name: {'new_rows_per_sec': new_rate, 'resave_rows_per_sec': resave_rate}
+            for name, (new_rate, resave_rate) in results.items()}
+
+
+def _legacy_extract_asin(amazon_url):
+    """The old extract_asin for long URLs: four re.search calls, then re.split + re.match"""
+    patterns = [
+        r'/dp/(\w{10})',
+        r'/gp/product/(\w{10})',
+        r'/ASIN/(\w{10})',
+        r'amazon\.com.*?/(\w{10})(?:/|\?|$)'
+    ]
+    if amazon_url:
+        for pattern in patterns:
+            match = re.search(pattern, amazon_url)
+            if match:
+                return match.group(1)
+        parts = re.split(r'[/&?=]', amazon_url)
+        for part in parts:
+            if len(part) == 10 and re.match(r'^[A-Z0-9]{10}$', part, re.IGNORECASE):
+                return part
+    return None
+
+
+def url_corpus(count, seed=7):
+    """Wishlist-export style URLs: mostly /dp/ links with slugs and tracking
+    parameters, some /gp/product/ and mobile links, a few non-product pages,
+    and about a third repeats"""
+    rng = random.Random(seed)
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    words = ['Pink', 'Satin', 'Pillowcase', 'Lip', 'Gloss', 'Set', 'Stanley', 'Tumbler', 'Mini', 'Dyson']
+    urls = []
+    for _ in range(count):
+        if urls and rng.random() < 0.3:
+            urls.append(rng.choice(urls))
+            continue
+        asin = 'B0' + ''.join(rng.choice(alphabet) for _ in range(8))
+        slug = '-'.join(rng.sample(words, 4))
+        kind = rng.random()
+        if kind < 0.6:
+            url = f"https://www.amazon.com/{slug}/dp/{asin}/ref=sr_1_{rng.randint(1, 40)}?crid=2X9QZ&keywords=pink&qid=1700000000&sr=8-3"
+        elif kind < 0.75:
+            url = f"https://www.amazon.com/dp/{asin}?th=1&psc=1"
+        elif kind < 0.85:
+            url = f"https://www.amazon.com/gp/product/{asin}/ref=ppx_yo_dt_b_asin_title_o00_s00?ie=UTF8&psc=1"
+        elif kind < 0.93:
+            url = f"https://www.amazon.com/gp/aw/d/{asin}?pd_rd_i={asin}&th=1"
+        else:
+            url = f"https://www.amazon.com/hz/wishlist/ls/{rng.randint(10 ** 5, 10 ** 6)}?ref_=wl_share"
+        urls.append(url)
+    return urls
+
+
+def _best_rate(func, count, repeat=5):
+    """Best of `repeat` runs of func(), as items per second, plus its result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return count / best, result
+
+
+def bench_asin(count=50000):
+    """ASIN extraction throughput: old pattern loop vs precompiled extract_asins"""
+    urls = url_corpus(count)
+
+    legacy_rate, legacy = _best_rate(lambda: [_legacy_extract_asin(url) for url in urls], count)
+    single_rate, single = _best_rate(lambda: [utils.extract_asin(url) for url in urls], count)
+    batch_rate, batch = _best_rate(lambda: utils.extract_asins(urls), count)
+
+    assert legacy == single == batch, "extractors disagree"
+
+    print(f"ASIN extraction ({count} URLs, {len(set(urls))} distinct)")
+    print(f"  old extract_asin: {legacy_rate:,.0f} urls/sec")
+    print(f"  extract_asin:     {single_rate:,.0f} urls/sec")
+    print(f"  extract_asins:    {batch_rate:,.0f} urls/sec")
+    return {'legacy_per_sec': legacy_rate, 'single_per_sec': single_rate, 'batch_per_sec': batch_rate}
+
+
+def _legacy_demo_history(base_price, tech, num_days=90):
+    """The old demo-mode series for one product: linspace, a loop over sales, np.random.normal"""
+    if tech:
+        base_prices = np.linspace(base_price * 1.05, base_price, num_days)
+        num_sales = random.randint(1, 2)
+        sales_discount = 0.1
+    else:
+        base_prices = np.linspace(base_price * (1 - 0.05 * random.random()),
+                                  base_price * (1 + 0.05 * random.random()), num_days)
+        num_sales = random.randint(2, 3)
+        sales_discount = random.uniform(0.15, 0.25)
+    sales_pattern = np.zeros(num_days)
+    for _ in range(num_sales):
+        sale_start = random.randint(0, num_days - 10)
+        sale_duration = random.randint(5, 10)
+        sales_pattern[sale_start:sale_start + sale_duration] = -base_price * sales_discount
+    noise_level = min(0.02, 5.0 / base_price)
+    noise = np.random.normal(0, base_price * noise_level, num_days)
+    price_pattern = np.maximum(base_prices + sales_pattern + noise, base_price * 0.7)
+    price_pattern[-5:] = price_pattern[-5:] * (0.9 if base_price < 500 else 0.95)
+    return price_pattern.tolist()
+
+
+def bench_simulate(count=100000):
+    """Demo price histories: the old per-product loop vs generate_price_histories"""
+    asins = [f'B0SIM{i:05d}' for i in range(count)]
+
+    legacy_count = min(count, 10000)
+    start = time.perf_counter()
+    for i in range(legacy_count):
+        _legacy_demo_history(random.uniform(50, 300), tech=i % 2 == 0)
+    legacy_rate = legacy_count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    histories = simulator.generate_price_histories(asins)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in simulator.simulate_products(asins):
+        pass
+    products_seconds = time.perf_counter() - start
+
+    print(f"Demo price histories ({count} products x {histories.prices.shape[1]} days)")
+    print(f"  per-product loop:         {legacy_rate:,.0f} products/sec")
+    print(f"  generate_price_histories: {count / batch_seconds:,.0f} products/sec ({batch_seconds:.2f}s total)")
+    print(f"  simulate_products:        {count / products_seconds:,.0f} products/sec (full dicts with titles)")
+    return {'legacy_per_sec': legacy_rate, 'batch_per_sec': count / batch_seconds,
+            'products_per_sec': count / products_seconds}
+
+
+def _price_format_fixture(path, histories, fmt):
+    """A products table holding `histories` with price_data stored in fmt; returns its size in bytes"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute('''
+    CREATE TABLE products (
+        asin TEXT PRIMARY KEY, title TEXT NOT NULL, current_price REAL, peak_price REAL,
+        lowest_price REAL, price_data TEXT, category TEXT, created_at TEXT, updated_at TEXT
+    )
+    ''')
+    now = datetime.now().isoformat()
+    with conn:
+        conn.executemany(
+            "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((asin, asin, float(histories.current[i]), float(histories.peak[i]), float(histories.lowest[i]),
+              database.encode_price_data(histories.prices[i], fmt), histories.categories[i], now, now)
+             for i, asin in enumerate(histories.asins)))
+    column_bytes = conn.execute("SELECT SUM(LENGTH(price_data)) FROM products").fetchone()[0]
+    conn.close()
+    return os.path.getsize(path), column_bytes
+
+
+def bench_price_format(count=100000, reads=5000):
+    """Database size and uncached read latency of the price_data formats on a count-product fixture"""
+    histories = simulator.generate_price_histories(f'B{i:09d}' for i in range(count))
+    sample = random.Random(3).sample(histories.asins, min(reads, count))
+    original_path = database.DB_PATH
+    results = {}
+
+    print(f"price_data storage ({count:,} products x {histories.prices.shape[1]} days, {len(sample):,} uncached reads)")
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for fmt in ('json', 'cents', 'f32'):
+                path = os.path.join(tmp, f'{fmt}.db')
+                size, column_bytes = _price_format_fixture(path, histories, fmt)
+                database.close_connections()
+                database.DB_PATH = path
+
+                start = time.perf_counter()
+                for asin in sample:
+                    database._load_product(asin)
+                load_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+                raw = [row[0] for row in database.get_connection().execute(
+                    "SELECT price_data FROM products LIMIT ?", (len(sample),))]
+                start = time.perf_counter()
+                for value in raw:
+                    database.decode_price_data(value)
+                decode_us = (time.perf_counter() - start) / len(raw) * 1e6
+
+                results[fmt] = {'db_bytes': size, 'bytes_per_history': column_bytes / count,
+                                'load_us': load_us, 'decode_us': decode_us}
+                print(f"  {fmt:6} {size / 2 ** 20:7.1f} MB  {column_bytes / count:6.0f} B/history  "
+                      f"read+decode {load_us:6.1f} us  decode {decode_us:5.1f} us")
+        finally:
+            database.close_connections()
+            database.DB_PATH = original_path
+    return results
+
+
+def bench_price_summary(count=2000, reads=2000):
+    """Re-saving products whose latest price moved, and get_price_summary vs get_price_stats"""
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _temp_database(tmp)
+            database.save_products(_backfill(count))
+            moved = []
+            for product_info in _backfill(count):
+                product_info['price_data'][-1] = 18.49
+                moved.append(product_info)
+            resave = database.save_products(moved)
+
+            asins = [f'B{i:09d}' for i in range(min(reads, count))]
+            start = time.perf_counter()
+            for asin in asins:
+                database.get_price_stats(asin)
+            stats_us = (time.perf_counter() - start) / len(asins) * 1e6
+            start = time.perf_counter()
+            for asin in asins:
+                database.get_price_summary(asin)
+            summary_us = (time.perf_counter() - start) / len(asins) * 1e6
+        finally:
+            database.close_connections()
+            database.DB_PATH = original_path
+
+    print(f"Price aggregates ({count} products x 90 days)")
+    print(f"  re-save, latest price moved: {resave['rows_per_sec']:,.0f} rows/sec")
+    print(f"  get_price_stats (scans points): {stats_us:6.1f} us")
+    print(f"  get_price_summary (aggregates): {summary_us:6.1f} us")
+    return {'resave_rows_per_sec': resave['rows_per_sec'], 'stats_us': stats_us, 'summary_us': summary_us}
+
+
+# Saved Amazon product pages to benchmark against; synthetic pages are used when empty
+AMAZON_FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'amazon')
+
+
+def amazon_fixture(title='Stanley Quencher H2.0 Tumbler 40 oz', price='$45.00', layout='buybox', filler_kb=1500):
+    """A synthetic Amazon product page shaped like the real ones
+
+    Big inline scripts and navigation up top, the buy box, then a long tail of
+    reviews and carousels full of other products' prices. `layout` picks
+    where the price lives: 'buybox' (span.a-price), 'deal' (#priceblock_dealprice),
+    'whole' (span.a-price-whole only) or 'none'.
+    """
+    head = ['<!doctype html><html lang="en-us"><head><meta charset="utf-8"><title>Amazon.com</title>']
+    head.extend(f'<script>window.ue_t{i}={{"csm":"{"x" * 2000}"}};</script>' for i in range(20))
+    head.append('</head><body><div id="a-page"><header id="navbar">')
+    head.extend(f'<a class="nav-a" href="/b/{i}">Department {i}</a>' for i in range(200))
+    head.append('</header><div id="dp-container"><div id="centerCol">')
+
+    if layout == 'whole':
+        head.append(f'<h1 class="a-size-large"><span class="product-title-word-break">{title}</span></h1>')
+    else:
+        head.append(f'<h1 id="title" class="a-size-large"><span id="productTitle" class="a-size-large">  {title}  </span></h1>')
+    head.append('<div id="corePrice_feature_div">')
+    if layout == 'buybox':
+        head.append(f'<span class="a-price aok-align-center"><span class="a-offscreen">{price}</span>'
+                    f'<span aria-hidden="true"><span class="a-price-symbol">$</span>'
+                    f'<span class="a-price-whole">{price.strip("$").split(".")[0]}<span class="a-price-decimal">.</span></span></span></span>')
+    elif layout == 'deal':
+        head.append(f'<td><span id="priceblock_dealprice" class="a-color-price">{price}</span></td>')
+    elif layout == 'whole':
+        head.append(f'<span class="a-price-whole">{price.strip("$")}</span>')
+    head.append('</div><ul class="a-unordered-list">')
+    head.extend(f'<li><span class="a-list-item">Feature bullet {i} &amp; more detail</span></li>' for i in range(10))
+    head.append('</ul></div></div>')
+
+    tail = []
+    size = 0
+    i = 0
+    while size < filler_kb * 1024:
+        block = (f'<div class="a-carousel-card"><a href="/dp/B0FILL{i:04d}"><img src="/i/{i}.jpg" alt="">'
+                 f'<span class="a-size-base">Customers also bought item {i}</span></a>'
+                 f'<span class="a-price"><span class="a-offscreen">${i % 90 + 9}.99</span></span></div>'
+                 f'<div class="review"><p>{"Honestly obsessed, worth every penny. " * 8}</p></div>')
+        tail.append(block)
+        size += len(block)
+        i += 1
+    tail.append('</div></body></html>')
+    return (''.join(head) + ''.join(tail)).encode('utf-8')
+
+
+def _amazon_fixtures():
+    """(name, html bytes) for every saved page, or the synthetic set if there are none"""
+    saved = sorted(glob.glob(os.path.join(AMAZON_FIXTURE_DIR, '*.html')))
+    if saved:
+        fixtures = []
+        for path in saved:
+            with open(path, 'rb') as f:
+                fixtures.append((os.path.basename(path), f.read()))
+        return fixtures
+    return [(f'synthetic-{layout}', amazon_fixture(layout=layout)) for layout in ('buybox', 'deal', 'whole', 'none')]
+
+
+def _legacy_amazon_fields(content):
+    """The old title/price extraction: a full BeautifulSoup parse, then select_one down the lists"""
+    soup = BeautifulSoup(content, 'html.parser')
+    title_element = soup.select_one('#productTitle')
+    if not title_element:
+        title_element = soup.select_one('.product-title-word-break')
+    title = title_element.get_text().strip() if title_element else None
+
+    price = None
+    price_elements = [
+        soup.select_one('span.a-price .a-offscreen'),
+        soup.select_one('#priceblock_ourprice'),
+        soup.select_one('#priceblock_dealprice'),
+        soup.select_one('.a-price .a-offscreen'),
+        soup.select_one('span.a-price-whole')
+    ]
+    for element in price_elements:
+        if element:
+            price_match = re.search(r'[\d,]+\.\d+|\d+', element.get_text().strip())
+            if price_match:
+                price = float(price_match.group(0).replace(',', ''))
+                break
+    return {'title': title, 'price': price}
+
+
+def bench_amazon_html(repeat=3):
+    """Amazon page parse time: full BeautifulSoup vs parsers.parse_amazon_product"""
+    results = {}
+    backends = ['lxml', 'html.parser'] if parsers.etree is not None else ['html.parser']
+    print("Amazon product page parsing (ms per page, best of %d)" % repeat)
+    for name, content in _amazon_fixtures():
+        expected = _legacy_amazon_fields(content)
+        timings = {}
+        timings['BeautifulSoup'] = _best_rate(lambda: _legacy_amazon_fields(content), 1, repeat)[0]
+        for backend in backends:
+            rate, fields = _best_rate(lambda: parsers.parse_amazon_product(content, backend=backend), 1, repeat)
+            assert fields == expected, f"{backend} disagrees on {name}: {fields} != {expected}"
+            timings[backend] = rate
+        results[name] = {label: 1000 / rate for label, rate in timings.items()}
+        print(f"  {name} ({len(content) / 1024:,.0f} KB): " +
+              ", ".join(f"{label} {ms:.1f}" for label, ms in results[name].items()))
+    return results
+
+
+def walmart_fixture(results=60, next_data=True):
+    """A synthetic Walmart search page: header, `results` product cards, then __NEXT_DATA__"""
+    parts = ['<!doctype html><html><head><meta charset="utf-8">']
+    parts.extend(f'<link rel="preload" href="/static/{i}.js" as="script">' for i in range(40))
+    parts.append('</head><body><div id="__next"><header>')
+    parts.extend(f'<a href="/cp/{i}">Shop {i}</a>' for i in range(150))
+    parts.append('</header><main><section aria-label="Search results">')
+    items = []
+    for i in range(results):
+        name = f"Pink Insulated Tumbler {i} with Straw, 40 oz"
+        price = 19.97 + i
+        items.append({'__typename': 'Product', 'name': name, 'price': price, 'canonicalUrl': f'/ip/tumbler-{i}/{1000 + i}'})
+        parts.append(
+            f'<div data-item-id="{1000 + i}" class="mb0 ph1 pa0-xl bb b--near-white w-25">'
+            f'<a link-identifier="{1000 + i}" href="/ip/tumbler-{i}/{1000 + i}"><img src="/i/{i}.jpeg" alt="{name}">'
+            f'<span data-automation-id="product-title" class="normal dark-gray">{name}</span></a>'
+            f'<div data-automation-id="product-price"><span class="w_iUH7">current price ${price:.2f}</span>'
+            f'<div class="b black f5 mr1">$<span class="f2">{int(price)}</span><span>{int(price * 100) % 100:02d}</span></div></div>'
+            f'<div class="flex items-center mt2">{"<span class=star></span>" * 5}<span>4.7 out of 5 Stars. 1,204 reviews</span></div>'
+            f'<div class="mt2">{"Free shipping, arrives tomorrow. Pickup today. " * 12}</div></div>')
+    parts.append('</section></main></div>')
+    if next_data:
+        payload = {'props': {'pageProps': {'initialData': {'searchResult': {'itemStacks': [{'items': items}]},
+                                                           'padding': ['x' * 200] * 2000}}}}
+        parts.append(f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(payload)}</script>')
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _legacy_walmart_first_price(content):
+    """The old search_walmart parse: a full soup, every card selected, price of the first"""
+    soup = BeautifulSoup(content.decode('utf-8'), 'html.parser')
+    product_items = soup.select('div[data-item-id]')
+    if not product_items:
+        product_items = soup.select('.search-result-gridview-item')
+    if not product_items:
+        product_items = soup.select('.product-card')
+    if not product_items:
+        return None
+    for selector in ['span[data-automation-id="product-price"]', 'span.product-price-container',
+                     'span.price-characteristic', '.product-price-container', '.price-group']:
+        elements = product_items[0].select(selector)
+        if elements:
+            price_match = re.search(r'\$?(\d+\.\d{2}|\d+)', elements[0].get_text().strip())
+            return f"${price_match.group(1)}" if price_match else elements[0].get_text().strip()
+    return "Found at Walmart (price unavailable)"
+
+
+def bench_walmart_html(repeat=3):
+    """Walmart search page parse time: full BeautifulSoup vs the streaming first-product parser"""
+    content = walmart_fixture()
+    soup_rate, _ = _best_rate(lambda: _legacy_walmart_first_price(content), 1, repeat)
+    stream_rate, result = _best_rate(lambda: parsers.parse_walmart_search(content), 1, repeat)
+    assert result['title'] == 'Pink Insulated Tumbler 0 with Straw, 40 oz' and result['price'] == 19.97, result
+
+    print(f"Walmart search page parsing ({len(content) / 1024:,.0f} KB, ms per page, best of {repeat})")
+    print(f"  BeautifulSoup, all cards:  {1000 / soup_rate:.1f}")
+    print(f"  streaming, first card:     {1000 / stream_rate:.1f}")
+    return {'soup_ms': 1000 / soup_rate, 'stream_ms': 1000 / stream_rate}
+
+
+def bench_score_deals(count=1000000):
+    """Deal scoring: girl_math_logic + deal_tier per product vs one score_deals pass"""
+    rng = np.random.default_rng(23)
+    peak = np.round(rng.uniform(10, 500, count), 2)
+    lowest = np.round(peak * rng.uniform(0.4, 1.0, count), 2)
+    current = np.round(rng.uniform(lowest, peak), 2)
+
+    scalar_count = min(count, 100000)
+    rows = list(zip(current[:scalar_count].tolist(), peak[:scalar_count].tolist(), lowest[:scalar_count].tolist()))
+
+    def scalar():
+        for c, p, l in rows:
+            _, percent = utils.girl_math_logic(c, p, l)
+            utils.deal_tier(c, l, percent)
+
+    scalar_rate, _ = _best_rate(scalar, scalar_count, repeat=3)
+    batch_rate, scores = _best_rate(lambda: utils.score_deals(current, peak, lowest), count, repeat=3)
+
+    print(f"Deal scoring ({count:,} products)")
+    print(f"  scalar loop: {scalar_rate:,.0f} products/sec")
+    print(f"  score_deals: {batch_rate:,.0f} products/sec ({count / batch_rate * 1000:.0f} ms total)")
+    print("  tiers: " + ', '.join(f"{name} {n:,}" for name, n in
+                                   zip(utils.DEAL_TIERS, np.bincount(scores['tier'], minlength=len(utils.DEAL_TIERS)))))
+    return {'scalar_per_sec': scalar_rate, 'batch_per_sec': batch_rate}
+
+
+def _top_deals_fixture(count):
+    """Insert count products with random prices in five categories into the current database"""
+    rng = np.random.default_rng(24)
+    peak = np.round(rng.uniform(10, 500, count), 2)
+    current = np.round(peak * rng.uniform(0.3, 1.2, count), 2)
+    categories = ['home', 'beauty', 'tech', 'fashion', 'kitchen']
+    conn = database.get_connection()
+    with conn:
+        conn.executemany('''
+        INSERT INTO products (asin, title, current_price, peak_price, lowest_price, category)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', ((f'B{i:09d}', f'Deal Product {i}', c, p, c, categories[i % 5])
+              for i, (c, p) in enumerate(zip(current.tolist(), peak.tolist()))))
+
+
+def _legacy_top_deals(k):
+    """Load every product and rank it with girl_math_logic in Python"""
+    rows = database.get_connection().execute(
+        "SELECT asin, current_price, peak_price, lowest_price FROM products").fetchall()
+    return heapq.nlargest(k, rows, key=lambda row: utils.girl_math_logic(row[1], row[2], row[3])[0])
+
+
+def bench_top_deals(sizes=(100000, 1000000), k=10, repeat=20):
+    """Top-k deals: loading every product into Python vs get_top_deals on the deal_savings index"""
+    original_path = database.DB_PATH
+    results = {}
+    print(f"Top {k} deals (ms per query)")
+    for count in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                _temp_database(tmp)
+                _top_deals_fixture(count)
+                legacy_rate, legacy = _best_rate(lambda: _legacy_top_deals(k), 1, repeat=1)
+                indexed_rate, _ = _best_rate(lambda: [database.get_top_deals(k) for _ in range(repeat)], repeat)
+                category_rate, _ = _best_rate(
+                    lambda: [database.get_top_deals(k, category='tech') for _ in range(repeat)], repeat)
+                top = database.get_top_deals(k)
+                assert [deal['savings'] for deal in top] == [utils.girl_math_logic(*row[1:])[0] for row in legacy]
+            finally:
+                database.close_connections()
+                database.DB_PATH = original_path
+
+        results[count] = {'legacy_ms': 1000 / legacy_rate, 'indexed_ms': 1000 / indexed_rate,
+                          'category_ms': 1000 / category_rate}
+        print(f"  {count:>9,} products: load + girl_math_logic {1000 / legacy_rate:8.1f}   "
+              f"get_top_deals {1000 / indexed_rate:6.3f}   by category {1000 / category_rate:6.3f}")
+    return results
+
+
+BENCHMARKS = {
+    'pool': bench_pool,
+    'read_cache': bench_read_cache,
+    'upsert': bench_upsert,
+    'asin': bench_asin,
+    'simulate': bench_simulate,
+    'amazon_html': bench_amazon_html,
+    'walmart_html': bench_walmart_html,
+    'price_format': bench_price_format,
+    'price_summary': bench_price_summary,
+    'score_deals': bench_score_deals,
+    'top_deals': bench_top_deals,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'. Choose from: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[name]()
+        print()
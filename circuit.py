@@ -0,0 +1,121 @@
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Thread-safe circuit breaker for a flaky dependency
+
+    After `failure_threshold` failures in a row the breaker opens and allow()
+    says no, so callers skip the dependency instead of waiting on it. After
+    `reset_after` seconds one trial call is let through (half-open): success
+    closes the breaker again, failure reopens it for another `reset_after`.
+    A trial whose outcome is never recorded stops blocking new trials after
+    another `reset_after`.
+
+    on_transition(old_state, new_state), if given, is called on every state
+    change (outside the lock), e.g. to count transitions as metrics.
+    """
+
+    def __init__(self, failure_threshold=3, reset_after=30, clock=time.monotonic, on_transition=None):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self._on_transition = on_transition
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self.opens = 0
+        self.rejections = 0
+
+    @property
+    def state(self):
+        """'closed', 'open' or 'half_open'"""
+        with self._lock:
+            state, changes = self._current_state()
+        self._notify(changes)
+        return state
+
+    def _current_state(self):
+        """The state now (moving open to half-open once reset_after has passed) and any change made"""
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_after:
+            self._state = HALF_OPEN
+            self._trial_started = None
+            return self._state, [(OPEN, HALF_OPEN)]
+        return self._state, []
+
+    def _set_state(self, state, changes):
+        if state != self._state:
+            changes.append((self._state, state))
+            self._state = state
+
+    def _notify(self, changes):
+        if self._on_transition:
+            for old, new in changes:
+                self._on_transition(old, new)
+
+    def allow(self):
+        """True if a call may go ahead now"""
+        with self._lock:
+            state, changes = self._current_state()
+            if state == CLOSED:
+                allowed = True
+            elif state == HALF_OPEN and (self._trial_started is None
+                                         or self._clock() - self._trial_started >= self.reset_after):
+                self._trial_started = self._clock()
+                allowed = True
+            else:
+                self.rejections += 1
+                allowed = False
+        self._notify(changes)
+        return allowed
+
+    def record_success(self):
+        """A call succeeded: close the breaker"""
+        changes = []
+        with self._lock:
+            self._failures = 0
+            self._trial_started = None
+            self._set_state(CLOSED, changes)
+        self._notify(changes)
+
+    def record_failure(self):
+        """A call failed or timed out: open the breaker once there are enough in a row"""
+        with self._lock:
+            state, changes = self._current_state()
+            self._failures += 1
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != OPEN:
+                    self.opens += 1
+                self._set_state(OPEN, changes)
+                self._opened_at = self._clock()
+                self._trial_started = None
+        self._notify(changes)
+
+    def reset(self):
+        """Forget all failures and close the breaker"""
+        changes = []
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+            self._set_state(CLOSED, changes)
+        self._notify(changes)
+
+    def stats(self):
+        """Return the breaker's state and counters"""
+        with self._lock:
+            state, changes = self._current_state()
+            stats = {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'opens': self.opens,
+                'rejections': self.rejections,
+            }
+        self._notify(changes)
+        return stats
@@ -1,16 +1,123 @@
 import sqlite3
 import os
 import json
-from datetime import datetime
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice, repeat
+
+import numpy as np
+
+from cache import LRUCache, MISSING
 
 # Database setup
 DB_PATH = "girlmath.db"
 
-def init_db():
-    """Initialize the database with required tables"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+# Pragmas applied to every pooled connection
+CONNECTION_PRAGMAS = [
+    ('journal_mode', 'WAL'),      # readers don't block the writer
+    ('synchronous', 'NORMAL'),    # safe with WAL, one fsync per checkpoint
+    ('cache_size', -8000),        # negative means KiB, so ~8 MB page cache
+    ('mmap_size', 67108864),      # 64 MB of memory-mapped reads
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),       # wait up to 5s for a competing writer
+]
+
+# How save_products() stores price_data: 'json' (a JSON list, the original
+# format), 'cents' (delta-encoded integer cents, exact for prices in cents) or
+# 'f32' (float32, read back exact to the cent below about $100,000). Every format reads back
+# transparently; convert_price_data() rewrites existing rows.
+PRICE_DATA_FORMAT = os.environ.get('GIRLMATH_PRICE_FORMAT', 'json')
+
+# Process-wide read-through caches for the per-rerun lookups, keyed by
+# (DB_PATH, asin), plus user_id for favorites. Writes through save_products/toggle_favorite invalidate them;
+# the TTL bounds staleness from writers in other processes.
+CACHE_TTL_SECONDS = 300
+PRODUCT_CACHE = LRUCache(maxsize=2048, ttl=CACHE_TTL_SECONDS)
+FAVORITE_CACHE = LRUCache(maxsize=8192, ttl=CACHE_TTL_SECONDS)
+
+# Per-thread connection pool. Streamlit runs each session on its own
+# thread, so every thread keeps one long-lived connection per database path.
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool = {}  # (thread id, db path) -> connection
+_pool_generation = 0  # bumped by close_connections() so threads drop closed handles
+
+def _open_connection(path):
+    """Open a new connection and apply the pool pragmas"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for name, value in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+def get_connection():
+    """Return this thread's pooled connection to DB_PATH, opening it on first use"""
+    if getattr(_local, 'generation', None) != _pool_generation:
+        _local.connections = {}
+        _local.generation = _pool_generation
+    
+    conn = _local.connections.get(DB_PATH)
+    if conn is not None:
+        # Don't hand out a transaction left open by a call that raised
+        if conn.in_transaction:
+            conn.rollback()
+        return conn
+    
+    conn = _open_connection(DB_PATH)
+    _local.connections[DB_PATH] = conn
+    
+    key = (threading.get_ident(), DB_PATH)
+    with _pool_lock:
+        # Thread ids get reused, so close whatever a dead thread left behind
+        alive = {t.ident for t in threading.enumerate()}
+        for stale_key in [k for k in _pool if k[0] not in alive or k == key]:
+            _pool.pop(stale_key).close()
+        _pool[key] = conn
     
+    return conn
+
+def close_connections():
+    """Close every pooled connection (e.g. before deleting the database file)"""
+    global _pool_generation
+    with _pool_lock:
+        for conn in _pool.values():
+            conn.close()
+        _pool.clear()
+        _pool_generation += 1
+    _schema_ready.clear()
+    PRODUCT_CACHE.clear()
+    FAVORITE_CACHE.clear()
+
+def get_cache_stats():
+    """Return hit/miss/eviction counters for the product and favorite caches"""
+    return {
+        'products': PRODUCT_CACHE.stats(),
+        'favorites': FAVORITE_CACHE.stats()
+    }
+
+def get_pool_stats():
+    """Return the number of open pooled connections per database path"""
+    stats = {}
+    with _pool_lock:
+        for _, path in _pool:
+            stats[path] = stats.get(path, 0) + 1
+    return stats
+
+def _add_column_if_missing(c, table, column, declaration):
+    """Add a column to an existing table unless it is already there"""
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+# Forward-only schema migrations. PRAGMA user_version records how many have
+# been applied; init_db() runs the pending ones in order in one transaction.
+# Never edit or reorder a migration that has shipped - append a new one.
+def _migration_base_tables(conn):
+    """Create the original tables and the default coupon"""
+    c = conn.cursor()
+
     # Create products table
     c.execute('''
     CREATE TABLE IF NOT EXISTS products (
@@ -85,81 +192,531 @@ def init_db():
         INSERT INTO coupon_codes (code, tier, created_at)
         VALUES (?, ?, ?)
         ''', ('crystalcallahan', 'platinum', now))
-    
-    conn.commit()
-    conn.close()
 
-def save_product(product_info):
-    """Save product information to database"""
-    conn = sqlite3.connect(DB_PATH)
+def _migration_price_points(conn):
+    """Create the normalized price history table and fill it from the JSON column"""
     c = conn.cursor()
-    
-    now = datetime.now().isoformat()
-    
-    # Check if product already exists
-    c.execute("SELECT asin FROM products WHERE asin=?", (product_info['asin'],))
-    existing = c.fetchone()
-    
-    price_data_json = json.dumps(product_info['price_data'])
-    
-    if existing:
-        # Update existing product
-        c.execute('''
-        UPDATE products 
-        SET title=?, current_price=?, peak_price=?, lowest_price=?, 
-            price_data=?, updated_at=?
-        WHERE asin=?
-        ''', (
-            product_info['title'],
-            product_info['current_price'],
-            product_info['peak_price'],
-            product_info['lowest_price'],
-            price_data_json,
-            now,
-            product_info['asin']
-        ))
+
+    # The (asin, ts) primary key of a WITHOUT ROWID table is the composite
+    # index, so per-product range scans read contiguous pages.
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS price_points (
+        asin TEXT NOT NULL,
+        ts TEXT NOT NULL,  -- ISO date of the observation
+        price REAL NOT NULL,
+        source TEXT,
+        PRIMARY KEY (asin, ts)
+    ) WITHOUT ROWID
+    ''')
+
+    _copy_json_price_history(conn)
+
+def _migration_hot_indexes(conn):
+    """Add user_id to pre-account tables and index the hot lookups"""
+    c = conn.cursor()
+
+    # Databases created before user accounts existed lack the user_id columns
+    _add_column_if_missing(c, 'search_history', 'user_id', 'INTEGER REFERENCES users(id)')
+    _add_column_if_missing(c, 'favorites', 'user_id', 'INTEGER REFERENCES users(id)')
+
+    # Indexes for the hot lookups (checked by query_plan_audit.py)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_search_history_date ON search_history(search_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_search_history_asin ON search_history(asin)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_search_history_user ON search_history(user_id, search_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_favorites_asin ON favorites(asin)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_favorites_user ON favorites(user_id, added_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_favorites_added_at ON favorites(added_at)")
+
+def _migration_short_links(conn):
+    """Create the a.co short code -> ASIN table"""
+    # asin is NULL for codes that failed to resolve; resolved_at says when
+    # to try those again (see utils.SHORT_LINK_RETRY_SECONDS)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS short_links (
+        code TEXT PRIMARY KEY,
+        asin TEXT,
+        resolved_at TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+# Running aggregates of each product's price_points, kept on the products row
+# by save_products() so summaries never rescan a history (see get_price_summary)
+_PRICE_AGGREGATE_COLUMNS = [
+    ('points_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('points_sum', 'REAL NOT NULL DEFAULT 0'),
+    ('points_sumsq', 'REAL NOT NULL DEFAULT 0'),  # for the variance
+    ('points_min', 'REAL'),
+    ('points_min_at', 'TEXT'),    # ts of the lowest price (the latest, on ties)
+    ('points_max', 'REAL'),
+    ('points_max_at', 'TEXT'),    # ts of the highest price (the latest, on ties)
+    ('last_point', 'REAL'),       # price at last_point_at
+    ('last_point_at', 'TEXT'),    # newest ts
+    ('last_change_at', 'TEXT'),   # newest ts whose price differs from the point before it
+]
+_AGGREGATE_NAMES = [column for column, _ in _PRICE_AGGREGATE_COLUMNS]
+
+# Recompute aggregates from price_points; {where} picks the products. For
+# backfills and the rare write that raises the lowest or lowers the highest price.
+_RECOMPUTE_AGGREGATES_SQL = '''
+UPDATE products SET
+    points_count = (SELECT COUNT(*) FROM price_points WHERE asin = products.asin),
+    points_sum = (SELECT COALESCE(SUM(price), 0) FROM price_points WHERE asin = products.asin),
+    points_sumsq = (SELECT COALESCE(SUM(price * price), 0) FROM price_points WHERE asin = products.asin),
+    points_min = (SELECT MIN(price) FROM price_points WHERE asin = products.asin),
+    points_min_at = (SELECT ts FROM price_points WHERE asin = products.asin ORDER BY price, ts DESC LIMIT 1),
+    points_max = (SELECT MAX(price) FROM price_points WHERE asin = products.asin),
+    points_max_at = (SELECT ts FROM price_points WHERE asin = products.asin ORDER BY price DESC, ts DESC LIMIT 1),
+    last_point = (SELECT price FROM price_points WHERE asin = products.asin ORDER BY ts DESC LIMIT 1),
+    last_point_at = (SELECT MAX(ts) FROM price_points WHERE asin = products.asin),
+    last_change_at = (
+        SELECT MAX(ts) FROM (
+            SELECT ts, price, LAG(price) OVER (ORDER BY ts) AS previous
+            FROM price_points WHERE asin = products.asin
+        ) WHERE previous IS NULL OR price != previous
+    )
+WHERE {where}
+'''
+
+def _migration_price_aggregates(conn):
+    """Add the running price aggregate columns to products and fill them in"""
+    c = conn.cursor()
+    for column, declaration in _PRICE_AGGREGATE_COLUMNS:
+        _add_column_if_missing(c, 'products', column, declaration)
+    c.execute(_RECOMPUTE_AGGREGATES_SQL.format(where='1'))
+
+def _migration_deal_savings(conn):
+    """Add the indexed deal_savings column that get_top_deals ranks by"""
+    c = conn.cursor()
+
+    # girl_math_logic's enhanced savings (utils.SAVINGS_BOOST is 1.1), computed
+    # by SQLite on read. VIRTUAL costs no space in the row; the indexes hold it.
+    c.execute('''
+    ALTER TABLE products ADD COLUMN deal_savings REAL
+    GENERATED ALWAYS AS ((peak_price - current_price) * 1.1) VIRTUAL
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_deal_savings ON products(deal_savings)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_category_deal_savings ON products(category, deal_savings)")
+
+def _migration_price_alerts(conn):
+    """Create the per-user price alert table"""
+    # Keyed by asin first so evaluating a batch of refreshed products reads
+    # only their alerts. notified_price is the price last alerted at (NULL
+    # while the alert is armed); the alert fires again only below it, or
+    # after the price has gone back above the target.
+    c = conn.cursor()
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS price_alerts (
+        asin TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        target_price REAL NOT NULL,
+        created_at TEXT,
+        notified_price REAL,
+        notified_at TEXT,
+        PRIMARY KEY (asin, user_id),
+        FOREIGN KEY(asin) REFERENCES products(asin),
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_price_alerts_user ON price_alerts(user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_favorites_user_asin ON favorites(user_id, asin)")
+
+MIGRATIONS = [
+    _migration_base_tables,      # 1
+    _migration_price_points,     # 2
+    _migration_hot_indexes,      # 3
+    _migration_short_links,      # 4
+    _migration_price_aggregates, # 5
+    _migration_deal_savings,     # 6
+    _migration_price_alerts,     # 7
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Database paths already known to be at SCHEMA_VERSION in this process
+_schema_ready = set()
+
+def _user_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def get_schema_version():
+    """Return the number of migrations applied to the database"""
+    return _user_version(get_connection())
+
+def init_db():
+    """Initialize the database by applying any pending schema migrations
+
+    Cheap to call repeatedly: after the first check in a process it returns
+    without touching the database, and when the schema is already current
+    it only reads PRAGMA user_version.
+    """
+    if DB_PATH in _schema_ready:
+        return
+
+    conn = get_connection()
+
+    if _user_version(conn) < SCHEMA_VERSION:
+        # BEGIN IMMEDIATE takes the write lock up front, so when several
+        # processes start together only one applies each migration
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = _user_version(conn)
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(conn)
+                conn.execute(f"PRAGMA user_version={number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Every in-memory connection is a separate database, so never skip those
+    if DB_PATH != ':memory:':
+        _schema_ready.add(DB_PATH)
+
+# save_products() works out the aggregate columns (see _PRICE_AGGREGATE_COLUMNS)
+_UPSERT_PRODUCT_SQL = '''
+INSERT INTO products
+(asin, title, current_price, peak_price, lowest_price, price_data, category, created_at, updated_at,
+ points_count, points_sum, points_sumsq, points_min, points_min_at, points_max, points_max_at,
+ last_point, last_point_at, last_change_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(asin) DO UPDATE SET
+    title=excluded.title,
+    current_price=excluded.current_price,
+    peak_price=excluded.peak_price,
+    lowest_price=excluded.lowest_price,
+    price_data=excluded.price_data,
+    updated_at=excluded.updated_at,
+    points_count=excluded.points_count,
+    points_sum=excluded.points_sum,
+    points_sumsq=excluded.points_sumsq,
+    points_min=excluded.points_min,
+    points_min_at=excluded.points_min_at,
+    points_max=excluded.points_max,
+    points_max_at=excluded.points_max_at,
+    last_point=excluded.last_point,
+    last_point_at=excluded.last_point_at,
+    last_change_at=excluded.last_change_at
+'''
+
+# First byte of a binary price_data BLOB. JSON rows are text starting with '['.
+_F32_TAG = b'F'         # float32 prices
+_CENTS16_TAG = b'c'     # int32 first price in cents, then int16 day-to-day changes
+_CENTS32_TAG = b'C'     # int32 first price in cents, then int32 changes (a change didn't fit int16)
+
+def encode_price_data(price_data, fmt=None):
+    """Encode a daily price list for the products.price_data column (see PRICE_DATA_FORMAT)"""
+    fmt = fmt or PRICE_DATA_FORMAT
+    if fmt == 'json':
+        return json.dumps(price_data.tolist() if isinstance(price_data, np.ndarray) else price_data)
+    prices = np.asarray(price_data, dtype=np.float64)
+    if fmt == 'f32':
+        return _F32_TAG + prices.astype('<f4').tobytes()
+    if fmt == 'cents':
+        cents = np.rint(prices * 100).astype(np.int64)
+        deltas = np.diff(cents)
+        first = cents[:1].astype('<i4').tobytes()
+        if deltas.size == 0 or np.abs(deltas).max() < 2 ** 15:
+            return _CENTS16_TAG + first + deltas.astype('<i2').tobytes()
+        return _CENTS32_TAG + first + deltas.astype('<i4').tobytes()
+    raise ValueError(f"Unknown price_data format: {fmt}")
+
+def decode_price_data(value):
+    """Decode a products.price_data value in any format to a read-only NumPy array
+
+    float32 BLOBs are viewed in place with np.frombuffer (no copy); cents
+    BLOBs take one cumulative sum; legacy JSON text goes through json.loads.
+    """
+    if value is None:
+        prices = np.empty(0)
+    elif isinstance(value, str):
+        prices = np.array(json.loads(value), dtype=np.float64)
     else:
-        # Insert new product
-        category = product_info.get('category', 'unknown')
-        c.execute('''
-        INSERT INTO products 
-        (asin, title, current_price, peak_price, lowest_price, price_data, category, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            product_info['asin'],
-            product_info['title'],
-            product_info['current_price'],
-            product_info['peak_price'],
-            product_info['lowest_price'],
-            price_data_json,
-            category,
-            now,
-            now
-        ))
-    
-    conn.commit()
-    conn.close()
+        tag = value[:1]
+        if tag == _F32_TAG:
+            return np.frombuffer(value, dtype='<f4', offset=1)
+        if tag not in (_CENTS16_TAG, _CENTS32_TAG):
+            # JSON that was stored as bytes
+            prices = np.array(json.loads(bytes(value)), dtype=np.float64)
+        elif len(value) < 5:
+            prices = np.empty(0)
+        else:
+            deltas = np.frombuffer(value, dtype='<i2' if tag == _CENTS16_TAG else '<i4', offset=5)
+            cents = np.empty(deltas.size + 1, dtype=np.int64)
+            cents[0] = np.frombuffer(value, dtype='<i4', count=1, offset=1)[0]
+            np.cumsum(deltas, out=cents[1:])
+            cents[1:] += cents[0]
+            prices = cents / 100
+    prices.flags.writeable = False
+    return prices
+
+def price_list(prices):
+    """Python floats from a decoded price array, the way get_product returns them
+
+    float32 values are rounded back to the cents they were saved from.
+    """
+    if prices.dtype == np.float32:
+        return np.round(prices.astype(np.float64), 2).tolist()
+    return prices.tolist()
+
+def _history_aggregates(price_data, labels):
+    """The aggregate columns (see _PRICE_AGGREGATE_COLUMNS) of a whole daily history"""
+    if len(price_data) == 0:
+        return (0, 0.0, 0.0, None, None, None, None, None, None, None)
+    low = high = price_data[0]
+    low_at = high_at = change_at = labels[0]
+    total = squares = 0.0
+    previous = None
+    for price, label in zip(price_data, labels):
+        total += price
+        squares += price * price
+        if price <= low:
+            low, low_at = price, label
+        if price >= high:
+            high, high_at = price, label
+        if price != previous:
+            change_at = label
+        previous = price
+    return (len(price_data), total, squares, low, low_at, high, high_at, price_data[-1], labels[-1], change_at)
+
+def _fold_history(old, asin, aggregates, price_data, labels, source):
+    """Find the points of a saved product's history that are new or changed
+
+    `old` maps ts -> (price, source) for the product's stored points from
+    labels[0] on, and is updated with the writes. The writes are folded into
+    the product's current aggregates instead of rescanning its price_points.
+    Returns (aggregates, recompute, writes): the price_points rows to upsert,
+    and recompute is True when the fold can't be done exactly (the lowest
+    price went up, the highest came down, or points newer than this history
+    exist) and _RECOMPUTE_AGGREGATES_SQL must run for the product.
+    """
+    if len(price_data) == 0:
+        return aggregates, False, []
+    writes = [(asin, label, price, source) for label, price in zip(labels, price_data)
+              if old.get(label) != (price, source)]
+    if not writes:
+        return aggregates, False, []
+
+    (count, total, squares, low, low_at, high, high_at,
+     last_point, last_point_at, last_change_at) = aggregates
+    recompute = False
+    for _, label, price, _ in writes:
+        before = old.get(label)
+        if before is None:
+            count += 1
+        elif before[0] == price:
+            continue  # only the source changed
+        else:
+            total -= before[0]
+            squares -= before[0] * before[0]
+            if (before[0] <= low and price > before[0]) or (before[0] >= high and price < before[0]):
+                recompute = True
+        total += price
+        squares += price * price
+        if low is None or price < low or (price == low and label >= low_at):
+            low, low_at = price, label
+        if high is None or price > high or (price == high and label >= high_at):
+            high, high_at = price, label
+
+    if last_point_at and last_point_at > labels[-1]:
+        recompute = True
+    else:
+        last_point, last_point_at = price_data[-1], labels[-1]
+        change = next((labels[i] for i in range(len(price_data) - 1, 0, -1)
+                       if price_data[i] != price_data[i - 1]), None)
+        if change is not None:
+            last_change_at = change
+        elif count == len(price_data):
+            last_change_at = labels[0]  # nothing before this history
+        elif not (old.get(labels[0], (None,))[0] == price_data[0]
+                  and last_change_at and last_change_at <= labels[0]):
+            recompute = True  # the last change is before labels[0] and might have moved
+
+    old.update((label, (price, source)) for _, label, price, _ in writes)
+    return (count, total, squares, low, low_at, high, high_at,
+            last_point, last_point_at, last_change_at), recompute, writes
+
+_UPSERT_PRICE_POINT_SQL = '''
+INSERT INTO price_points (asin, ts, price, source)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(asin, ts) DO UPDATE SET price=excluded.price, source=excluded.source
+WHERE price != excluded.price OR source IS NOT excluded.source
+'''
+
+# Products are written in chunks so a generator of any length stays flat in memory
+SAVE_CHUNK_SIZE = 500
+
+@lru_cache(maxsize=64)
+def _day_labels(end_date, days):
+    """ISO dates for the `days` days ending on end_date, oldest first"""
+    return tuple((end_date - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1))
+
+def _price_point_rows(asin, price_data, end_date, source):
+    """Turn a daily price list ending on end_date into price_points rows"""
+    labels = _day_labels(end_date, len(price_data))
+    return zip(repeat(asin), labels, price_data, repeat(source))
+
+def save_products(products):
+    """Upsert many products in one transaction and return throughput stats
+
+    `products` can be any iterable of product dicts (a generator works and
+    is consumed in chunks, so memory stays flat however many rows it yields).
+    Existing rows keep their category and created_at, like save_product always did.
+    Each product's daily price_data is also upserted into price_points (only
+    the points that are new or changed) and folded into the product's
+    running price aggregates (see get_price_summary).
+    """
+    conn = get_connection()
+    now = datetime.now()
+    now_iso = now.isoformat()
+    today = now.date()
+    products = iter(products)
+    count = 0
+    saved_asins = set()
+
+    start = time.perf_counter()
+    with conn:
+        while True:
+            chunk = list(islice(products, SAVE_CHUNK_SIZE))
+            if not chunk:
+                break
+            count += len(chunk)
+
+            asins = list(dict.fromkeys(product_info['asin'] for product_info in chunk))
+            repeated = set() if len(asins) == len(chunk) else {
+                asin for asin, n in Counter(product_info['asin'] for product_info in chunk).items() if n > 1
+            }
+            placeholders = ','.join('?' * len(asins))
+            saved = {row[0]: tuple(row[1:]) for row in conn.execute(
+                f"SELECT asin, {', '.join(_AGGREGATE_NAMES)} FROM products WHERE asin IN ({placeholders})", asins
+            )}
+
+            # The stored points of the saved products, over the longest
+            # history in the chunk, in one read
+            windows = {asin: {} for asin in asins}
+            if saved:
+                since = _day_labels(today, max(len(product_info['price_data']) for product_info in chunk) or 1)[0]
+                placeholders = ','.join('?' * len(saved))
+                for asin, ts, price, point_source in conn.execute(
+                        f"SELECT asin, ts, price, source FROM price_points WHERE asin IN ({placeholders}) AND ts >= ?",
+                        list(saved) + [since]):
+                    windows[asin][ts] = (price, point_source)
+
+            # Only new and changed points are written, and folded into the
+            # product's running aggregates without rereading its history
+            rows = []
+            points = []
+            recompute = set()
+            for product_info in chunk:
+                asin = product_info['asin']
+                price_data = product_info['price_data']
+                if isinstance(price_data, np.ndarray):
+                    price_data = price_list(price_data)  # e.g. a PriceHistories.row()
+                labels = _day_labels(today, len(price_data))
+                source = product_info.get('source') or ('demo' if product_info.get('demo') else 'amazon')
+                if asin in saved:
+                    aggregates, stale, writes = _fold_history(windows[asin], asin, saved[asin],
+                                                              price_data, labels, source)
+                    points.extend(writes)
+                    if stale:
+                        recompute.add(asin)
+                else:
+                    points.extend(_price_point_rows(asin, price_data, today, source))
+                    aggregates = _history_aggregates(price_data, labels)
+                    if asin in repeated:  # its next save in this chunk folds into these points
+                        windows[asin].update(zip(labels, zip(price_data, repeat(source))))
+                saved[asin] = aggregates
+                rows.append((
+                    asin,
+                    product_info['title'],
+                    product_info['current_price'],
+                    product_info['peak_price'],
+                    product_info['lowest_price'],
+                    encode_price_data(price_data),
+                    product_info.get('category', 'unknown'),
+                    now_iso,
+                    now_iso
+                ) + aggregates)
+
+            conn.executemany(_UPSERT_PRICE_POINT_SQL, points)
+            conn.executemany(_UPSERT_PRODUCT_SQL, rows)
+            for asin in recompute:
+                conn.execute(_RECOMPUTE_AGGREGATES_SQL.format(where='asin = ?'), (asin,))
+
+            # Remember what to invalidate, unless it's more than the cache can hold
+            if saved_asins is not None:
+                saved_asins.update(product_info['asin'] for product_info in chunk)
+                if len(saved_asins) > PRODUCT_CACHE.maxsize:
+                    saved_asins = None
+    elapsed = time.perf_counter() - start
+
+    # Invalidate after commit. A reader that loaded the old row before the
+    # commit took its cache generation before this bumps it, so its set is dropped
+    if saved_asins is None:
+        PRODUCT_CACHE.clear()
+    else:
+        for asin in saved_asins:
+            PRODUCT_CACHE.invalidate((DB_PATH, asin))
+
+    return {
+        'rows': count,
+        'seconds': elapsed,
+        'rows_per_sec': count / elapsed if elapsed > 0 else float(count)
+    }
+
+def save_product(product_info):
+    """Save product information to database"""
+    save_products([product_info])
     
     return True
 
+def _cached_product(asin):
+    """A product as _load_product returns it, read through PRODUCT_CACHE"""
+    key = (DB_PATH, asin)
+    product = PRODUCT_CACHE.get(key)
+    if product is MISSING:
+        # A save that commits while we read invalidates after its commit,
+        # which bumps the generation, so a row read before it isn't cached
+        generation = PRODUCT_CACHE.generation()
+        product = _load_product(asin)
+        PRODUCT_CACHE.set(key, product, generation=generation)
+    return product
+
 def get_product(asin):
-    """Retrieve product information from database"""
-    conn = sqlite3.connect(DB_PATH)
+    """Retrieve product information from database (cached, see PRODUCT_CACHE)"""
+    product = _cached_product(asin)
+
+    if product is None:
+        return None
+
+    # Callers may modify what they get back, so never hand out the cached objects
+    return {**product, 'price_data': price_list(product['price_data'])}
+
+def get_price_array(asin):
+    """A product's price_data as a read-only NumPy array, or None (cached like get_product)
+
+    Skips building a list of Python floats, so it's the cheap way to read a
+    history for plotting or number crunching.
+    """
+    product = _cached_product(asin)
+    return product['price_data'] if product else None
+
+def _load_product(asin):
+    """Read a product row and decode its price history"""
+    conn = get_connection()
     c = conn.cursor()
     
     c.execute('''
-    SELECT asin, title, current_price, peak_price, lowest_price, price_data, category
+    SELECT asin, title, current_price, peak_price, lowest_price, price_data, category, updated_at
     FROM products WHERE asin=?
     ''', (asin,))
     
     result = c.fetchone()
-    conn.close()
     
     if not result:
         return None
     
-    asin, title, current_price, peak_price, lowest_price, price_data_json, category = result
-    price_data = json.loads(price_data_json)
+    asin, title, current_price, peak_price, lowest_price, price_data, category, updated_at = result
+    price_data = decode_price_data(price_data)
     
     return {
         'asin': asin,
@@ -169,12 +726,305 @@ def get_product(asin):
         'lowest_price': lowest_price,
         'price_data': price_data,
         'category': category,
+        'updated_at': updated_at,
         'demo': False  # Coming from DB, not generated
     }
 
+def get_product_summary(asin):
+    """Retrieve a product's headline prices without decoding its price history"""
+    conn = get_connection()
+    c = conn.cursor()
+
+    c.execute('''
+    SELECT asin, title, current_price, peak_price, lowest_price, category, updated_at
+    FROM products WHERE asin=?
+    ''', (asin,))
+
+    result = c.fetchone()
+
+    if not result:
+        return None
+
+    asin, title, current_price, peak_price, lowest_price, category, updated_at = result
+
+    return {
+        'asin': asin,
+        'title': title,
+        'current_price': current_price,
+        'peak_price': peak_price,
+        'lowest_price': lowest_price,
+        'category': category,
+        'updated_at': updated_at
+    }
+
+def get_short_links(codes):
+    """Return {code: (asin or None, resolved_at)} for the codes already resolved"""
+    codes = list(dict.fromkeys(codes))
+    conn = get_connection()
+    found = {}
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(codes), SAVE_CHUNK_SIZE):
+        chunk = codes[start:start + SAVE_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        for code, asin, resolved_at in conn.execute(
+                f"SELECT code, asin, resolved_at FROM short_links WHERE code IN ({placeholders})", chunk):
+            found[code] = (asin, resolved_at)
+    return found
+
+def save_short_links(mappings):
+    """Record {code: asin or None} resolutions, None meaning the code didn't resolve"""
+    now = datetime.now().isoformat()
+    conn = get_connection()
+    with conn:
+        conn.executemany('''
+        INSERT INTO short_links (code, asin, resolved_at) VALUES (?, ?, ?)
+        ON CONFLICT(code) DO UPDATE SET asin=excluded.asin, resolved_at=excluded.resolved_at
+        ''', ((code, asin, now) for code, asin in mappings.items()))
+
+def get_refresh_candidates(recent_days=7):
+    """Return the products worth keeping fresh: favorites and recently searched ASINs
+
+    One dict per ASIN with 'asin', 'title' and 'updated_at' (both None if the
+    product was never saved), 'favorites' (how many times it's favorited) and
+    'searches' (lookups in the last `recent_days` days).
+    """
+    conn = get_connection()
+    since = (datetime.now() - timedelta(days=recent_days)).isoformat()
+    candidates = {}
+
+    for asin, count in conn.execute(
+            "SELECT asin, COUNT(*) FROM favorites WHERE asin IS NOT NULL GROUP BY asin"):
+        candidates[asin] = {'asin': asin, 'title': None, 'updated_at': None, 'favorites': count, 'searches': 0}
+
+    # Only the recent window is read; left to itself SQLite walks all of idx_search_history_asin
+    for asin, count in conn.execute(
+            "SELECT asin, COUNT(*) FROM search_history INDEXED BY idx_search_history_date "
+            "WHERE search_date >= ? AND asin IS NOT NULL GROUP BY asin",
+            (since,)):
+        candidate = candidates.setdefault(
+            asin, {'asin': asin, 'title': None, 'updated_at': None, 'favorites': 0, 'searches': 0})
+        candidate['searches'] = count
+
+    # Stay under SQLite's bound-parameter limit
+    asins = list(candidates)
+    for start in range(0, len(asins), SAVE_CHUNK_SIZE):
+        chunk = asins[start:start + SAVE_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        for asin, title, updated_at in conn.execute(
+                f"SELECT asin, title, updated_at FROM products WHERE asin IN ({placeholders})", chunk):
+            candidates[asin]['title'] = title
+            candidates[asin]['updated_at'] = updated_at
+
+    return list(candidates.values())
+
+def _days_ago(days):
+    """ISO date `days` days before today, for price_points range filters"""
+    return (datetime.now().date() - timedelta(days=days)).isoformat()
+
+def get_price_history(asin, start=None, end=None):
+    """Get (date, price) points for a product, optionally within a date range
+
+    start and end are inclusive ISO dates ('YYYY-MM-DD').
+    """
+    conn = get_connection()
+    c = conn.cursor()
+
+    c.execute('''
+    SELECT ts, price
+    FROM price_points
+    WHERE asin=? AND ts >= ? AND ts <= ?
+    ORDER BY ts
+    ''', (asin, start or '', end or '9999-12-31'))
+
+    return c.fetchall()
+
+def get_recent_prices(asin, days=30):
+    """Get the (date, price) points from the last N days"""
+    return get_price_history(asin, start=_days_ago(days))
+
+def get_price_stats(asin, days=None):
+    """Get min/max/average price for a product, over the last N days if given"""
+    conn = get_connection()
+    c = conn.cursor()
+
+    c.execute('''
+    SELECT MIN(price), MAX(price), AVG(price), COUNT(*), MIN(ts), MAX(ts)
+    FROM price_points
+    WHERE asin=? AND ts >= ?
+    ''', (asin, _days_ago(days) if days is not None else ''))
+
+    min_price, max_price, avg_price, count, first_date, last_date = c.fetchone()
+
+    if not count:
+        return None
+
+    return {
+        'min_price': min_price,
+        'max_price': max_price,
+        'avg_price': avg_price,
+        'count': count,
+        'first_date': first_date,
+        'last_date': last_date
+    }
+
+def get_top_deals(k=10, category=None):
+    """The k saved products with the biggest girl math savings, biggest first
+
+    Reads the top of the deal_savings index (per category when one is
+    given), so it costs k rows however many products are saved. Only
+    products priced below their peak are included. Each deal has the
+    product's headline prices plus 'savings', what
+    utils.girl_math_logic would report for it.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+
+    if category is None:
+        c.execute('''
+        SELECT asin, title, category, current_price, peak_price, lowest_price, deal_savings
+        FROM products
+        WHERE deal_savings > 0
+        ORDER BY deal_savings DESC LIMIT ?
+        ''', (k,))
+    else:
+        c.execute('''
+        SELECT asin, title, category, current_price, peak_price, lowest_price, deal_savings
+        FROM products
+        WHERE category = ? AND deal_savings > 0
+        ORDER BY deal_savings DESC LIMIT ?
+        ''', (category, k))
+
+    return [
+        {
+            'asin': asin,
+            'title': title,
+            'category': category,
+            'current_price': current_price,
+            'peak_price': peak_price,
+            'lowest_price': lowest_price,
+            'savings': savings
+        }
+        for asin, title, category, current_price, peak_price, lowest_price, savings in c.fetchall()
+    ]
+
+def get_price_summary(asin):
+    """Count, mean, volatility and extremes of a product's whole price history
+
+    Read from the aggregate columns save_products() keeps on the products
+    row, so it costs one primary-key lookup however long the history is.
+    'stddev' is the population standard deviation of the points and
+    'volatility' that relative to the mean. Returns None for a product
+    without price points.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+
+    c.execute(f"SELECT {', '.join(_AGGREGATE_NAMES)} FROM products WHERE asin=?", (asin,))
+    result = c.fetchone()
+
+    if not result or not result[0]:
+        return None
+
+    (count, total, squares, min_price, min_date, max_price, max_date,
+     last_price, last_date, last_change) = result
+    mean = total / count
+    # Clamp the rounding error of sumsq/n - mean^2 on flat histories
+    stddev = max(squares / count - mean * mean, 0.0) ** 0.5
+
+    return {
+        'count': count,
+        'avg_price': mean,
+        'stddev': stddev,
+        'volatility': stddev / mean if mean else 0.0,
+        'min_price': min_price,
+        'min_date': min_date,
+        'max_price': max_price,
+        'max_date': max_date,
+        'last_price': last_price,
+        'last_date': last_date,
+        'last_change_date': last_change,
+        'days_since_low': (datetime.now().date() - datetime.fromisoformat(min_date).date()).days
+    }
+
+def _copy_json_price_history(conn, aggregates=False):
+    """Copy JSON price_data into price_points for products that have no points yet
+
+    With aggregates=True each migrated product's aggregate columns are
+    recomputed too (migrations before _migration_price_aggregates don't have them).
+    """
+    c = conn.cursor()
+
+    c.execute('''
+    SELECT asin, price_data, COALESCE(updated_at, created_at)
+    FROM products p
+    WHERE price_data IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM price_points pp WHERE pp.asin = p.asin)
+    ''')
+
+    migrated = 0
+    for asin, price_data, stamp in c.fetchall():
+        try:
+            price_data = price_list(decode_price_data(price_data))
+        except ValueError:
+            continue
+        end_date = datetime.fromisoformat(stamp).date() if stamp else datetime.now().date()
+        conn.executemany(_UPSERT_PRICE_POINT_SQL, _price_point_rows(
+            asin, price_data, end_date, 'migrated'
+        ))
+        migrated += 1
+        if aggregates:
+            conn.execute(_RECOMPUTE_AGGREGATES_SQL.format(where='asin = ?'), (asin,))
+
+    return migrated
+
+def migrate_price_history():
+    """Copy JSON price_data into price_points for products that have no points yet
+
+    Each JSON list is treated as daily prices ending on the product's
+    updated_at date, and the product's price aggregates are recomputed.
+    init_db() does this once; call it again after loading rows that
+    bypassed save_products. Returns the number of products migrated.
+    """
+    conn = get_connection()
+    with conn:
+        return _copy_json_price_history(conn, aggregates=True)
+
+def convert_price_data(fmt=None, batch_size=SAVE_CHUNK_SIZE):
+    """Rewrite every product's price_data in another format (default PRICE_DATA_FORMAT)
+
+    The migration tool for PRICE_DATA_FORMAT: each row is read in whatever
+    format it's in and written back in `fmt`, batch_size rows per
+    transaction, walking the primary key so memory stays flat. Safe to run
+    again. Returns the number of rows converted; VACUUM afterwards to give
+    the space back to the filesystem.
+    """
+    fmt = fmt or PRICE_DATA_FORMAT
+    encode_price_data([], fmt)  # fail on an unknown format before touching anything
+    conn = get_connection()
+    converted = 0
+    last_asin = ''
+    while True:
+        rows = conn.execute('''
+        SELECT asin, price_data FROM products
+        WHERE asin > ? AND price_data IS NOT NULL
+        ORDER BY asin LIMIT ?
+        ''', (last_asin, batch_size)).fetchall()
+        if not rows:
+            break
+        with conn:
+            conn.executemany("UPDATE products SET price_data=? WHERE asin=?", (
+                (encode_price_data(price_list(decode_price_data(price_data)), fmt), asin)
+                for asin, price_data in rows
+            ))
+        converted += len(rows)
+        last_asin = rows[-1][0]
+
+    PRODUCT_CACHE.clear()
+    return converted
+
 def add_search_history(asin=None, url=None, search_term=None):
     """Add entry to search history"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     now = datetime.now().isoformat()
@@ -185,13 +1035,12 @@ def add_search_history(asin=None, url=None, search_term=None):
     ''', (asin, url, search_term, now))
     
     conn.commit()
-    conn.close()
     
     return True
 
 def get_recent_searches(limit=10):
     """Get recent searches from the database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     c.execute('''
@@ -203,7 +1052,6 @@ def get_recent_searches(limit=10):
     ''', (limit,))
     
     results = c.fetchall()
-    conn.close()
     
     searches = []
     for row in results:
@@ -219,48 +1067,48 @@ def get_recent_searches(limit=10):
     
     return searches
 
-def toggle_favorite(asin, notes=None):
-    """Add or remove an item from favorites"""
-    conn = sqlite3.connect(DB_PATH)
+def toggle_favorite(asin, notes=None, user_id=None):
+    """Add or remove an item from a user's favorites (user_id None is the shared, signed-out list)"""
+    conn = get_connection()
     c = conn.cursor()
     
     # Check if already in favorites
-    c.execute("SELECT id FROM favorites WHERE asin=?", (asin,))
+    c.execute("SELECT id FROM favorites WHERE user_id IS ? AND asin=?", (user_id, asin))
     existing = c.fetchone()
     
     now = datetime.now().isoformat()
     
     if existing:
         # Remove from favorites
-        c.execute("DELETE FROM favorites WHERE asin=?", (asin,))
+        c.execute("DELETE FROM favorites WHERE user_id IS ? AND asin=?", (user_id, asin))
         is_favorite = False
     else:
         # Add to favorites
         c.execute('''
-        INSERT INTO favorites (asin, added_at, notes)
-        VALUES (?, ?, ?)
-        ''', (asin, now, notes))
+        INSERT INTO favorites (asin, added_at, notes, user_id)
+        VALUES (?, ?, ?, ?)
+        ''', (asin, now, notes, user_id))
         is_favorite = True
     
     conn.commit()
-    conn.close()
+    FAVORITE_CACHE.invalidate((DB_PATH, asin, user_id))
     
     return is_favorite
 
-def get_favorites():
-    """Get all favorite products"""
-    conn = sqlite3.connect(DB_PATH)
+def get_favorites(user_id=None):
+    """Get a user's favorite products (user_id None is the shared, signed-out list)"""
+    conn = get_connection()
     c = conn.cursor()
     
     c.execute('''
     SELECT f.asin, f.added_at, f.notes, p.title, p.current_price
     FROM favorites f
     JOIN products p ON f.asin = p.asin
+    WHERE f.user_id IS ?
     ORDER BY f.added_at DESC
-    ''')
+    ''', (user_id,))
     
     results = c.fetchall()
-    conn.close()
     
     favorites = []
     for row in results:
@@ -275,22 +1123,159 @@ def get_favorites():
     
     return favorites
 
-def is_favorite(asin):
-    """Check if a product is in favorites"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def is_favorite(asin, user_id=None):
+    """Check if a product is in a user's favorites (cached, see FAVORITE_CACHE)"""
+    key = (DB_PATH, asin, user_id)
+    cached = FAVORITE_CACHE.get(key)
+    if cached is not MISSING:
+        return cached
     
-    c.execute("SELECT id FROM favorites WHERE asin=?", (asin,))
-    result = c.fetchone()
+    generation = FAVORITE_CACHE.generation()
+    conn = get_connection()
+    c = conn.cursor()
     
-    conn.close()
+    c.execute("SELECT id FROM favorites WHERE user_id IS ? AND asin=?", (user_id, asin))
+    result = bool(c.fetchone())
     
-    return bool(result)
+    FAVORITE_CACHE.set(key, result, generation=generation)
+    return result
+
+# Price alert functions
+def set_price_alert(user_id, asin, target_price):
+    """Alert a user when a favorite drops to target_price or below
+
+    Alerts are on the user's favorites: the product is favorited for the
+    user if it isn't already, and unfavoriting it (toggle_favorite with the
+    same user_id) silences the alert.
+    Setting an alert again changes the target and re-arms it.
+    """
+    conn = get_connection()
+    now = datetime.now().isoformat()
+    with conn:
+        if not conn.execute("SELECT 1 FROM favorites WHERE user_id=? AND asin=?", (user_id, asin)).fetchone():
+            conn.execute('''
+            INSERT INTO favorites (asin, added_at, user_id)
+            VALUES (?, ?, ?)
+            ''', (asin, now, user_id))
+        conn.execute('''
+        INSERT INTO price_alerts (asin, user_id, target_price, created_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(asin, user_id) DO UPDATE SET
+            target_price=excluded.target_price,
+            notified_price=NULL,
+            notified_at=NULL
+        ''', (asin, user_id, target_price, now))
+    FAVORITE_CACHE.invalidate((DB_PATH, asin, user_id))
+    return True
+
+def remove_price_alert(user_id, asin):
+    """Delete a user's alert on a product; True if there was one"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("DELETE FROM price_alerts WHERE asin=? AND user_id=?", (asin, user_id))
+    return cursor.rowcount > 0
+
+def get_price_alerts(user_id):
+    """A user's alerts with each product's title and current price"""
+    conn = get_connection()
+    c = conn.cursor()
+
+    c.execute('''
+    SELECT a.asin, p.title, p.current_price, a.target_price, a.created_at, a.notified_price, a.notified_at
+    FROM price_alerts a
+    LEFT JOIN products p ON p.asin = a.asin
+    WHERE a.user_id=?
+    ORDER BY a.created_at DESC
+    ''', (user_id,))
+
+    return [
+        {
+            'asin': asin,
+            'title': title,
+            'current_price': current_price,
+            'target_price': target_price,
+            'created_at': created_at,
+            'notified_price': notified_price,
+            'notified_at': notified_at
+        }
+        for asin, title, current_price, target_price, created_at, notified_price, notified_at in c.fetchall()
+    ]
+
+def get_triggered_alerts(asins, tiers):
+    """Alerts on the given products that should fire now, in one join per chunk
+
+    An alert fires when the product's current price is at or below its
+    target and below the price it last fired at, the product is still one
+    of the user's favorites, and the user has an email and is on one of
+    `tiers`. Only the alerts of `asins` are read (through the price_alerts
+    primary key), so the cost follows how many products changed, not how
+    many users or alerts there are.
+    """
+    asins = list(dict.fromkeys(asins))
+    tiers = list(tiers)
+    if not tiers:
+        return []
+    tier_placeholders = ','.join('?' * len(tiers))
+    conn = get_connection()
+    triggered = []
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(asins), SAVE_CHUNK_SIZE):
+        chunk = asins[start:start + SAVE_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(f'''
+        SELECT a.asin, a.user_id, u.username, u.email, p.title, p.current_price, a.target_price
+        FROM price_alerts a
+        JOIN products p ON p.asin = a.asin
+        JOIN users u ON u.id = a.user_id
+        WHERE a.asin IN ({placeholders})
+        AND p.current_price <= a.target_price
+        AND (a.notified_price IS NULL OR p.current_price < a.notified_price)
+        AND u.tier IN ({tier_placeholders})
+        AND u.email IS NOT NULL AND u.email != ''
+        AND EXISTS (SELECT 1 FROM favorites f WHERE f.user_id = a.user_id AND f.asin = a.asin)
+        ''', chunk + tiers):
+            asin, user_id, username, email, title, current_price, target_price = row
+            triggered.append({
+                'asin': asin,
+                'user_id': user_id,
+                'username': username,
+                'email': email,
+                'title': title,
+                'current_price': current_price,
+                'target_price': target_price
+            })
+    return triggered
+
+def mark_alerts_notified(alerts):
+    """Record that alerts fired, at the price in each alert's 'current_price'"""
+    now = datetime.now().isoformat()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE price_alerts SET notified_price=?, notified_at=? WHERE asin=? AND user_id=?",
+            ((alert['current_price'], now, alert['asin'], alert['user_id']) for alert in alerts)
+        )
+
+def rearm_price_alerts(asins):
+    """Re-arm the fired alerts on these products whose price went back above target"""
+    asins = list(dict.fromkeys(asins))
+    conn = get_connection()
+    rearmed = 0
+    with conn:
+        for start in range(0, len(asins), SAVE_CHUNK_SIZE):
+            chunk = asins[start:start + SAVE_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            rearmed += conn.execute(f'''
+            UPDATE price_alerts SET notified_price=NULL, notified_at=NULL
+            WHERE asin IN ({placeholders}) AND notified_price IS NOT NULL
+            AND target_price < (SELECT current_price FROM products p WHERE p.asin = price_alerts.asin)
+            ''', chunk).rowcount
+    return rearmed
 
 # User account functions
 def create_user(username, password, email=None, tier="free"):
     """Create a new user account"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     now = datetime.now().isoformat()
@@ -303,17 +1288,16 @@ def create_user(username, password, email=None, tier="free"):
         
         conn.commit()
         user_id = c.lastrowid
-        conn.close()
         
         return user_id
     except sqlite3.IntegrityError:
         # Username already exists
-        conn.close()
+        conn.rollback()
         return None
 
 def check_login(username, password):
     """Verify login credentials and return user info"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     c.execute('''
@@ -341,12 +1325,11 @@ def check_login(username, password):
     else:
         user_info = None
     
-    conn.close()
     return user_info
 
 def verify_coupon(coupon_code):
     """Verify coupon code and return tier if valid"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     c.execute('''
@@ -356,7 +1339,6 @@ def verify_coupon(coupon_code):
     ''', (coupon_code,))
     
     result = c.fetchone()
-    conn.close()
     
     if not result:
         return None  # Coupon doesn't exist
@@ -376,7 +1358,7 @@ def apply_coupon(coupon_code, user_id):
     if not tier or tier is False:
         return False
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     # Mark coupon as used
@@ -390,10 +1372,12 @@ def apply_coupon(coupon_code, user_id):
     ''', (tier, user_id))
     
     conn.commit()
-    conn.close()
     
     return tier
 
+# Every tier get_user_tier_features() knows, cheapest first
+USER_TIERS = ('free', 'besties', 'platinum')
+
 def get_user_tier_features(tier):
     """Get features available for a specific tier"""
     tier_features = {
@@ -411,6 +1395,7 @@ def get_user_tier_features(tier):
             "access_to_walmart_prices": True,
             "access_to_target_prices": False,
             "purchase_recommendations": False,
+            "price_alerts": False,
             "background": "#FFD1DC"
         },
         # Middle tier - "Clueless Besties"
@@ -429,6 +1414,7 @@ def get_user_tier_features(tier):
             "access_to_walmart_prices": True,
             "access_to_target_prices": True,
             "purchase_recommendations": False,
+            "price_alerts": True,
             "background": "#FFB6C1"
         },
         # Top tier - "Mean Girls Platinum"
@@ -448,11 +1434,9 @@ def get_user_tier_features(tier):
             "access_to_walmart_prices": True,
             "access_to_target_prices": True,
             "purchase_recommendations": True,
+            "price_alerts": True,
             "background": "#FF69B4"
         }
     }
     
-    return tier_features.get(tier, tier_features["free"])
-
-# Initialize the database when the module is imported
-init_db()
\ No newline at end of file
+    return tier_features.get(tier, tier_features["free"])
\ No newline at end of file
@@ -0,0 +1,293 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from circuit import CircuitBreaker
+
+# Shared client settings; change them with configure()
+HTTP_CONFIG = {
+    'pool_connections': 10,    # hosts with their own keep-alive pool
+    'pool_maxsize': 20,        # keep-alive connections kept per host
+    'retries': 2,              # extra attempts on a retryable status (429/5xx)
+    'backoff_factor': 0.5,     # sleeps 0.5s, 1s, ... between retries (Retry-After wins)
+    'max_retry_after': 5.0,    # longest Retry-After honoured; longer waits are cut to this
+    'status_forcelist': (429, 500, 502, 503, 504),
+    'timeout': 10,             # default seconds when a caller doesn't pass one
+    'breaker_failures': 3,     # failed requests in a row that open a host's circuit breaker
+    'breaker_reset': 30,       # seconds an open breaker waits before a half-open probe
+    'adaptive_timeout': True,  # shrink timeouts to what the host actually needs (see adaptive_timeout())
+    'timeout_p95_factor': 3.0, # adaptive timeout = this many times the host's p95 of successful requests...
+    'min_timeout': 2.0,        # ...but never below this...
+    'adaptive_min_samples': 20,  # ...and only once this many successes have been seen
+}
+
+# Latency samples kept per host for the percentile stats
+STATS_WINDOW = 500
+
+# Bot-check pages come back as 200s; they count as failures for the breaker
+BLOCK_MARKERS = (b'/errors/validateCaptcha', b'px-captcha')
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_host_stats = {}
+_breakers = {}
+_breaker_lock = threading.Lock()
+_transitions = {}  # (host, old state, new state) -> count
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """A request was skipped because its host's circuit breaker is open"""
+
+
+class CappedRetry(Retry):
+    """Retry that honours Retry-After only up to HTTP_CONFIG['max_retry_after']
+
+    urllib3 sleeps for whatever the server asks, outside every timeout, so a
+    `Retry-After: 600` would hold the thread for ten minutes. Hosts that need
+    longer than the cap are left to the circuit breaker.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, HTTP_CONFIG['max_retry_after'])
+
+
+def _build_session():
+    """Create a requests.Session with pooled, retrying adapters"""
+    retry = CappedRetry(
+        total=HTTP_CONFIG['retries'],
+        status=HTTP_CONFIG['retries'],
+        connect=1,  # one immediate retry covers a keep-alive socket the server dropped
+        read=0,     # a read timeout already cost the full timeout, don't double it
+        backoff_factor=HTTP_CONFIG['backoff_factor'],
+        status_forcelist=HTTP_CONFIG['status_forcelist'],
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # hand back the last response so callers can check status_code
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_CONFIG['pool_connections'],
+        pool_maxsize=HTTP_CONFIG['pool_maxsize'],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def configure(**options):
+    """Update HTTP_CONFIG and rebuild the shared session with the new settings"""
+    global _session
+    unknown = set(options) - set(HTTP_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown HTTP options: {', '.join(sorted(unknown))}")
+    with _session_lock:
+        HTTP_CONFIG.update(options)
+        old_session, _session = _session, None
+    # Breakers pick up the new thresholds when they're next created
+    with _breaker_lock:
+        _breakers.clear()
+    if old_session is not None:
+        old_session.close()
+
+
+def _record(host, elapsed, error):
+    """Add one request's latency to the per-host stats"""
+    with _stats_lock:
+        stats = _host_stats.get(host)
+        if stats is None:
+            stats = _host_stats[host] = {
+                'requests': 0,
+                'errors': 0,
+                'total_seconds': 0.0,
+                'samples': deque(maxlen=STATS_WINDOW),
+                'ok_samples': deque(maxlen=STATS_WINDOW),
+            }
+        stats['requests'] += 1
+        stats['errors'] += int(error)
+        stats['total_seconds'] += elapsed
+        stats['samples'].append(elapsed)
+        if not error:
+            stats['ok_samples'].append(elapsed)
+
+
+def is_blocked_page(response):
+    """True for captcha/robot-check pages served in place of the real one"""
+    if '/blocked' in (getattr(response, 'url', '') or ''):
+        return True
+    head = response.content[:256 * 1024]
+    return any(marker in head for marker in BLOCK_MARKERS)
+
+
+def _count_transition(host, old, new):
+    with _breaker_lock:
+        key = (host, old, new)
+        _transitions[key] = _transitions.get(key, 0) + 1
+
+
+def get_breaker(host):
+    """The circuit breaker for a host, created on first use from HTTP_CONFIG"""
+    with _breaker_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(
+                failure_threshold=HTTP_CONFIG['breaker_failures'],
+                reset_after=HTTP_CONFIG['breaker_reset'],
+                on_transition=lambda old, new: _count_transition(host, old, new),
+            )
+        return breaker
+
+
+def report_outcome(url, ok):
+    """Tell a host's breaker how a streamed request went
+
+    request(stream=True) can't see the body, so a 200 streamed response
+    leaves the verdict to the caller once it has read enough (see
+    response_cache.cached_stream, which reports captcha pages as failures).
+    """
+    breaker = get_breaker(urlsplit(url).hostname or '')
+    if ok:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+def adaptive_timeout(host, timeout):
+    """The timeout to use for a host: the caller's, cut down to what the host needs
+
+    Once a host has adaptive_min_samples successful requests, the timeout is
+    timeout_p95_factor times their p95 latency (at least min_timeout), so a
+    host that has gone slow or silent fails fast instead of holding every
+    lookup for the full timeout. The caller's timeout is always the upper
+    bound; (connect, read) tuples are left alone.
+    """
+    if not HTTP_CONFIG['adaptive_timeout'] or isinstance(timeout, tuple):
+        return timeout
+    with _stats_lock:
+        stats = _host_stats.get(host)
+        samples = sorted(stats['ok_samples']) if stats else []
+    if len(samples) < HTTP_CONFIG['adaptive_min_samples']:
+        return timeout
+    adapted = max(HTTP_CONFIG['min_timeout'], _percentile(samples, 0.95) * HTTP_CONFIG['timeout_p95_factor'])
+    return min(timeout, adapted)
+
+
+def request(method, url, headers=None, timeout=None, **kwargs):
+    """Send a request through the shared session and record its latency
+
+    Errors (including a final 429/5xx after retries) count against the host.
+    Network errors, 429/5xx and captcha pages also count against the host's
+    circuit breaker; while it's open, requests raise CircuitOpenError at once
+    instead of waiting out a timeout. The timeout itself adapts to the host's
+    observed latency (see adaptive_timeout()).
+    """
+    host = urlsplit(url).hostname or ''
+    if timeout is None:
+        timeout = HTTP_CONFIG['timeout']
+
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit breaker open for {host}")
+
+    start = time.perf_counter()
+    try:
+        response = get_session().request(method, url, headers=headers, timeout=adaptive_timeout(host, timeout),
+                                         **kwargs)
+    except requests.RequestException:
+        _record(host, time.perf_counter() - start, error=True)
+        breaker.record_failure()
+        raise
+
+    _record(host, time.perf_counter() - start, error=response.status_code >= 400)
+    if response.status_code in HTTP_CONFIG['status_forcelist']:
+        breaker.record_failure()
+    elif kwargs.get('stream') and response.status_code == 200:
+        pass  # the caller reports once it has seen the body (see report_outcome())
+    elif response.status_code == 200 and is_blocked_page(response):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def get(url, headers=None, timeout=None, **kwargs):
+    """GET through the shared session"""
+    return request('GET', url, headers=headers, timeout=timeout, **kwargs)
+
+
+def head(url, headers=None, timeout=None, **kwargs):
+    """HEAD through the shared session"""
+    return request('HEAD', url, headers=headers, timeout=timeout, **kwargs)
+
+
+def _percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))
+    return sorted_samples[index]
+
+
+def get_host_stats():
+    """Return request counts and latency (ms) per host"""
+    with _stats_lock:
+        snapshot = {host: dict(stats, samples=sorted(stats['samples'])) for host, stats in _host_stats.items()}
+
+    report = {}
+    for host, stats in snapshot.items():
+        samples = stats['samples']
+        report[host] = {
+            'requests': stats['requests'],
+            'errors': stats['errors'],
+            'mean_ms': stats['total_seconds'] / stats['requests'] * 1000,
+            'p50_ms': _percentile(samples, 0.50) * 1000,
+            'p95_ms': _percentile(samples, 0.95) * 1000,
+            'max_ms': samples[-1] * 1000,
+        }
+    return report
+
+
+def reset_host_stats():
+    """Forget all recorded latencies"""
+    with _stats_lock:
+        _host_stats.clear()
+
+
+def get_breaker_stats():
+    """Return each host's breaker state, counters, current timeout and state transitions"""
+    with _breaker_lock:
+        breakers = dict(_breakers)
+        transitions = dict(_transitions)
+
+    report = {}
+    for host, breaker in breakers.items():
+        report[host] = dict(
+            breaker.stats(),
+            timeout=adaptive_timeout(host, HTTP_CONFIG['timeout']),
+            transitions={f"{old}->{new}": count for (transition_host, old, new), count in transitions.items()
+                         if transition_host == host},
+        )
+    return report
+
+
+def reset_breakers():
+    """Close and forget every host's breaker and its transition counts"""
+    with _breaker_lock:
+        _breakers.clear()
+        _transitions.clear()
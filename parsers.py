@@ -0,0 +1,531 @@
+import codecs
+import json
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+try:
+    from lxml import etree
+except ImportError:  # optional: the stdlib scanner below gives the same results, just slower
+    etree = None
+
+# Which scanner parse_amazon_product() uses unless told otherwise
+DEFAULT_BACKEND = 'lxml' if etree is not None else 'html.parser'
+
+# Bytes handed to the parser at a time; we check for an early exit between chunks
+FEED_CHUNK_SIZE = 64 * 1024
+
+PRICE_RE = re.compile(r'[\d,]+\.\d+|\d+')
+
+# Selectors in priority order, the same ones the BeautifulSoup code used.
+# The first two title selectors are what the scraper reads, the third is the
+# extra one fetch_amazon_title falls back to.
+AMAZON_TITLE_SELECTORS = ['#productTitle', '.product-title-word-break', 'h1.a-size-large']
+AMAZON_PRICE_SELECTORS = [
+    'span.a-price .a-offscreen',
+    '#priceblock_ourprice',
+    '#priceblock_dealprice',
+    '.a-price .a-offscreen',
+    'span.a-price-whole',
+]
+
+# Walmart search results. The first element matching any card selector is
+# the product we compare against; the rest are read inside that card only.
+WALMART_CARD_SELECTORS = ['div[data-item-id]', '.search-result-gridview-item', '.product-card']
+WALMART_TITLE_SELECTORS = ['[data-automation-id="product-title"]', '.product-title-link', 'a']
+WALMART_PRICE_SELECTORS = [
+    'span[data-automation-id="product-price"]',
+    'span.product-price-container',
+    'span.price-characteristic',
+    '.product-price-container',
+    '.price-group',
+    'div[data-automation-id="product-price"]',
+]
+WALMART_URL_SELECTORS = ['a[href]']
+# Anywhere on the page, for when there are no cards at all
+WALMART_PAGE_PRICE_SELECTORS = [
+    'span[data-automation-id="product-price"]',
+    'span.price-characteristic',
+    'span.price-group',
+    'div.product-price-container span.price',
+    'span.display-price',
+]
+WALMART_BASE_URL = 'https://www.walmart.com'
+
+# Target search results (product cards are marked up with data-test attributes)
+TARGET_CARD_SELECTORS = ['[data-test="@web/site-top-of-funnel/ProductCardWrapper"]', '[data-test="product-card"]']
+TARGET_TITLE_SELECTORS = ['[data-test="product-title"]', 'a']
+TARGET_PRICE_SELECTORS = ['[data-test="current-price"]', '[data-test="product-price"]']
+TARGET_URL_SELECTORS = ['a[href]']
+TARGET_BASE_URL = 'https://www.target.com'
+
+# Elements that never get an end tag
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr',
+])
+
+_PENDING, _OPEN, _DONE = range(3)
+
+
+_COMPOUND_RE = re.compile(r'\[([\w-]+)(?:="([^"]*)")?\]|([#.]?)([\w-]+)')
+
+
+def _compound(text):
+    """Split 'tag#id.class[attr="value"]' into (tag, id, {classes}, ((attr, value or None), ...))"""
+    tag = element_id = None
+    classes = set()
+    attrs = []
+    for attr, value, kind, name in _COMPOUND_RE.findall(text):
+        if attr:
+            attrs.append((attr, value or None))
+        elif kind == '#':
+            element_id = name
+        elif kind == '.':
+            classes.add(name)
+        else:
+            tag = name
+    return tag, element_id, frozenset(classes), tuple(attrs)
+
+
+def _compound_matches(compound, tag, element_id, classes, attrs):
+    want_tag, want_id, want_classes, want_attrs = compound
+    return ((want_tag is None or want_tag == tag)
+            and (want_id is None or want_id == element_id)
+            and want_classes <= classes
+            and all(name in attrs and (value is None or attrs[name] == value) for name, value in want_attrs))
+
+
+class Selector:
+    """The slice of CSS the scrapers use: 'tag#id.class[attr="value"]', optionally after one ancestor compound"""
+
+    def __init__(self, text):
+        self.text = text
+        parts = text.split()
+        self.target = _compound(parts[-1])
+        self.ancestor = _compound(parts[0]) if len(parts) > 1 else None
+
+    def matches(self, tag, element_id, classes, attrs, ancestors):
+        """`ancestors` yields (tag, id, classes, attrs) for each open ancestor, innermost first"""
+        if not _compound_matches(self.target, tag, element_id, classes, attrs):
+            return False
+        if self.ancestor is None:
+            return True
+        return any(_compound_matches(self.ancestor, *ancestor) for ancestor in ancestors)
+
+
+class _FirstMatch:
+    """Text of the first element matching each selector in a priority list
+
+    value() is decided as soon as the highest-priority selector whose first
+    element is acceptable has closed and every selector before it has closed
+    with an unacceptable element. That's the same answer select_one() down
+    the list gives, without reading the rest of the page.
+    """
+
+    def __init__(self, selectors, accept, attr=None):
+        self.selectors = [Selector(text) for text in selectors]
+        self.accept = accept
+        self.attr = attr  # read this attribute instead of the element's text
+        self.state = [_PENDING] * len(self.selectors)
+        self.text = [None] * len(self.selectors)
+
+    def value(self, final=False):
+        """(decided, value). With final=True selectors that never matched count as absent."""
+        for state, text in zip(self.state, self.text):
+            if state == _DONE:
+                accepted = self.accept(text)
+                if accepted is not None:
+                    return True, accepted
+            elif not final:
+                return False, None
+        return True, None
+
+
+def _accept_title(text):
+    return text.strip()
+
+
+def _accept_price(text):
+    match = PRICE_RE.search(text.strip())
+    return float(match.group(0).replace(',', '')) if match else None
+
+
+def _accept_present(text):
+    return text
+
+
+def _accept_text(text):
+    return text.strip() or None
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _PageScan:
+    """Selector bookkeeping shared by the lxml and html.parser backends"""
+
+    def __init__(self, fields):
+        self.fields = fields  # name -> _FirstMatch
+
+    def start(self, tag, element_id, classes, attrs, ancestors):
+        """Return the (field, index) text captures that begin at this element
+
+        Attribute fields are settled right here and never returned.
+        """
+        started = []
+        for name, field in self.fields.items():
+            for index, selector in enumerate(field.selectors):
+                if field.state[index] == _PENDING and selector.matches(tag, element_id, classes, attrs, ancestors()):
+                    if field.attr:
+                        field.state[index] = _DONE
+                        field.text[index] = attrs.get(field.attr)
+                    else:
+                        field.state[index] = _OPEN
+                        started.append((name, index))
+        return started
+
+    def finish(self, captures, text):
+        for name, index in captures:
+            field = self.fields[name]
+            field.state[index] = _DONE
+            field.text[index] = text
+
+    def decided(self):
+        return all(field.value()[0] for field in self.fields.values())
+
+    def result(self):
+        return {name: field.value(final=True)[1] for name, field in self.fields.items()}
+
+
+class _StdlibScanner(HTMLParser):
+    """html.parser backend: keeps only a stack of open tags, never a tree"""
+
+    def __init__(self, scan):
+        super().__init__(convert_charrefs=True)
+        self.scans = [scan]
+        self.stack = []  # (tag, id, classes, attrs, captures started at this element)
+        self.buffers = {}  # (scan, field, index) -> text chunks seen since it started
+
+    def _ancestors(self):
+        return ((tag, element_id, classes, attrs) for tag, element_id, classes, attrs, _ in reversed(self.stack))
+
+    def settled(self):
+        """True once parsing can stop"""
+        return self.scans[0].decided()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        element_id = attrs.get('id')
+        classes = frozenset((attrs.get('class') or '').split())
+        captures = []
+        for scan in self.scans:
+            for name, index in scan.start(tag, element_id, classes, attrs, self._ancestors):
+                capture = (scan, name, index)
+                self.buffers[capture] = []
+                captures.append(capture)
+
+        if tag in VOID_ELEMENTS:
+            self._finish(captures)
+        else:
+            self.stack.append((tag, element_id, classes, attrs, captures))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        for chunks in self.buffers.values():
+            chunks.append(data)
+
+    def handle_endtag(self, tag):
+        # Browsers close whatever was left open inside; stray end tags are ignored
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth][0] == tag:
+                break
+        else:
+            return
+        while len(self.stack) > depth:
+            self._finish(self.stack.pop()[4])
+
+    def _finish(self, captures, stop=True):
+        for capture in captures:
+            scan, name, index = capture
+            scan.finish([(name, index)], ''.join(self.buffers.pop(capture)))
+        if stop and captures and self.settled():
+            raise _StopParsing()
+
+    def close_open(self):
+        """At end of input, close anything still open so its text counts"""
+        while self.stack:
+            self._finish(self.stack.pop()[4], stop=False)
+
+
+def _scan_stdlib(content, encoding, scan):
+    if isinstance(content, bytes):
+        content = content.decode(encoding or 'utf-8', errors='replace')
+
+    scanner = _StdlibScanner(scan)
+    try:
+        for start in range(0, len(content), FEED_CHUNK_SIZE):
+            scanner.feed(content[start:start + FEED_CHUNK_SIZE])
+        scanner.close()
+        scanner.close_open()
+    except _StopParsing:
+        pass
+
+
+def _lxml_ancestors(element):
+    return lambda: ((parent.tag, parent.get('id'), frozenset((parent.get('class') or '').split()), parent.attrib)
+                    for parent in element.iterancestors())
+
+
+def _scan_lxml(content, encoding, scan):
+    parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding if isinstance(content, bytes) else None)
+    capturing = {}  # element -> captures started there
+
+    def handle_events():
+        for event, element in parser.read_events():
+            if not isinstance(element.tag, str):
+                continue
+            if event == 'start':
+                classes = frozenset((element.get('class') or '').split())
+                captures = scan.start(element.tag, element.get('id'), classes, element.attrib,
+                                      _lxml_ancestors(element))
+                if captures:
+                    capturing[element] = captures
+                continue
+
+            captures = capturing.pop(element, None)
+            if captures:
+                scan.finish(captures, ''.join(element.itertext()))
+                if scan.decided():
+                    return True
+            elif not capturing:
+                # Nobody needs this subtree's text any more, so free it as we go
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        return False
+
+    for start in range(0, len(content), FEED_CHUNK_SIZE):
+        parser.feed(content[start:start + FEED_CHUNK_SIZE])
+        if handle_events():
+            return
+    try:
+        parser.close()
+    except etree.LxmlError:
+        return  # empty or hopeless markup: whatever we found so far stands
+    handle_events()
+
+
+_BACKENDS = {
+    'lxml': _scan_lxml,
+    'html.parser': _scan_stdlib,
+}
+
+
+def charset_from_headers(headers):
+    """The charset a Content-Type header declares, or None to let the parser sniff it"""
+    content_type = (headers or {}).get('Content-Type', '')
+    if 'charset=' not in content_type:
+        return None
+    return content_type.split('charset=')[-1].split(';')[0].strip().strip('"') or None
+
+
+def parse_amazon_product(content, encoding=None, title_selectors=AMAZON_TITLE_SELECTORS[:2],
+                         price=True, backend=None):
+    """Pull the title and price out of an Amazon product page without building a soup
+
+    Returns {'title': str or None, 'price': float or None}, the same values
+    select_one() over title_selectors and AMAZON_PRICE_SELECTORS would give:
+    the first selector with a match wins, and for prices the first whose
+    element contains a number. The page is fed to the parser in chunks and
+    parsing stops as soon as the answers are settled, which on a real
+    product page is a fraction of the way down. price=False looks for the
+    title only.
+    """
+    fields = {'title': _FirstMatch(title_selectors, _accept_title)}
+    if price:
+        fields['price'] = _FirstMatch(AMAZON_PRICE_SELECTORS, _accept_price)
+    scan = _PageScan(fields)
+
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'lxml' and etree is None:
+        backend = 'html.parser'
+    _BACKENDS[backend](content, encoding, scan)
+    return scan.result()
+
+
+def _walmart_next_data_item(payload, base_url=WALMART_BASE_URL):
+    """First real product in a __NEXT_DATA__ search payload, as a result dict"""
+    try:
+        stacks = json.loads(payload)['props']['pageProps']['initialData']['searchResult']['itemStacks']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    for stack in stacks or []:
+        for item in (stack or {}).get('items') or []:
+            if not isinstance(item, dict) or not item.get('name'):
+                continue  # ads and placeholders have no name
+            price = item.get('price')
+            if not isinstance(price, (int, float)):
+                price_info = item.get('priceInfo') or {}
+                current = price_info.get('currentPrice') or {}
+                price = current.get('price')
+                if not isinstance(price, (int, float)):
+                    price = _accept_price(price_info.get('linePrice') or current.get('priceString') or '')
+            url = item.get('canonicalUrl')
+            return {
+                'title': item['name'].strip(),
+                'price': float(price) if price is not None else None,
+                'url': urljoin(base_url, url) if url else None,
+            }
+    return None
+
+
+class SearchResultParser(_StdlibScanner):
+    """Incremental search results parser that stops at the first product
+
+    Feed it the page piece by piece with consume(); it returns True as soon
+    as the first product card has closed, or the page's embedded JSON has
+    given us a product, whichever comes first in the page. Nothing after
+    that needs to be downloaded. finish() returns the result.
+
+    Subclasses set the selectors for one retailer's markup.
+    """
+
+    BASE_URL = ''
+    CARD_SELECTORS = []
+    TITLE_SELECTORS = []
+    PRICE_SELECTORS = []
+    URL_SELECTORS = ['a[href]']
+    PAGE_PRICE_SELECTORS = []  # anywhere on the page, for when there are no cards at all
+    EMBEDDED_JSON_SELECTORS = []
+
+    def __init__(self, encoding=None, base_url=None):
+        super().__init__(_PageScan({
+            'price': _FirstMatch(self.PAGE_PRICE_SELECTORS, _accept_price),
+            'embedded': _FirstMatch(self.EMBEDDED_JSON_SELECTORS, _accept_present),
+        }))
+        self.base_url = base_url or self.BASE_URL
+        self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        self._card_selectors = [Selector(text) for text in self.CARD_SELECTORS]
+        self.card = None  # _PageScan over the first card's descendants
+        self._card_depth = None
+        self.card_closed = False
+        self.embedded_item = None
+        self.done = False
+
+    def embedded_result(self, payload):
+        """Result dict for the first product in the page's embedded JSON, or None"""
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        super().handle_starttag(tag, attrs)
+        if self.card is None and tag not in VOID_ELEMENTS:
+            _, element_id, classes, attrs, _ = self.stack[-1]
+            ancestors = self._ancestors
+            if any(selector.matches(tag, element_id, classes, attrs, ancestors()) for selector in self._card_selectors):
+                self.card = _PageScan({
+                    'title': _FirstMatch(self.TITLE_SELECTORS, _accept_text),
+                    'price': _FirstMatch(self.PRICE_SELECTORS, _accept_price),
+                    'url': _FirstMatch(self.URL_SELECTORS, _accept_text, attr='href'),
+                })
+                self.scans.append(self.card)
+                self._card_depth = len(self.stack) - 1
+
+    def handle_endtag(self, tag):
+        super().handle_endtag(tag)
+        if self.card is not None and not self.card_closed and len(self.stack) <= self._card_depth:
+            self.card_closed = True
+            raise _StopParsing()
+
+    def settled(self):
+        if self.card_closed:
+            return True
+        decided, payload = self.scans[0].fields['embedded'].value()
+        if decided and payload and self.embedded_item is None:
+            self.embedded_item = self.embedded_result(payload)
+        return self.embedded_item is not None
+
+    def consume(self, chunk):
+        """Feed the next piece of the page (bytes or str); True once the answer is known"""
+        if self.done:
+            return True
+        text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        try:
+            self.feed(text)
+        except _StopParsing:
+            self.done = True
+        return self.done
+
+    def finish(self):
+        """Result for what was fed: {'title', 'price', 'url'}, or None if nothing was found"""
+        if not self.done:
+            try:
+                self.feed(self._decoder.decode(b'', final=True))
+                self.close()
+            except _StopParsing:
+                self.done = True
+            self.close_open()
+            self.settled()
+
+        if self.card is not None:
+            card = self.card.result()
+            return {
+                'title': card['title'],
+                'price': card['price'],
+                'url': urljoin(self.base_url, card['url']) if card['url'] else None,
+            }
+        if self.embedded_item is not None:
+            return self.embedded_item
+
+        price = self.scans[0].result()['price']
+        if price is not None:
+            return {'title': None, 'price': price, 'url': None}
+        return None
+
+
+class WalmartSearchParser(SearchResultParser):
+    """Walmart search results, with the __NEXT_DATA__ JSON as a second source"""
+
+    BASE_URL = WALMART_BASE_URL
+    CARD_SELECTORS = WALMART_CARD_SELECTORS
+    TITLE_SELECTORS = WALMART_TITLE_SELECTORS
+    PRICE_SELECTORS = WALMART_PRICE_SELECTORS
+    URL_SELECTORS = WALMART_URL_SELECTORS
+    PAGE_PRICE_SELECTORS = WALMART_PAGE_PRICE_SELECTORS
+    EMBEDDED_JSON_SELECTORS = ['script#__NEXT_DATA__']
+
+    def embedded_result(self, payload):
+        return _walmart_next_data_item(payload, self.base_url)
+
+
+class TargetSearchParser(SearchResultParser):
+    """Target search results"""
+
+    BASE_URL = TARGET_BASE_URL
+    CARD_SELECTORS = TARGET_CARD_SELECTORS
+    TITLE_SELECTORS = TARGET_TITLE_SELECTORS
+    PRICE_SELECTORS = TARGET_PRICE_SELECTORS
+    URL_SELECTORS = TARGET_URL_SELECTORS
+
+
+def _parse_search(parser, content):
+    for start in range(0, len(content), FEED_CHUNK_SIZE):
+        if parser.consume(content[start:start + FEED_CHUNK_SIZE]):
+            break
+    return parser.finish()
+
+
+def parse_walmart_search(content, encoding=None):
+    """Parse a whole Walmart search page (see SearchResultParser)"""
+    return _parse_search(WalmartSearchParser(encoding), content)
+
+
+def parse_target_search(content, encoding=None):
+    """Parse a whole Target search page (see SearchResultParser)"""
+    return _parse_search(TargetSearchParser(encoding), content)
@@ -0,0 +1,211 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import database
+import utils
+from singleflight import SingleFlight
+
+# Seconds a single lookup may take end to end before partial results are returned
+LOOKUP_DEADLINE = 20
+
+# Lookups in flight at once in batch mode
+BATCH_CONCURRENCY = 8
+
+# Stale-while-revalidate: a saved product younger than this many seconds is
+# served as is; an older one is served too, but refreshed in the background
+FRESH_FOR = 15 * 60
+
+# Threads that run the blocking scrapers. A private pool rather than the loop's
+# default executor, because asyncio.run() joins the default executor on exit and
+# would make a caller wait out the very requests the deadline gave up on.
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='lookup')
+
+# Background refreshes in flight, by ASIN
+_refreshes = SingleFlight('refresh')
+
+
+def _in_thread(func, *args):
+    """Run a blocking call on the lookup pool and return an awaitable future"""
+    return asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args))
+
+
+def _refresh_product(asin, api=None):
+    """Scrape a product and save it, unless only simulated data came back"""
+    product = utils.get_amazon_product_info(api, asin, enrich_title=False)
+    if product and not product.get('demo'):
+        database.save_product(product)
+    return product
+
+
+def refresh_product(asin, api=None):
+    """Start a background refresh of a saved product and return its Future
+
+    Concurrent refreshes of one ASIN share a single scrape.
+    """
+    return _refreshes.submit(_executor, asin, _refresh_product, asin, api)
+
+
+def _saved_product(asin):
+    """(product, age in seconds) for a saved product, or (None, None)"""
+    summary = database.get_product_summary(asin)
+    if not summary:
+        return None, None
+    try:
+        age = (datetime.now() - datetime.fromisoformat(summary['updated_at'])).total_seconds()
+    except (TypeError, ValueError):
+        age = None
+    return database.get_product(asin), age
+
+
+def _looks_like_url(value):
+    """True for links, False for a bare ASIN"""
+    return '/' in value or '.' in value
+
+
+async def lookup_product_async(url_or_asin, deadline=LOOKUP_DEADLINE, api=None, max_age=None):
+    """Look up a product on Amazon and Walmart concurrently within a deadline
+
+    The blocking scrapers in utils run on worker threads. When the title is
+    already known (the product was saved before), the Walmart search starts
+    right away alongside the Amazon fetch; otherwise it starts as soon as the
+    Amazon title arrives. Whatever hasn't finished by the deadline is
+    cancelled and listed in 'timed_out', so callers always get partial results.
+
+    With max_age (seconds, e.g. FRESH_FOR) the lookup is stale-while-revalidate:
+    a saved product is returned straight from SQLite with 'cached' set and its
+    'age', and if it's older than max_age a background refresh is started
+    ('refreshing'). Only products never saved are scraped live, and then saved.
+    Cached results have no Walmart comparison.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    stop_at = started + deadline
+    result = {
+        'asin': None,
+        'product': None,
+        'walmart': None,
+        'errors': {},
+        'timed_out': [],
+        'elapsed': None,
+        'cached': False,
+        'age': None,
+        'refreshing': False,
+    }
+
+    def finish():
+        result['elapsed'] = loop.time() - started
+        return result
+
+    # Step 1: resolve the ASIN (may follow an a.co redirect)
+    if _looks_like_url(url_or_asin):
+        try:
+            asin = await asyncio.wait_for(_in_thread(utils.extract_asin, url_or_asin),
+                                          timeout=max(0, stop_at - loop.time()))
+        except asyncio.TimeoutError:
+            result['timed_out'].append('asin')
+            return finish()
+    else:
+        asin = url_or_asin
+    result['asin'] = asin
+    if not asin:
+        result['errors']['asin'] = "Couldn't find an ASIN in that link"
+        return finish()
+
+    # Stale-while-revalidate: serve the saved row, refreshing it if it's old
+    if max_age is not None:
+        try:
+            product, age = await asyncio.wait_for(_in_thread(_saved_product, asin),
+                                                  timeout=max(0, stop_at - loop.time()))
+        except Exception:
+            product, age = None, None
+        if product:
+            result.update(product=product, cached=True, age=age)
+            if age is None or age > max_age:
+                refresh_product(asin, api)
+                result['refreshing'] = True
+            return finish()
+
+    # Step 2: fetch Amazon, and Walmart too if we already know what to search for
+    tasks = {'amazon': _in_thread(utils.get_amazon_product_info, api, asin)}
+    try:
+        # Bounded like every other step: a locked database mustn't hold the lookup past its deadline
+        known = await asyncio.wait_for(_in_thread(database.get_product_summary, asin),
+                                       timeout=max(0, stop_at - loop.time()))
+    except Exception:
+        known = None  # only a head start, so a database hiccup or timeout shouldn't fail the lookup
+    if known and known.get('title'):
+        tasks['walmart'] = _in_thread(utils.search_walmart, known['title'])
+
+    while tasks:
+        # Past the deadline this still collects whatever has already finished
+        remaining = max(0, stop_at - loop.time())
+        done, _ = await asyncio.wait(tasks.values(), timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            break
+        for name, task in list(tasks.items()):
+            if task not in done:
+                continue
+            del tasks[name]
+            try:
+                value = task.result()
+            except Exception as e:
+                result['errors'][name] = str(e)
+                continue
+
+            if name == 'amazon':
+                result['product'] = value
+                if max_age is not None and value and not value.get('demo'):
+                    # First lookup in stale-while-revalidate mode: the next one is served from SQLite
+                    tasks['save'] = _in_thread(database.save_product, value)
+                # Step 3: first sighting of this product, search Walmart now that we have a title
+                if 'walmart' not in tasks and result['walmart'] is None and value and value.get('title'):
+                    tasks['walmart'] = _in_thread(utils.search_walmart, value['title'])
+            elif name == 'walmart':
+                result['walmart'] = value
+
+    # Past the deadline: stop waiting. The worker threads run to their own
+    # request timeouts, but nothing waits on them and their results are dropped.
+    for name, task in tasks.items():
+        task.cancel()
+        result['timed_out'].append(name)
+
+    return finish()
+
+
+async def lookup_many_async(items, concurrency=BATCH_CONCURRENCY, deadline=LOOKUP_DEADLINE, api=None, save=False,
+                            max_age=None):
+    """Look up many URLs/ASINs with at most `concurrency` lookups in flight
+
+    Results come back in input order. With save=True every product scraped
+    live (not served from SQLite, not demo data) is written in one
+    save_products() batch at the end.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(item):
+        async with semaphore:
+            return await lookup_product_async(item, deadline=deadline, api=api, max_age=max_age)
+
+    results = await asyncio.gather(*(bounded(item) for item in items))
+
+    if save:
+        # Rows served from SQLite are already saved (saving them again would
+        # make them look fresh), and demo fallbacks are never saved
+        products = [result['product'] for result in results
+                    if result['product'] and not result['cached'] and not result['product'].get('demo')]
+        await _in_thread(database.save_products, products)
+
+    return results
+
+
+def lookup_product(url_or_asin, deadline=LOOKUP_DEADLINE, api=None, max_age=None):
+    """Blocking wrapper around lookup_product_async for Streamlit callbacks"""
+    return asyncio.run(lookup_product_async(url_or_asin, deadline=deadline, api=api, max_age=max_age))
+
+
+def lookup_many(items, concurrency=BATCH_CONCURRENCY, deadline=LOOKUP_DEADLINE, api=None, save=False, max_age=None):
+    """Blocking wrapper around lookup_many_async"""
+    return asyncio.run(lookup_many_async(items, concurrency=concurrency, deadline=deadline, api=api, save=save,
+                                         max_age=max_age))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Query plan audit for database.py.
+Runs every database function against a scratch database, captures the SQL
+it executes and checks EXPLAIN QUERY PLAN for full table scans.
+Exits non-zero if a hot query scans a whole table.
+"""
+
+import os
+import re
+import sys
+import tempfile
+
+import database
+
+# Functions whose queries may legitimately scan (one-off maintenance work)
+MAINTENANCE_FUNCTIONS = {'init_db', 'migrate_price_history', 'convert_price_data'}
+
+# (function, table) reads where every row is part of the answer, so walking
+# the whole table or index is the work itself rather than a missing index
+WHOLE_TABLE_READS = {('get_refresh_candidates', 'favorites')}
+
+# Statements worth planning; DDL, PRAGMAs and plain INSERT ... VALUES never scan
+PLANNED_PREFIXES = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def _sample_product(asin):
+    """A minimal product dict for the audit workload"""
+    return {
+        'asin': asin,
+        'title': f'Audit Product {asin}',
+        'current_price': 19.99,
+        'peak_price': 29.99,
+        'lowest_price': 17.99,
+        'price_data': [29.99, 24.99, 19.99],
+        'category': 'audit',
+    }
+
+
+def _workload():
+    """(name, call) pairs covering every query in database.py"""
+    return [
+        ('init_db', database.init_db),
+        ('save_product', lambda: database.save_product(_sample_product('B0AUDIT001'))),
+        ('save_products', lambda: database.save_products(
+            _sample_product(f'B0AUDIT{i:03d}') for i in range(2, 20))),
+        ('save_products', lambda: database.save_products(  # again: folds into saved histories
+            _sample_product(f'B0AUDIT{i:03d}') for i in range(2, 20))),
+        ('get_product', lambda: database.get_product('B0AUDIT001')),
+        ('get_product_summary', lambda: database.get_product_summary('B0AUDIT001')),
+        ('get_price_history', lambda: database.get_price_history('B0AUDIT001', start='2000-01-01')),
+        ('get_recent_prices', lambda: database.get_recent_prices('B0AUDIT001', days=30)),
+        ('get_price_stats', lambda: database.get_price_stats('B0AUDIT001', days=30)),
+        ('get_price_summary', lambda: database.get_price_summary('B0AUDIT001')),
+        ('get_top_deals', lambda: database.get_top_deals(10)),
+        ('get_top_deals', lambda: database.get_top_deals(10, category='home')),
+        ('migrate_price_history', database.migrate_price_history),
+        ('convert_price_data', lambda: database.convert_price_data('cents')),
+        ('get_price_array', lambda: database.get_price_array('B0AUDIT002')),
+        ('add_search_history', lambda: database.add_search_history(
+            asin='B0AUDIT001', url='https://www.amazon.com/dp/B0AUDIT001')),
+        ('get_recent_searches', lambda: database.get_recent_searches(10)),
+        ('toggle_favorite', lambda: database.toggle_favorite('B0AUDIT001')),
+        ('is_favorite', lambda: database.is_favorite('B0AUDIT001')),
+        ('get_favorites', database.get_favorites),
+        ('get_refresh_candidates', lambda: database.get_refresh_candidates(7)),
+        ('toggle_favorite', lambda: database.toggle_favorite('B0AUDIT001')),
+        ('create_user', lambda: database.create_user('audit', 'secret', 'audit@example.com')),
+        ('check_login', lambda: database.check_login('audit', 'secret')),
+        ('save_short_links', lambda: database.save_short_links({'8iGnbpL': 'B0AUDIT001', 'deadlnk': None})),
+        ('get_short_links', lambda: database.get_short_links(['8iGnbpL', 'deadlnk'])),
+        ('verify_coupon', lambda: database.verify_coupon('crystalcallahan')),
+        ('apply_coupon', lambda: database.apply_coupon('crystalcallahan', 1)),
+        ('set_price_alert', lambda: database.set_price_alert(1, 'B0AUDIT001', 25.0)),
+        ('get_price_alerts', lambda: database.get_price_alerts(1)),
+        ('rearm_price_alerts', lambda: database.rearm_price_alerts(['B0AUDIT001', 'B0AUDIT002'])),
+        ('get_triggered_alerts', lambda: database.get_triggered_alerts(['B0AUDIT001', 'B0AUDIT002'], ['besties', 'platinum'])),
+        ('mark_alerts_notified', lambda: database.mark_alerts_notified([{'asin': 'B0AUDIT001', 'user_id': 1, 'current_price': 19.99}])),
+        ('remove_price_alert', lambda: database.remove_price_alert(1, 'B0AUDIT001')),
+    ]
+
+
+def _open_range_column(plan_detail):
+    """Column of a SEARCH line bounded on one side only, with no equality before it"""
+    match = re.search(r'\((.*)\)', plan_detail)
+    if not match:
+        return None
+    constraints = match.group(1).split(' AND ')
+    if len(constraints) != 1 or '=' in constraints[0]:
+        return None
+    return re.split(r'[<>]', constraints[0])[0]
+
+
+def is_full_scan(plan_detail, sql=''):
+    """True if an EXPLAIN QUERY PLAN line reads a whole table or a whole index
+
+    That covers plain table scans, index scans (SCAN ... USING INDEX) unless a
+    LIMIT stops them early, and SEARCH lines whose only constraint is an open
+    range the query never asked for (SQLite turns `col IS NOT NULL` into
+    `col>?`, which walks the entire index).
+    """
+    if plan_detail == 'SCAN CONSTANT ROW':
+        return False
+    if plan_detail.startswith('SCAN '):
+        return 'USING' not in plan_detail or not re.search(r'\bLIMIT\b', sql, re.IGNORECASE)
+    if plan_detail.startswith('SEARCH '):
+        column = _open_range_column(plan_detail)
+        return column is not None and not re.search(rf'\b{column}\s*[<>]', sql)
+    return False
+
+
+def audit_queries():
+    """Exercise database.py and return one report entry per distinct statement"""
+    original_path = database.DB_PATH
+    captured = []
+    current = {'name': None}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            database.close_connections()
+            database.DB_PATH = os.path.join(tmp, 'audit.db')
+            conn = database.get_connection()
+            conn.set_trace_callback(lambda sql: captured.append((current['name'], sql.strip())))
+
+            for name, call in _workload():
+                current['name'] = name
+                call()
+            conn.set_trace_callback(None)
+
+            report = []
+            seen = set()
+            for name, sql in captured:
+                if not sql.upper().startswith(PLANNED_PREFIXES) or (name, sql) in seen:
+                    continue
+                seen.add((name, sql))
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                scans = [detail for detail in plan if is_full_scan(detail, sql)
+                         and (name, detail.split()[1]) not in WHOLE_TABLE_READS]
+                report.append({
+                    'function': name,
+                    'sql': ' '.join(sql.split()),
+                    'plan': plan,
+                    'full_scans': scans,
+                    'ok': not scans or name in MAINTENANCE_FUNCTIONS,
+                })
+        finally:
+            database.close_connections()
+            database.DB_PATH = original_path
+
+    return report
+
+
+if __name__ == "__main__":
+    report = audit_queries()
+    failures = [entry for entry in report if not entry['ok']]
+
+    for entry in report:
+        status = "✅" if entry['ok'] else "❌"
+        print(f"{status} {entry['function']}: {entry['sql']}")
+        for detail in entry['plan']:
+            print(f"     {detail}")
+
+    print(f"\n{len(report)} queries planned, {len(failures)} hot full scans")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+import http_client
+
+# Where cached responses live; separate from girlmath.db so it can be wiped freely
+CACHE_PATH = os.environ.get('GIRLMATH_HTTP_CACHE', 'http_cache.db')
+
+# Seconds a cached page counts as fresh, per host
+HOST_TTLS = {
+    'www.amazon.com': 15 * 60,
+    'www.walmart.com': 10 * 60,
+}
+DEFAULT_TTL = 5 * 60
+
+# Compressed bytes kept on disk before least recently used entries are evicted
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Response headers stored with a body, under these canonical names
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+# Request headers that change the page we get back, so they're part of the key
+VARY_HEADERS = ('Accept-Language',)
+
+# Bytes read from the network at a time by cached_stream()
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Seconds between last_access updates for the same entry; LRU order only needs to be roughly right
+ACCESS_UPDATE_INTERVAL = 60
+
+# Key method for the body prefixes cached_stream() stores, so cached_get() never serves them
+PARTIAL_METHOD = 'GET-PREFIX'
+
+# Offline replay: serve whatever is cached (however old) and never touch the network.
+# Misses come back as 504s. Set GIRLMATH_OFFLINE=1 or call set_offline(True).
+OFFLINE = os.environ.get('GIRLMATH_OFFLINE') == '1'
+
+_local = threading.local()
+
+
+class CachedResponse:
+    """The parts of requests.Response that the scrapers use, served from the cache
+
+    headers is case-insensitive, like requests' own, whatever case the server used.
+    """
+
+    def __init__(self, url, status_code, content, headers, from_cache=True):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        content_type = self.headers.get('Content-Type', '')
+        encoding = 'utf-8'
+        if 'charset=' in content_type:
+            encoding = content_type.split('charset=')[-1].split(';')[0].strip()
+        return self.content.decode(encoding, errors='replace')
+
+
+def set_offline(offline=True):
+    """Turn offline replay on or off"""
+    global OFFLINE
+    OFFLINE = offline
+
+
+def _get_connection():
+    """Per-thread connection to CACHE_PATH, creating the table on first use"""
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(CACHE_PATH)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            headers TEXT,          -- JSON of the response headers we keep
+            body BLOB,             -- zlib-compressed
+            size INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            stored_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        conn.commit()
+        connections[CACHE_PATH] = conn
+    return conn
+
+
+def close():
+    """Close this thread's cache connections (e.g. before deleting the file)"""
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+def cache_key(url, headers=None, method='GET'):
+    """Key for a request: method, URL and the headers in VARY_HEADERS"""
+    headers = headers or {}
+    vary = '|'.join(f"{name}={headers.get(name, '')}" for name in VARY_HEADERS)
+    return hashlib.sha256(f"{method} {url} {vary}".encode('utf-8')).hexdigest()
+
+
+def ttl_for(url):
+    """Freshness lifetime in seconds for a URL's host"""
+    return HOST_TTLS.get(urlsplit(url).hostname or '', DEFAULT_TTL)
+
+
+def _key(url, headers, partial):
+    """cache_key() for a full body, or for a prefix stored by cached_stream()"""
+    return cache_key(url, headers, method=PARTIAL_METHOD if partial else 'GET')
+
+
+def lookup(url, headers=None, partial=False):
+    """Return the cached entry for a request as a dict, or None
+
+    The dict has 'response' (a CachedResponse), 'fresh', 'etag' and 'last_modified'.
+    partial looks up the body prefix cached_stream() stored instead of a full body.
+    """
+    conn = _get_connection()
+    key = _key(url, headers, partial)
+    row = conn.execute('''
+    SELECT status, headers, body, etag, last_modified, expires_at, last_access
+    FROM responses WHERE key=?
+    ''', (key,)).fetchone()
+    if not row:
+        return None
+
+    status, headers_json, body, etag, last_modified, expires_at, last_access = row
+    now = time.time()
+    # Hot entries are read far more often than they need re-stamping; skip the write
+    if now - last_access >= ACCESS_UPDATE_INTERVAL:
+        with conn:
+            conn.execute("UPDATE responses SET last_access=? WHERE key=?", (now, key))
+
+    return {
+        'response': CachedResponse(url, status, zlib.decompress(body), json.loads(headers_json)),
+        'fresh': expires_at > now,
+        'etag': etag,
+        'last_modified': last_modified,
+    }
+
+
+def store(url, headers, status, content, response_headers=None, ttl=None, partial=False):
+    """Compress and store a response body, then evict if over MAX_CACHE_BYTES
+
+    partial marks content as only a prefix of the body; it is kept under its
+    own key so lookups for the full page never see it.
+    """
+    # Servers may send any case (HTTP/2 sends lowercase); store the canonical names
+    response_headers = CaseInsensitiveDict(response_headers or {})
+    kept_headers = {name: response_headers[name] for name in KEPT_HEADERS if name in response_headers}
+    body = zlib.compress(content, 6)
+    now = time.time()
+    ttl = ttl_for(url) if ttl is None else ttl
+
+    conn = _get_connection()
+    with conn:
+        conn.execute('''
+        INSERT OR REPLACE INTO responses
+        (key, url, status, headers, body, size, etag, last_modified, stored_at, expires_at, last_access)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (_key(url, headers, partial), url, status, json.dumps(kept_headers), body, len(body),
+              kept_headers.get('ETag'), kept_headers.get('Last-Modified'), now, now + ttl, now))
+    _evict(conn)
+
+
+def refresh(url, headers, ttl=None, partial=False):
+    """Mark a cached entry fresh again after a 304 Not Modified"""
+    ttl = ttl_for(url) if ttl is None else ttl
+    conn = _get_connection()
+    with conn:
+        conn.execute("UPDATE responses SET expires_at=? WHERE key=?",
+                     (time.time() + ttl, _key(url, headers, partial)))
+
+
+def _evict(conn):
+    """Drop least recently used entries until the cache is under 90% of its cap"""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return
+
+    target = MAX_CACHE_BYTES * 0.9
+    with conn:
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM responses WHERE key=?", (key,))
+            total -= size
+
+
+def get_stats():
+    """Return the number of cached responses and their compressed size"""
+    count, size = _get_connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    return {'entries': count, 'bytes': size, 'max_bytes': MAX_CACHE_BYTES, 'offline': OFFLINE}
+
+
+def conditional_headers(entry, headers=None):
+    """Request headers plus If-None-Match/If-Modified-Since for a stale entry"""
+    headers = dict(headers or {})
+    if entry and entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def cached_get(url, headers=None, timeout=None):
+    """GET through the response cache
+
+    Fresh entries are served without a request. Stale ones are revalidated
+    with their ETag/Last-Modified, and a 304 serves the cached body. Only
+    real 200 pages are stored, never captcha/robot-check pages. While the
+    host's circuit breaker is open, a stale entry is served rather than
+    raising http_client.CircuitOpenError.
+    """
+    entry = lookup(url, headers)
+
+    if OFFLINE:
+        if entry:
+            return entry['response']
+        return CachedResponse(url, 504, b'', {}, from_cache=False)
+
+    if entry and entry['fresh']:
+        return entry['response']
+
+    try:
+        response = http_client.get(url, headers=conditional_headers(entry, headers), timeout=timeout)
+    except http_client.CircuitOpenError:
+        # The host is failing; a stale page beats no page
+        if entry:
+            return entry['response']
+        raise
+
+    if response.status_code == 304 and entry:
+        refresh(url, headers)
+        return entry['response']
+
+    # Bot-check pages come back as 200s; never cache those
+    if response.status_code == 200 and not http_client.is_blocked_page(response):
+        store(url, headers, 200, response.content, response.headers)
+
+    response.from_cache = False
+    return response
+
+
+def _replay(response, consume, chunk_size):
+    """Hand a stored body to consume() in chunks until it has enough"""
+    content = response.content
+    for start in range(0, len(content), chunk_size):
+        if consume(content[start:start + chunk_size]):
+            break
+    return response
+
+
+def cached_stream(url, consume, headers=None, timeout=None, chunk_size=STREAM_CHUNK_SIZE):
+    """GET through the response cache, handing the body to consume(chunk) as it arrives
+
+    consume returns True once it has what it needs, and the rest of the body
+    is never downloaded. Caching works as in cached_get, except that what
+    gets stored is the part of the body that was read. Replaying that prefix
+    gives consume the same answer, and the cache stays small. Prefixes are
+    stored as partial entries, apart from the full pages cached_get serves.
+    Returns the response with .content set to the bytes read.
+    """
+    entry = lookup(url, headers, partial=True)
+
+    if OFFLINE:
+        if entry:
+            return _replay(entry['response'], consume, chunk_size)
+        return CachedResponse(url, 504, b'', {}, from_cache=False)
+
+    if entry and entry['fresh']:
+        return _replay(entry['response'], consume, chunk_size)
+
+    try:
+        response = http_client.get(url, headers=conditional_headers(entry, headers), timeout=timeout, stream=True)
+    except http_client.CircuitOpenError:
+        if entry:
+            return _replay(entry['response'], consume, chunk_size)
+        raise
+    try:
+        if response.status_code == 304 and entry:
+            refresh(url, headers, partial=True)
+            return _replay(entry['response'], consume, chunk_size)
+
+        if response.status_code != 200:
+            return CachedResponse(response.url, response.status_code, response.content,
+                                  response.headers, from_cache=False)
+
+        consumed = []
+        for chunk in response.iter_content(chunk_size):
+            consumed.append(chunk)
+            if consume(chunk):
+                break
+    except Exception:
+        http_client.report_outcome(url, ok=False)
+        raise
+    finally:
+        response.close()
+
+    streamed = CachedResponse(response.url, 200, b''.join(consumed), response.headers, from_cache=False)
+    blocked = http_client.is_blocked_page(streamed)
+    http_client.report_outcome(url, ok=not blocked)
+    if not blocked:
+        store(url, headers, 200, streamed.content, response.headers, partial=True)
+    return streamed
@@ -0,0 +1,178 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import database
+import http_client
+import parsers
+import utils
+from circuit import OPEN
+
+# Threads shared by every comparison. Searches that outlive their timeout keep
+# their thread until they finish, so leave headroom over the adapter count.
+COMPARE_WORKERS = 16
+
+_executor = ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix='retailer')
+
+
+class RetailerAdapter:
+    """One retailer's product search
+
+    Subclasses set `name`, the `tier_flag` in get_user_tier_features() that
+    unlocks them, and either override search() or set `search_url` and
+    `parser_class` to stream a search page through a parsers.SearchResultParser.
+    Each adapter has its own timeout, so one slow retailer never holds up the
+    others. Failures are counted by http_client's circuit breaker for `host`.
+    """
+
+    name = None
+    host = None
+    tier_flag = None
+    parser_class = None
+    headers = None
+    timeout = 10
+
+    def __init__(self, timeout=None):
+        if timeout is not None:
+            self.timeout = timeout
+
+    def available(self):
+        """False while http_client's breaker for the retailer's host is open"""
+        return self.host is None or http_client.get_breaker(self.host).state != OPEN
+
+    def search_url(self, title):
+        raise NotImplementedError
+
+    def search(self, title):
+        """Return the first result as {'title', 'price', 'url'}, or None if there isn't one
+
+        Raises when the retailer can't be reached.
+        """
+        return utils.fetch_search_result(self.search_url(title), self.parser_class(),
+                                         headers=self.headers, timeout=self.timeout)
+
+
+class WalmartAdapter(RetailerAdapter):
+    name = 'walmart'
+    host = 'www.walmart.com'
+    tier_flag = 'access_to_walmart_prices'
+    parser_class = parsers.WalmartSearchParser
+    headers = utils.WALMART_HEADERS
+
+    def search_url(self, title):
+        return utils.walmart_search_url(title)
+
+
+class TargetAdapter(RetailerAdapter):
+    name = 'target'
+    host = 'www.target.com'
+    tier_flag = 'access_to_target_prices'
+    parser_class = parsers.TargetSearchParser
+    headers = utils.TARGET_HEADERS
+
+    def search_url(self, title):
+        return utils.target_search_url(title)
+
+
+# Adapters compare_prices() uses by default, by name
+ADAPTERS = {}
+
+
+def register_adapter(adapter):
+    """Add an adapter to ADAPTERS (replacing any with the same name) and return it"""
+    ADAPTERS[adapter.name] = adapter
+    return adapter
+
+
+register_adapter(WalmartAdapter())
+register_adapter(TargetAdapter())
+
+
+def adapters_for_tier(tier, adapters=None):
+    """The adapters a tier has access to, in registry order"""
+    features = database.get_user_tier_features(tier)
+    adapters = list(ADAPTERS.values()) if adapters is None else list(adapters)
+    return [adapter for adapter in adapters if not adapter.tier_flag or features.get(adapter.tier_flag)]
+
+
+def _timed_search(adapter, title):
+    """Run one adapter's search and return (result, seconds taken)"""
+    started = time.monotonic()
+    result = adapter.search(title)
+    return result, time.monotonic() - started
+
+
+def rank_offers(offers):
+    """Priced offers cheapest first, then the ones without a price"""
+    return sorted(offers, key=lambda offer: (offer['price'] is None, offer['price'] or 0))
+
+
+def compare_prices(title, tier='free', adapters=None):
+    """Search every retailer the tier has access to in parallel and rank the offers
+
+    All searches start at once on a shared thread pool. Each adapter is
+    waited on for at most its own timeout, measured from the start, and a
+    search still running after that is listed in 'timed_out' and left to
+    finish in the background, so the slowest retailer never sets the
+    latency. Adapters whose host's circuit breaker is open are skipped
+    outright; the breaker itself is fed by http_client.
+
+    Returns a dict with 'offers' (ranked by rank_offers(), each with
+    'retailer', 'title', 'price', 'url' and 'elapsed'), 'best' (the
+    cheapest priced offer or None), 'errors' (retailer -> message),
+    'skipped', 'timed_out', 'locked' (retailers the tier doesn't include)
+    and 'elapsed'.
+    """
+    started = time.monotonic()
+    candidates = list(ADAPTERS.values()) if adapters is None else list(adapters)
+    allowed = adapters_for_tier(tier, candidates)
+    result = {
+        'offers': [],
+        'best': None,
+        'errors': {},
+        'skipped': [],
+        'timed_out': [],
+        'locked': [adapter.name for adapter in candidates if adapter not in allowed],
+        'elapsed': None,
+    }
+
+    futures = {}
+    for adapter in allowed:
+        if not adapter.available():
+            result['skipped'].append(adapter.name)
+            continue
+        futures[_executor.submit(_timed_search, adapter, title)] = adapter
+
+    pending = set(futures)
+    while pending:
+        next_deadline = min(started + futures[future].timeout for future in pending)
+        done, pending = wait(pending, timeout=max(0, next_deadline - time.monotonic()),
+                             return_when=FIRST_COMPLETED)
+
+        for future in done:
+            adapter = futures[future]
+            try:
+                found, elapsed = future.result()
+            except Exception as e:
+                result['errors'][adapter.name] = str(e) or type(e).__name__
+                continue
+
+            if found:
+                result['offers'].append({
+                    'retailer': adapter.name,
+                    'title': found.get('title'),
+                    'price': found.get('price'),
+                    'url': found.get('url'),
+                    'elapsed': elapsed,
+                })
+
+        # Give up on anything past its own timeout; the thread finishes on its own
+        now = time.monotonic()
+        for future in [future for future in pending if now >= started + futures[future].timeout]:
+            pending.discard(future)
+            future.cancel()
+            result['timed_out'].append(futures[future].name)
+
+    result['offers'] = rank_offers(result['offers'])
+    result['best'] = next((offer for offer in result['offers'] if offer['price'] is not None), None)
+    result['elapsed'] = time.monotonic() - started
+    return result
@@ -0,0 +1,299 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import alerts
+import database
+import http_client
+import utils
+from circuit import OPEN
+
+# Seconds a saved product counts as fresh before it's due for a re-scrape
+REFRESH_INTERVAL = 6 * 60 * 60
+
+# Searches in the last this many days make a product worth refreshing
+RECENT_SEARCH_DAYS = 7
+
+# A favorite counts as this many searches when ranking what to refresh first
+FAVORITE_WEIGHT = 5
+
+# Scrapes running at once
+REFRESH_WORKERS = 4
+
+# Most requests per second the scheduler sends to each host
+HOST_RATE_LIMITS = {
+    'www.amazon.com': 0.5,
+}
+DEFAULT_RATE_LIMIT = 1.0
+
+# Seconds between refresh cycles when running in the background
+POLL_INTERVAL = 60
+
+# Refreshed products written per save_products() batch
+WRITE_BATCH_SIZE = 50
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second, across threads"""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Wait for the next free slot"""
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            self._sleep(slot - now)
+
+
+def fetch_amazon_product(asin):
+    """Scrape a product from Amazon, or None if only demo data came back"""
+    product = utils.get_amazon_product_info(None, asin, enrich_title=False)
+    # get_amazon_product_info falls back to simulated data; never save that over real prices
+    if not product or product.get('demo'):
+        return None
+    return product
+
+
+def _age_seconds(updated_at, now):
+    """Seconds since an ISO timestamp, or None if the product was never saved"""
+    if not updated_at:
+        return None
+    try:
+        return max(0.0, (now - datetime.fromisoformat(updated_at)).total_seconds())
+    except ValueError:
+        return None
+
+
+class RefreshScheduler:
+    """Re-scrapes favorited and recently searched products in the background
+
+    Each cycle reads the candidates from database.get_refresh_candidates()
+    and queues the ones older than `refresh_interval` (never-saved ones
+    first) on a heap ordered by staleness times popularity. Workers take
+    them in that order, wait their turn with the host's RateLimiter, skip
+    hosts whose circuit breaker is open, and the results are written through
+    database.save_products() in batches. The UI then reads products from
+    SQLite (see read_product) instead of scraping on the request path.
+    After each batch is written, price alerts on those products are
+    evaluated (alerts.evaluate_alerts) and sent to `alert_sink`, or to
+    alerts.get_sink() when it's None.
+
+    `fetch(asin)` returns a product dict or None and defaults to
+    fetch_amazon_product; `host` is what it's rate limited against.
+    """
+
+    def __init__(self, fetch=None, host='www.amazon.com', workers=REFRESH_WORKERS,
+                 refresh_interval=REFRESH_INTERVAL, rate_limits=None, now=datetime.now, alert_sink=None):
+        self.fetch = fetch or fetch_amazon_product
+        self.alert_sink = alert_sink
+        self.host = host
+        self.workers = workers
+        self.refresh_interval = refresh_interval
+        self._rate_limits = dict(HOST_RATE_LIMITS, **(rate_limits or {}))
+        self._limiters = {}
+        self._now = now
+        self._lock = threading.Lock()
+        self._heap = []
+        self._queued = {}  # asin -> priority of its live heap entry
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'cycles': 0, 'refreshed': 0, 'failed': 0, 'deferred': 0, 'alerts': 0}
+
+    def limiter(self, host):
+        """The RateLimiter for a host"""
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self._rate_limits.get(host, DEFAULT_RATE_LIMIT))
+            return limiter
+
+    def priority(self, candidate, now):
+        """Larger runs first: staleness in seconds weighted by popularity"""
+        popularity = 1 + candidate['searches'] + FAVORITE_WEIGHT * candidate['favorites']
+        age = _age_seconds(candidate['updated_at'], now)
+        if age is None:
+            return float('inf')
+        return age * popularity
+
+    def is_due(self, candidate, now):
+        """True if the candidate was never saved or is older than refresh_interval"""
+        age = _age_seconds(candidate['updated_at'], now)
+        return age is None or age >= self.refresh_interval
+
+    def enqueue(self, asin, priority=float('inf')):
+        """Queue an ASIN for refresh (once; queueing it again at a higher priority moves it up)
+
+        Returns True if the ASIN was queued or moved up.
+        """
+        with self._lock:
+            queued = self._queued.get(asin)
+            if queued is not None and queued >= priority:
+                return False
+            # Moving up leaves the old entry in the heap; _pop() skips it
+            self._queued[asin] = priority
+            heapq.heappush(self._heap, (-priority, next(self._counter), asin))
+            return True
+
+    def _pop(self):
+        """Next ASIN in priority order, or None when the queue is empty"""
+        with self._lock:
+            while self._heap:
+                negated, _, asin = heapq.heappop(self._heap)
+                if self._queued.get(asin) == -negated:
+                    del self._queued[asin]
+                    return asin
+            return None
+
+    def pending(self):
+        """ASINs waiting to be refreshed"""
+        with self._lock:
+            return len(self._queued)
+
+    def schedule(self, recent_days=RECENT_SEARCH_DAYS):
+        """Queue every due candidate and return how many were queued"""
+        now = self._now()
+        queued = 0
+        for candidate in database.get_refresh_candidates(recent_days):
+            if self.is_due(candidate, now):
+                self.enqueue(candidate['asin'], self.priority(candidate, now))
+                queued += 1
+        return queued
+
+    def _refresh(self, asin):
+        """Fetch one product, honouring the host's rate limit and breaker"""
+        if http_client.get_breaker(self.host).state == OPEN:
+            return 'deferred', None
+        self.limiter(self.host).acquire()
+        try:
+            product = self.fetch(asin)
+        except Exception as e:
+            print(f"Error refreshing {asin}: {str(e)}")
+            return 'failed', None
+        return ('refreshed', product) if product else ('failed', None)
+
+    def _work(self, results, budget):
+        """Worker: refresh queued ASINs in priority order until the queue or budget runs out"""
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    if budget[0] is not None:
+                        if budget[0] <= 0:
+                            return
+                        budget[0] -= 1
+                asin = self._pop()
+                if asin is None:
+                    return
+                results.put(self._refresh(asin))
+        finally:
+            results.put(None)
+
+    def _save(self, batch):
+        """Write a batch of refreshed products, then fire the price alerts on them"""
+        saved = database.save_products(batch)['rows']
+        try:
+            result = alerts.evaluate_alerts([product['asin'] for product in batch], self.alert_sink)
+            self.stats['alerts'] += result['delivered']
+        except Exception as e:
+            print(f"Error evaluating price alerts: {str(e)}")
+        return saved
+
+    def run_once(self, limit=None):
+        """Run one cycle: schedule, refresh the queue in priority order, save in batches
+
+        Workers pull from the heap as they free up, so an ASIN queued
+        mid-cycle (see read_product) is picked up in its turn. Refreshes
+        are written through save_products() every WRITE_BATCH_SIZE products
+        and at the end, each batch followed by its price alerts. Returns the
+        number of products saved.
+        """
+        self.schedule()
+        results = queue.Queue()
+        budget = [limit]
+        saved = 0
+        batch = []
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='refresh') as pool:
+            for _ in range(self.workers):
+                pool.submit(self._work, results, budget)
+
+            running = self.workers
+            while running:
+                item = results.get()
+                if item is None:
+                    running -= 1
+                    continue
+                outcome, product = item
+                self.stats[outcome] += 1
+                if product:
+                    batch.append(product)
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    saved += self._save(batch)
+                    batch = []
+
+        if batch:
+            saved += self._save(batch)
+        self.stats['cycles'] += 1
+        return saved
+
+    def _loop(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error in refresh cycle: {str(e)}")
+            self._stop.wait(interval)
+
+    def start(self, interval=POLL_INTERVAL):
+        """Run cycles every `interval` seconds on a daemon thread (no-op if already running)"""
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name='refresh-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop after the refreshes in flight and wait for the thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def read_product(self, asin):
+        """A product as last saved, queueing a refresh if it's missing or stale
+
+        This is the UI's read path: it never scrapes, so a page render costs
+        at most one SQLite read (none when PRODUCT_CACHE has the product). A
+        product that isn't saved yet comes back as None and jumps the queue.
+        """
+        product = database.get_product(asin)
+        if not product or self.is_due(product, self._now()):
+            self.enqueue(asin)
+        return product
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The process-wide scheduler, created on first use"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RefreshScheduler()
+    return _scheduler
@@ -0,0 +1,300 @@
+import hashlib
+from itertools import islice
+
+import numpy as np
+
+# Days of history generated per product, like the demo path always did
+DEFAULT_DAYS = 90
+
+# Per-category price model:
+# (low base price, high base price, tech-style trend, min sales, max sales, min discount, max discount)
+# Tech trends down 5% over the window with one or two 10% sales; everything
+# else drifts +/-5% with two or three 15-25% sales.
+CATEGORY_MODELS = {
+    'tech':        (100, 400, True, 1, 2, 0.10, 0.10),
+    'gaming':      (700, 1500, True, 1, 2, 0.10, 0.10),
+    'electronics': (50, 300, True, 1, 2, 0.10, 0.10),
+    'fashion':     (30, 100, False, 2, 3, 0.15, 0.25),
+    'beauty':      (15, 80, False, 2, 3, 0.15, 0.25),
+    'home':        (20, 120, False, 2, 3, 0.15, 0.25),
+}
+
+# Placeholder titles per category; {asin} keeps them distinct per product
+TITLE_CATALOG = {
+    'tech': [
+        "Wireless Noise Cancelling Earbuds - {asin}",
+        "Portable Bluetooth Speaker - {asin}",
+        "Smartwatch with Fitness Tracking - {asin}",
+        "Fast Charging Power Bank - {asin}",
+    ],
+    'gaming': [
+        "Gaming Laptop with RTX Graphics - {asin}",
+        "High Performance Gaming PC - {asin}",
+        "Gaming Desktop Computer - {asin}",
+        "Gaming Monitor with High Refresh Rate - {asin}",
+    ],
+    'electronics': [
+        "Premium Electronics Device - {asin}",
+        "Smart Home Tech Gadget - {asin}",
+        "Wireless Bluetooth Device - {asin}",
+        "Tech Gadget Pro - Latest Model - {asin}",
+    ],
+    'fashion': [
+        "Designer Fashion Collection - {asin}",
+        "Premium Apparel - Trending Style - {asin}",
+        "Fashion Accessory - Limited Edition - {asin}",
+    ],
+    'beauty': [
+        "Premium Beauty Product - Self Care Essential - {asin}",
+        "Luxury Skincare Collection - {asin}",
+        "Beauty and Cosmetics Set - {asin}",
+    ],
+    'home': [
+        "Home Essential Item - {asin}",
+        "Home and Kitchen Premium Product - {asin}",
+        "Household Premium Item - {asin}",
+    ],
+}
+
+# Hand-tuned demo products, matched by a code anywhere in the ASIN or short code.
+# Each third of the window has its own price band; days in the last third dip
+# into `dip_band` with probability `dip_chance`, and the last five days sit
+# within $10 of `current_price`, ending on it.
+PRESET_PRODUCTS = {
+    '7D2K2Wr': {
+        'title': "Acer Nitro V Gaming Laptop | Intel Core i5-13420H | NVIDIA GeForce RTX 4050 | "
+                 "15.6\" FHD 144Hz Display | 8GB DDR5 | 512GB SSD",
+        'current_price': 799.99,
+        'bands': ((869.99, 899.99), (829.99, 869.99), (789.99, 819.99)),
+        'dip_band': (749.99, 779.99),
+        'dip_chance': 0.2,
+    },
+}
+
+# Products generated per generate_price_histories() call in simulate_products()
+SIMULATE_CHUNK_SIZE = 10000
+
+GAMING_PATTERNS = ('7D2', 'GA4', 'RTX', 'CPU', 'GPU', '7NZ')
+
+MAX_SALES = 3
+SALE_MIN_DAYS = 5
+SALE_MAX_DAYS = 10
+
+# Columns of each ASIN's random stream used for the per-product parameters;
+# the daily noise draws start after them
+_PARAM_DRAWS = 6 + 2 * MAX_SALES
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def asin_seed(asin):
+    """Stable 64-bit seed for an ASIN (the same in every process, unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(asin.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _uniforms(seeds, start, count):
+    """Uniform [0, 1) draws `start`..`start + count` of each seed's stream, as an (N, count) matrix
+
+    Counter-based splitmix64: draw k of a stream depends only on (seed, k),
+    so every row is reproducible on its own whatever else is in the batch.
+    """
+    counters = np.arange(start + 1, start + count + 1, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        z = counters[None, :] * _GOLDEN
+        z = z + seeds[:, None]
+        z ^= z >> np.uint64(30)
+        z *= _MIX1
+        z ^= z >> np.uint64(27)
+        z *= _MIX2
+        z ^= z >> np.uint64(31)
+        z >>= np.uint64(11)
+    return z.astype(np.float64) * (1.0 / (1 << 53))
+
+
+def infer_category(asin):
+    """Product category guessed from the ASIN's shape (see CATEGORY_MODELS)"""
+    # This specific short code is a known gaming laptop
+    if '7D2K2Wr' in asin:
+        return 'gaming'
+
+    # Other short codes (like from a.co links) are assumed to be medium-priced tech
+    if len(asin) < 10:
+        return 'tech'
+
+    upper = asin.upper()
+    if any(pattern in upper for pattern in GAMING_PATTERNS):
+        return 'gaming'
+
+    prefix = upper[:2]
+    if prefix in ('B0', 'B1', 'B2'):
+        return 'electronics'
+    if prefix in ('B7', 'B8'):
+        return 'fashion'
+    if prefix in ('B3', 'B4'):
+        return 'beauty'
+    return 'home'
+
+
+def preset_for(asin):
+    """The PRESET_PRODUCTS entry for an ASIN, or None"""
+    return next((preset for code, preset in PRESET_PRODUCTS.items() if code in asin), None)
+
+
+def _preset_history(preset, seed, start, days):
+    """A preset product's daily prices, drawn from its ASIN's stream from draw `start` on"""
+    draws = _uniforms(np.array([seed], dtype=np.uint64), start, 2 * days)[0]
+    level, dip = draws[:days], draws[days:]
+
+    third = np.minimum(np.arange(days) * 3 // days, 2)
+    bands = np.array(preset['bands'])
+    dipped = (third == 2) & (dip < preset['dip_chance'])
+    low = np.where(dipped, preset['dip_band'][0], bands[third, 0])
+    high = np.where(dipped, preset['dip_band'][1], bands[third, 1])
+    prices = low + (high - low) * level
+
+    current = preset['current_price']
+    prices[-5:] = current - 10 + 20 * level[-5:]
+    prices[-1] = current
+    return prices
+
+
+def simulated_title(asin, category=None):
+    """A catalog title for an ASIN (or its preset title), the same one every time"""
+    preset = preset_for(asin)
+    if preset:
+        return preset['title']
+    titles = TITLE_CATALOG.get(category or infer_category(asin), TITLE_CATALOG['home'])
+    return titles[asin_seed(asin) % len(titles)].format(asin=asin)
+
+
+class PriceHistories:
+    """A batch of simulated price histories backed by NumPy arrays
+
+    `prices` is an (N, days) matrix, oldest day first, with one row per
+    entry of `asins`; `base_prices`, `current`, `peak` and `lowest` are
+    length-N vectors lined up with it.
+    """
+
+    def __init__(self, asins, categories, base_prices, prices):
+        self.asins = asins
+        self.categories = categories
+        self.base_prices = base_prices
+        self.prices = prices
+        self.current = prices[:, -1]
+        self.peak = prices.max(axis=1)
+        self.lowest = prices.min(axis=1)
+        self._rows = {asin: row for row, asin in enumerate(asins)}
+
+    def __len__(self):
+        return len(self.asins)
+
+    def row(self, asin):
+        """The price history for one ASIN, as a read-only view into `prices`"""
+        return self.prices[self._rows[asin]]
+
+    def products(self, titles=None):
+        """Yield product dicts in the shape save_products() takes
+
+        `titles` maps ASIN to title; the rest get their catalog title.
+        """
+        titles = titles or {}
+        price_lists = self.prices.tolist()
+        for i, asin in enumerate(self.asins):
+            yield {
+                'asin': asin,
+                'title': titles.get(asin) or simulated_title(asin, self.categories[i]),
+                'price_data': price_lists[i],
+                'current_price': price_lists[i][-1],
+                'peak_price': float(self.peak[i]),
+                'lowest_price': float(self.lowest[i]),
+                'category': self.categories[i],
+                'source': 'demo',
+                'demo': True,
+            }
+
+
+def generate_price_histories(asins, days=DEFAULT_DAYS):
+    """Simulate `days` of daily prices for every ASIN in one vectorized pass
+
+    Each ASIN's history depends only on the ASIN, so the same ASIN always
+    gets the same series whatever batch it's generated in. The model is the
+    one the demo path used: a category base price, a trend line, sale
+    windows, Gaussian noise, a 70% floor and a small discount on the last
+    five days so the current price looks like a deal.
+    """
+    asins = list(asins)
+    n = len(asins)
+    seeds = np.fromiter((asin_seed(asin) for asin in asins), dtype=np.uint64, count=n)
+    categories = [infer_category(asin) for asin in asins]
+
+    models = np.array([CATEGORY_MODELS[category] for category in categories], dtype=np.float64).reshape(n, 7)
+    low, high, tech, min_sales, max_sales, min_discount, max_discount = models.T
+    tech = tech.astype(bool)
+
+    draws = _uniforms(seeds, 0, _PARAM_DRAWS)
+    base_price = low + (high - low) * draws[:, 0]
+    num_sales = min_sales + np.floor(draws[:, 1] * (max_sales - min_sales + 1))
+    discount = min_discount + (max_discount - min_discount) * draws[:, 2]
+
+    # Trend line from start to end price
+    start = np.where(tech, base_price * 1.05, base_price * (1 - 0.05 * draws[:, 3]))
+    end = np.where(tech, base_price, base_price * (1 + 0.05 * draws[:, 4]))
+    ramp = np.linspace(0.0, 1.0, days) if days > 1 else np.ones(1)
+    prices = start[:, None] + (end - start)[:, None] * ramp[None, :]
+
+    # Sale windows: (N, MAX_SALES) starts and lengths, broadcast against the day index
+    sale_draws = draws[:, 6:].reshape(n, MAX_SALES, 2)
+    latest_start = max(days - SALE_MAX_DAYS, 0)
+    sale_start = np.floor(sale_draws[:, :, 0] * (latest_start + 1))
+    sale_length = SALE_MIN_DAYS + np.floor(sale_draws[:, :, 1] * (SALE_MAX_DAYS - SALE_MIN_DAYS + 1))
+    active = np.arange(MAX_SALES)[None, :] < num_sales[:, None]
+    day = np.arange(days)[None, None, :]
+    on_sale = ((day >= sale_start[:, :, None]) & (day < (sale_start + sale_length)[:, :, None])
+               & active[:, :, None]).any(axis=1)
+    prices -= np.where(on_sale, (base_price * discount)[:, None], 0.0)
+
+    # Gaussian noise via Box-Muller, less of it for expensive items
+    noise_level = np.minimum(0.02, 5.0 / base_price)
+    # (both the cosine and sine halves, so each pair of draws gives two days)
+    pairs = (days + 1) // 2
+    uniforms = _uniforms(seeds, _PARAM_DRAWS, 2 * pairs)
+    radius = np.sqrt(-2.0 * np.log1p(-uniforms[:, :pairs]))
+    angle = (2.0 * np.pi) * uniforms[:, pairs:]
+    normal = np.concatenate((radius * np.cos(angle), radius * np.sin(angle)), axis=1)[:, :days]
+    prices += normal * (base_price * noise_level)[:, None]
+
+    # Price floor, then make the current price a good deal
+    np.maximum(prices, (base_price * 0.7)[:, None], out=prices)
+    prices[:, -5:] *= np.where(base_price < 500, 0.9, 0.95)[:, None]
+
+    # Preset products replace their row, drawing from the stream after the noise
+    presets = {row: PRESET_PRODUCTS[code] for row, asin in enumerate(asins)
+               for code in PRESET_PRODUCTS if code in asin}
+    for row, preset in presets.items():
+        prices[row] = _preset_history(preset, seeds[row], _PARAM_DRAWS + 2 * pairs, days)
+
+    np.round(prices, 2, out=prices)
+    prices.flags.writeable = False
+    return PriceHistories(asins, categories, base_price, prices)
+
+
+def simulate_products(asins, days=DEFAULT_DAYS):
+    """Yield complete demo products for any number of ASINs, with no I/O at all
+
+    Titles come from TITLE_CATALOG; swapping in real ones is a separate,
+    optional step (see utils.enrich_titles). ASINs are generated in chunks of
+    SIMULATE_CHUNK_SIZE, so memory stays flat for very long inputs.
+    """
+    asins = iter(asins)
+    while True:
+        chunk = list(islice(asins, SIMULATE_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield from generate_price_histories(chunk, days).products()
+
+
+def simulate_product(asin, days=DEFAULT_DAYS):
+    """One demo product (see simulate_products)"""
+    return next(simulate_products([asin], days))
@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one
+
+    The first caller for a key runs the function; everyone who asks for the
+    same key while it's in flight gets that call's result (or exception)
+    instead of starting their own. Once it finishes the key is forgotten,
+    so the next call runs fresh - this dedupes, it doesn't cache.
+
+    Counts every call, the ones that actually ran and the ones coalesced
+    into a call already in flight (see stats()).
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future of the call in flight
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.peak_waiters = 0
+        self._waiters = {}  # key -> callers sharing the call in flight
+
+    def _join(self, key):
+        """Return (future, True if this caller should run the call)"""
+        with self._lock:
+            self.requests += 1
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                self._waiters[key] += 1
+                self.peak_waiters = max(self.peak_waiters, self._waiters[key])
+                return future, False
+            self.executions += 1
+            self._waiters[key] = 1
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _run(self, key, future, func, args, kwargs):
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+                    del self._waiters[key]
+
+    def do(self, key, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in this thread, or wait for the call already in flight for key"""
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, func, args, kwargs)
+        return future.result()
+
+    def submit(self, executor, key, func, *args, **kwargs):
+        """Like do(), but run the call on an executor and return its Future without waiting"""
+        future, leader = self._join(key)
+        if leader:
+            executor.submit(self._run, key, future, func, args, kwargs)
+        return future
+
+    def in_flight(self, key):
+        """True while a call for key is running"""
+        with self._lock:
+            return key in self._calls
+
+    def stats(self):
+        """Return call counts: requests, executions, coalesced, the coalesced share, and keys in flight"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'coalesced_ratio': self.coalesced / self.requests if self.requests else 0.0,
+                'peak_waiters': self.peak_waiters,
+                'in_flight': len(self._calls),
+            }
+
+    def reset_stats(self):
+        """Zero the counters (calls in flight are unaffected)"""
+        with self._lock:
+            self.requests = 0
+            self.executions = 0
+            self.coalesced = 0
+            self.peak_waiters = 0
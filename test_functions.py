@@ -3,17 +3,106 @@ import sys
 import os
 import random
 import json
-from datetime import datetime
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import datetime, timedelta
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Add parent directory to path to import app modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import app modules for testing
 import utils
+import database
+import http_client
+import pipeline
+import response_cache
+import benchmarks
+import simulator
+import parsers
+import retailers
+import scheduler
+import alerts
+from singleflight import SingleFlight
+from circuit import CircuitBreaker
+from cache import LRUCache, MISSING
 from database import init_db, save_product, get_product, add_search_history, get_recent_searches, toggle_favorite, is_favorite
 
-class TestAmazonUrlParser(unittest.TestCase):
+class ScriptedServer:
+    """Local HTTP server that replays scripted (status, headers, body) responses
+
+    Once the script runs out it keeps answering with the last response.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                server.requests.append((self.command, self.path, dict(self.headers)))
+                status, headers, body = server.responses.pop(0) if len(server.responses) > 1 else server.responses[0]
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            do_GET = do_HEAD = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TempDatabaseTestCase(unittest.TestCase):
+    """Base for tests that need a database of their own
+
+    Points database.DB_PATH at `db_name` in a fresh temporary directory and
+    empties the read-through caches before and after each test. The schema
+    is created unless `init_schema` is False.
+    """
+
+    db_name = 'test.db'
+    init_schema = True
+
+    def setUp(self):
+        self.original_db_path = database.DB_PATH
+        self.tmpdir = tempfile.TemporaryDirectory()
+        database.DB_PATH = os.path.join(self.tmpdir.name, self.db_name)
+        database.PRODUCT_CACHE.clear()
+        database.FAVORITE_CACHE.clear()
+        if self.init_schema:
+            init_db()
+
+    def tearDown(self):
+        database.close_connections()
+        database.PRODUCT_CACHE.clear()
+        database.FAVORITE_CACHE.clear()
+        database.DB_PATH = self.original_db_path
+        self.tmpdir.cleanup()
+
+
+class TestAmazonUrlParser(TempDatabaseTestCase):
     """Test ASIN extraction from different Amazon URL formats"""
+
+    # Short links are memoized in SQLite (see database.save_short_links)
+    db_name = 'urls.db'
     
     def test_standard_url(self):
         url = "https://www.amazon.com/dp/B07PXGQC1Q/"
@@ -119,22 +208,64 @@ class TestGirlMathStatement(unittest.TestCase):
             self.skipTest("girl_math_statement function not available in app.py")
 
 
-class TestDatabaseFunctions(unittest.TestCase):
+class TestDealScoring(unittest.TestCase):
+    """Test the vectorized deal scoring against the scalar functions"""
+
+    def _assert_matches_scalar(self, current, peak, lowest):
+        scores = utils.score_deals(current, peak, lowest)
+        for i, (c, p, l) in enumerate(zip(current, peak, lowest)):
+            savings, percent = utils.girl_math_logic(c, p, l)
+            self.assertEqual(scores['savings'][i], savings, (c, p, l))
+            self.assertEqual(scores['percentage'][i], percent, (c, p, l))
+            self.assertEqual(utils.DEAL_TIERS[scores['tier'][i]], utils.deal_tier(c, l, percent), (c, p, l))
+
+    def test_matches_scalar_functions(self):
+        """Test random prices score exactly like girl_math_logic and deal_tier"""
+        rng = random.Random(23)
+        current, peak, lowest = [], [], []
+        for _ in range(2000):
+            p = round(rng.uniform(1, 400), 2)
+            l = round(p * rng.uniform(0.3, 1.0), 2)
+            current.append(round(rng.uniform(l * 0.9, p * 1.1), 2))
+            peak.append(p)
+            lowest.append(l)
+        self._assert_matches_scalar(current, peak, lowest)
+
+    def test_edge_cases(self):
+        """Test zero peaks, tier boundaries and prices above the peak"""
+        current = [10.0, 11.0, 70.0, 85.0, 120.0, 5.0, 0.0]
+        peak = [0.0, 100.0, 100.0, 100.0, 100.0, -1.0, 0.0]
+        lowest = [10.0, 10.0, 20.0, 20.0, 90.0, 5.0, 0.0]
+        self._assert_matches_scalar(current, peak, lowest)
+        tiers = [utils.DEAL_TIERS[t] for t in utils.score_deals(current, peak, lowest)['tier']]
+        self.assertEqual(tiers, ['near_low', 'near_low', 'great', 'good', 'justified', 'near_low', 'near_low'])
+
+    def test_frame_from_products_table(self):
+        """Test a pandas frame read from products scores like the separate arrays"""
+        import pandas as pd
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE TABLE products (asin TEXT, current_price REAL, peak_price REAL, lowest_price REAL)")
+        conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?)", [
+            ('B0DEAL0001', 80.0, 100.0, 75.0),
+            ('B0DEAL0002', 60.0, 100.0, 40.0),
+            ('B0DEAL0003', 99.0, 100.0, 50.0),
+        ])
+        frame = pd.read_sql_query("SELECT * FROM products", conn)
+        conn.close()
+
+        from_frame = utils.score_deals(frame)
+        from_arrays = utils.score_deals(frame['current_price'].tolist(), frame['peak_price'].tolist(),
+                                        frame['lowest_price'].tolist())
+        for key in ('savings', 'percentage', 'tier'):
+            np.testing.assert_array_equal(from_frame[key], from_arrays[key])
+        self.assertEqual(from_frame['tier'].tolist(), [0, 1, 3])
+
+
+class TestDatabaseFunctions(TempDatabaseTestCase):
     """Test database operations"""
-    
-    def setUp(self):
-        """Set up test database"""
-        # Use an in-memory database for testing
-        self.original_db_path = os.environ.get('DB_PATH', 'girlmath.db')
-        os.environ['DB_PATH'] = ':memory:'
-        init_db()
-    
-    def tearDown(self):
-        """Restore original database path"""
-        if self.original_db_path:
-            os.environ['DB_PATH'] = self.original_db_path
-        else:
-            del os.environ['DB_PATH']
+
+    # A scratch file, so the suite never touches the tracked girlmath.db
+    db_name = 'functions.db'
     
     def test_save_and_get_product(self):
         """Test saving and retrieving products"""
@@ -199,6 +330,1790 @@ class TestDatabaseFunctions(unittest.TestCase):
         self.assertFalse(is_favorite('B08TEST456'))
 
 
+class TestConnectionPool(TempDatabaseTestCase):
+    """Test the per-thread SQLite connection pool"""
+
+    db_name = 'pool.db'
+    init_schema = False
+    
+    def test_connection_reused_within_thread(self):
+        """Test that repeated calls on one thread share a connection"""
+        self.assertIs(database.get_connection(), database.get_connection())
+    
+    def test_connection_per_thread(self):
+        """Test that each thread gets its own connection"""
+        main_conn = database.get_connection()
+        other = []
+        thread = threading.Thread(target=lambda: other.append(database.get_connection()))
+        thread.start()
+        thread.join()
+        
+        self.assertIsNot(main_conn, other[0])
+        self.assertEqual(database.get_pool_stats()[database.DB_PATH], 2)
+    
+    def test_pragmas_applied(self):
+        """Test that pooled connections use WAL mode"""
+        mode = database.get_connection().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode.lower(), 'wal')
+    
+    def test_close_connections(self):
+        """Test that closing the pool hands out a fresh connection afterwards"""
+        conn = database.get_connection()
+        database.close_connections()
+        self.assertIsNot(conn, database.get_connection())
+        self.assertEqual(database.get_pool_stats()[database.DB_PATH], 1)
+
+
+class TestBatchUpsert(TempDatabaseTestCase):
+    """Test bulk product upserts"""
+
+    db_name = 'upsert.db'
+    
+    def _products(self, count, price):
+        for i in range(count):
+            yield {
+                'asin': f'B0UPSERT{i:02d}',
+                'title': f'Upsert Product {i}',
+                'current_price': price,
+                'peak_price': price + 10,
+                'lowest_price': price - 5,
+                'price_data': [price + 10, price],
+                'category': 'test'
+            }
+    
+    def test_save_products_from_generator(self):
+        """Test that a generator of products is saved in one call"""
+        stats = database.save_products(self._products(25, 20.0))
+        self.assertEqual(stats['rows'], 25)
+        self.assertGreater(stats['rows_per_sec'], 0)
+        self.assertEqual(get_product('B0UPSERT24')['current_price'], 20.0)
+    
+    def test_save_products_updates_existing(self):
+        """Test that re-saving updates prices but keeps the original category"""
+        database.save_products(self._products(3, 20.0))
+        updated = list(self._products(3, 15.0))
+        updated[0]['category'] = 'changed'
+        database.save_products(updated)
+        
+        product = get_product('B0UPSERT00')
+        self.assertEqual(product['current_price'], 15.0)
+        self.assertEqual(product['category'], 'test')
+
+
+class TestPriceHistory(TempDatabaseTestCase):
+    """Test the normalized price_points table and its query helpers"""
+
+    db_name = 'history.db'
+
+    def setUp(self):
+        super().setUp()
+        save_product({
+            'asin': 'B0HISTORY1',
+            'title': 'History Product',
+            'current_price': 80.0,
+            'peak_price': 120.0,
+            'lowest_price': 70.0,
+            'price_data': [100.0] * 50 + [120.0, 70.0] + [90.0] * 37 + [80.0],
+            'category': 'test'
+        })
+
+    def test_history_written_on_save(self):
+        """Test that saving a product stores one point per day ending today"""
+        history = database.get_price_history('B0HISTORY1')
+        self.assertEqual(len(history), 90)
+        self.assertEqual(history[-1], (datetime.now().date().isoformat(), 80.0))
+
+    def test_price_stats(self):
+        """Test min/max aggregates over all points and over a recent window"""
+        stats = database.get_price_stats('B0HISTORY1')
+        self.assertEqual(stats['min_price'], 70.0)
+        self.assertEqual(stats['max_price'], 120.0)
+        self.assertEqual(stats['count'], 90)
+
+        recent = database.get_price_stats('B0HISTORY1', days=10)
+        self.assertEqual(recent['max_price'], 90.0)
+        self.assertEqual(len(database.get_recent_prices('B0HISTORY1', days=10)), 11)
+
+    def test_summary_skips_history(self):
+        """Test that the product summary has prices but no price_data"""
+        summary = database.get_product_summary('B0HISTORY1')
+        self.assertEqual(summary['current_price'], 80.0)
+        self.assertNotIn('price_data', summary)
+
+    def test_migrate_json_history(self):
+        """Test that legacy JSON price_data is copied into price_points"""
+        conn = database.get_connection()
+        conn.execute('''
+        INSERT INTO products (asin, title, current_price, peak_price, lowest_price, price_data, updated_at)
+        VALUES ('B0LEGACY01', 'Legacy', 5.0, 6.0, 4.0, '[6.0, 4.0, 5.0]', '2025-04-28T10:00:00')
+        ''')
+        conn.commit()
+
+        self.assertEqual(database.migrate_price_history(), 1)
+        self.assertEqual(database.get_price_history('B0LEGACY01'),
+                         [('2025-04-26', 6.0), ('2025-04-27', 4.0), ('2025-04-28', 5.0)])
+        self.assertEqual(database.migrate_price_history(), 0)
+
+
+class TestPriceDataFormat(TempDatabaseTestCase):
+    """Test the compact price_data encodings and the JSON fallback"""
+
+    db_name = 'format.db'
+
+    def setUp(self):
+        self.original_format = database.PRICE_DATA_FORMAT
+        super().setUp()
+
+    def tearDown(self):
+        database.PRICE_DATA_FORMAT = self.original_format
+        super().tearDown()
+
+    def _product(self, asin, price_data):
+        return {
+            'asin': asin,
+            'title': f'Format {asin}',
+            'current_price': price_data[-1],
+            'peak_price': max(price_data),
+            'lowest_price': min(price_data),
+            'price_data': price_data,
+            'category': 'test'
+        }
+
+    def test_round_trip_every_format(self):
+        """Test each format reads back the exact cents that were saved"""
+        prices = [24.99, 21.5, 19.99, 1204.0, 0.01, 9999.99]
+        for fmt in ('json', 'cents', 'f32'):
+            database.PRICE_DATA_FORMAT = fmt
+            save_product(self._product(f'B0FMT{fmt.upper():0>5}', prices))
+            database.PRODUCT_CACHE.clear()
+            self.assertEqual(get_product(f'B0FMT{fmt.upper():0>5}')['price_data'], prices, fmt)
+
+    def test_binary_is_smaller_and_viewed_in_place(self):
+        """Test the BLOBs are compact and float32 decodes without a copy"""
+        prices = [round(20 + i * 0.37, 2) for i in range(90)]
+        json_size = len(database.encode_price_data(prices, 'json'))
+        cents = database.encode_price_data(prices, 'cents')
+        f32 = database.encode_price_data(prices, 'f32')
+
+        self.assertLess(len(cents), json_size / 3)
+        self.assertEqual(len(f32), 1 + 4 * 90)
+        array = database.decode_price_data(f32)
+        self.assertFalse(array.flags.writeable)
+        self.assertFalse(array.flags.owndata)
+
+    def test_large_price_jump_uses_wide_deltas(self):
+        """Test a change too big for int16 cents still round-trips"""
+        prices = [5.0, 1500.0, 4.99]
+        self.assertEqual(database.decode_price_data(database.encode_price_data(prices, 'cents')).tolist(), prices)
+
+    def test_convert_legacy_rows(self):
+        """Test JSON rows stay readable and convert_price_data rewrites them in place"""
+        database.PRICE_DATA_FORMAT = 'json'
+        database.save_products(self._product(f'B0CONV{i:04d}', [30.0, 25.5, 20.0 + i]) for i in range(7))
+
+        self.assertEqual(database.convert_price_data('cents', batch_size=3), 7)
+        stored = database.get_connection().execute(
+            "SELECT price_data FROM products WHERE asin='B0CONV0006'").fetchone()[0]
+        self.assertIsInstance(stored, bytes)
+        self.assertEqual(get_product('B0CONV0006')['price_data'], [30.0, 25.5, 26.0])
+        self.assertEqual(database.get_price_array('B0CONV0006').tolist(), [30.0, 25.5, 26.0])
+        with self.assertRaises(ValueError):
+            database.convert_price_data('zip')
+
+
+class TestPriceAggregates(TempDatabaseTestCase):
+    """Test the running price aggregates save_products keeps on products"""
+
+    db_name = 'aggregates.db'
+
+    def _save(self, asin, price_data):
+        database.save_products([{
+            'asin': asin,
+            'title': f'Aggregate {asin}',
+            'current_price': price_data[-1],
+            'peak_price': max(price_data),
+            'lowest_price': min(price_data),
+            'price_data': price_data,
+            'category': 'test'
+        }])
+
+    def _assert_matches_points(self, asin):
+        """The stored aggregates equal a recompute from price_points"""
+        conn = database.get_connection()
+        columns = ', '.join(database._AGGREGATE_NAMES)
+        stored = conn.execute(f"SELECT {columns} FROM products WHERE asin=?", (asin,)).fetchone()
+        with conn:
+            conn.execute(database._RECOMPUTE_AGGREGATES_SQL.format(where='asin = ?'), (asin,))
+        recomputed = conn.execute(f"SELECT {columns} FROM products WHERE asin=?", (asin,)).fetchone()
+        for name, value, expected in zip(database._AGGREGATE_NAMES, stored, recomputed):
+            if isinstance(expected, float):
+                self.assertAlmostEqual(value, expected, places=6, msg=name)
+            else:
+                self.assertEqual(value, expected, name)
+
+    def test_summary_matches_price_stats(self):
+        """Test get_price_summary agrees with a scan of the points after many re-saves"""
+        rng = random.Random(22)
+        prices = [round(rng.uniform(10, 50), 2) for _ in range(60)]
+        self._save('B0AGGR0001', prices)
+        for _ in range(25):
+            prices = list(prices)
+            for _ in range(rng.randint(1, 3)):
+                prices[rng.randrange(len(prices))] = round(rng.uniform(5, 55), 2)
+            self._save('B0AGGR0001', prices)
+            self._assert_matches_points('B0AGGR0001')
+
+        summary = database.get_price_summary('B0AGGR0001')
+        stats = database.get_price_stats('B0AGGR0001')
+        self.assertEqual(summary['count'], stats['count'])
+        self.assertEqual(summary['min_price'], stats['min_price'])
+        self.assertEqual(summary['max_price'], stats['max_price'])
+        self.assertAlmostEqual(summary['avg_price'], stats['avg_price'])
+        self.assertAlmostEqual(summary['stddev'], float(np.std(prices)))
+        self.assertEqual(summary['last_price'], prices[-1])
+
+    def test_raised_low_and_last_change(self):
+        """Test moving the lowest price up finds the next low, and flat tails keep the change date"""
+        self._save('B0AGGR0002', [30.0, 10.0, 20.0, 25.0, 25.0])
+        summary = database.get_price_summary('B0AGGR0002')
+        today = datetime.now().date()
+        self.assertEqual(summary['min_date'], (today - timedelta(days=3)).isoformat())
+        self.assertEqual(summary['days_since_low'], 3)
+        self.assertEqual(summary['last_change_date'], (today - timedelta(days=1)).isoformat())
+
+        self._save('B0AGGR0002', [30.0, 28.0, 20.0, 25.0, 25.0])
+        summary = database.get_price_summary('B0AGGR0002')
+        self.assertEqual(summary['min_price'], 20.0)
+        self.assertEqual(summary['min_date'], (today - timedelta(days=2)).isoformat())
+        self._assert_matches_points('B0AGGR0002')
+
+        self._save('B0AGGR0002', [30.0, 28.0, 20.0, 25.0, 25.0, 25.0][1:])
+        self._assert_matches_points('B0AGGR0002')
+
+    def test_unchanged_points_are_not_rewritten(self):
+        """Test a re-save only writes the points that moved"""
+        prices = [19.99, 21.5, 24.99] * 10
+        self._save('B0AGGR0003', prices)
+        conn = database.get_connection()
+
+        before = conn.total_changes
+        self._save('B0AGGR0003', prices)
+        self.assertEqual(conn.total_changes - before, 1)  # just the products row
+
+        before = conn.total_changes
+        self._save('B0AGGR0003', prices[:-2] + [18.0, 24.99])
+        self.assertEqual(conn.total_changes - before, 2)
+        self.assertEqual(database.get_price_summary('B0AGGR0003')['min_price'], 18.0)
+
+    def test_same_product_twice_in_one_batch(self):
+        """Test a product saved twice in one save_products call folds the second save into the first"""
+        first = [30.0, 20.0, 25.0]
+        database.save_products([
+            {'asin': 'B0AGGR0006', 'title': 'Twice', 'current_price': 25.0, 'peak_price': 30.0,
+             'lowest_price': 20.0, 'price_data': first},
+            {'asin': 'B0AGGR0006', 'title': 'Twice', 'current_price': 15.0, 'peak_price': 30.0,
+             'lowest_price': 15.0, 'price_data': first[:-1] + [15.0]},
+        ])
+        summary = database.get_price_summary('B0AGGR0006')
+        self.assertEqual((summary['count'], summary['min_price'], summary['last_price']), (3, 15.0, 15.0))
+        self._assert_matches_points('B0AGGR0006')
+
+    def test_numpy_price_data(self):
+        """Test a simulator history saves as an array, first time and again"""
+        histories = simulator.generate_price_histories(['B0AGGR0005'])
+        prices = histories.row('B0AGGR0005')
+        for _ in range(2):
+            self._save('B0AGGR0005', prices)
+        self.assertEqual(database.get_price_summary('B0AGGR0005')['count'], len(prices))
+        self.assertEqual(database.get_product('B0AGGR0005')['price_data'], prices.tolist())
+        self._assert_matches_points('B0AGGR0005')
+
+    def test_migrated_history_gets_aggregates(self):
+        """Test rows loaded around save_products get their aggregates from migrate_price_history"""
+        conn = database.get_connection()
+        with conn:
+            conn.execute('''
+            INSERT INTO products (asin, title, price_data, updated_at)
+            VALUES ('B0AGGR0004', 'Legacy', '[12.0, 9.5, 11.0]', ?)
+            ''', (datetime.now().isoformat(),))
+        self.assertIsNone(database.get_price_summary('B0AGGR0004'))
+
+        self.assertEqual(database.migrate_price_history(), 1)
+        summary = database.get_price_summary('B0AGGR0004')
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['min_price'], 9.5)
+        self.assertEqual(summary['last_price'], 11.0)
+
+
+class TestTopDeals(TempDatabaseTestCase):
+    """Test the deal_savings ranking behind get_top_deals"""
+
+    db_name = 'deals.db'
+
+    def setUp(self):
+        super().setUp()
+        database.save_products(self._product(*row) for row in [
+            ('B0DEAL0001', 80.0, 100.0, 'home'),
+            ('B0DEAL0002', 150.0, 300.0, 'tech'),
+            ('B0DEAL0003', 45.0, 50.0, 'home'),
+            ('B0DEAL0004', 120.0, 100.0, 'home'),  # above its peak
+            ('B0DEAL0005', 10.0, 90.0, 'beauty'),
+        ])
+
+    def _product(self, asin, current_price, peak_price, category):
+        return {
+            'asin': asin,
+            'title': f'Deal {asin}',
+            'current_price': current_price,
+            'peak_price': peak_price,
+            'lowest_price': current_price,
+            'price_data': [peak_price, current_price],
+            'category': category
+        }
+
+    def test_ranked_by_girl_math_savings(self):
+        """Test deals come back biggest savings first, matching girl_math_logic"""
+        deals = database.get_top_deals(10)
+        self.assertEqual([deal['asin'] for deal in deals], ['B0DEAL0002', 'B0DEAL0005', 'B0DEAL0001', 'B0DEAL0003'])
+        for deal in deals:
+            savings, _ = utils.girl_math_logic(deal['current_price'], deal['peak_price'], deal['lowest_price'])
+            self.assertEqual(deal['savings'], savings)
+        self.assertEqual(len(database.get_top_deals(2)), 2)
+
+    def test_category_and_resave(self):
+        """Test the category filter and that a new price moves a product in the ranking"""
+        self.assertEqual([deal['asin'] for deal in database.get_top_deals(10, category='home')],
+                         ['B0DEAL0001', 'B0DEAL0003'])
+
+        database.save_product(self._product('B0DEAL0003', 5.0, 50.0, 'home'))
+        self.assertEqual(database.get_top_deals(1, category='home')[0]['asin'], 'B0DEAL0003')
+        self.assertEqual(database.get_top_deals(10, category='garden'), [])
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Test that hot queries in database.py are served by indexes"""
+
+    def test_no_hot_full_scans(self):
+        """Test that the query plan audit finds no full table scans"""
+        import query_plan_audit
+        report = query_plan_audit.audit_queries()
+        failures = [entry['sql'] for entry in report if not entry['ok']]
+        self.assertEqual(failures, [])
+        self.assertIn('get_recent_searches', [entry['function'] for entry in report])
+
+    def test_full_scan_detection(self):
+        """Test the classification of EXPLAIN QUERY PLAN lines"""
+        import query_plan_audit
+        self.assertTrue(query_plan_audit.is_full_scan('SCAN favorites'))
+        self.assertFalse(query_plan_audit.is_full_scan('SEARCH favorites USING INDEX idx_favorites_asin (asin=?)'))
+
+        # An index scan is only bounded when a LIMIT stops it
+        recent = "SELECT * FROM search_history ORDER BY search_date DESC LIMIT 10"
+        self.assertFalse(query_plan_audit.is_full_scan('SCAN sh USING INDEX idx_search_history_date', recent))
+        self.assertTrue(query_plan_audit.is_full_scan('SCAN sh USING COVERING INDEX idx_search_history_date',
+                                                      "SELECT search_date FROM search_history"))
+
+        # asin IS NOT NULL plans as an open range over the whole index
+        candidates = "SELECT asin, COUNT(*) FROM search_history WHERE search_date >= ? AND asin IS NOT NULL GROUP BY asin"
+        self.assertTrue(query_plan_audit.is_full_scan(
+            'SEARCH search_history USING INDEX idx_search_history_asin (asin>?)', candidates))
+        self.assertFalse(query_plan_audit.is_full_scan(
+            'SEARCH search_history USING INDEX idx_search_history_date (search_date>?)', candidates))
+        self.assertFalse(query_plan_audit.is_full_scan(
+            'SEARCH price_points USING PRIMARY KEY (asin=? AND ts>?)', "SELECT * FROM price_points WHERE asin=? AND ts>?"))
+
+
+class TestSchemaMigrations(TempDatabaseTestCase):
+    """Test versioned schema initialization"""
+
+    db_name = 'schema.db'
+    init_schema = False
+
+    def test_fresh_database_reaches_current_version(self):
+        """Test that init_db applies every migration to a new database"""
+        init_db()
+        self.assertEqual(database.get_schema_version(), database.SCHEMA_VERSION)
+
+    def test_init_db_is_noop_when_current(self):
+        """Test that a second init_db runs no SQL at all"""
+        init_db()
+        statements = []
+        database.get_connection().set_trace_callback(statements.append)
+        init_db()
+        database.get_connection().set_trace_callback(None)
+        self.assertEqual(statements, [])
+
+    def test_legacy_database_is_upgraded(self):
+        """Test that an unversioned database from before user accounts is migrated"""
+        conn = database.get_connection()
+        conn.execute("CREATE TABLE favorites (id INTEGER PRIMARY KEY AUTOINCREMENT, asin TEXT, added_at TEXT, notes TEXT)")
+        conn.commit()
+
+        init_db()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(favorites)")]
+        self.assertIn('user_id', columns)
+        self.assertEqual(database.get_schema_version(), database.SCHEMA_VERSION)
+
+    def test_import_does_not_touch_database(self):
+        """Test that importing database.py doesn't create or open the database"""
+        import subprocess
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        subprocess.run([sys.executable, '-c', 'import database'], cwd=self.tmpdir.name, check=True,
+                       env={**os.environ, 'PYTHONPATH': package_dir})
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'girlmath.db')))
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test the bounded LRU/TTL cache"""
+
+    def test_set_after_invalidate_is_dropped(self):
+        """Test a read-through set is skipped if the cache was invalidated since its generation"""
+        cache = LRUCache()
+        generation = cache.generation()
+        cache.invalidate('a')
+        self.assertFalse(cache.set('a', 'old', generation=generation))
+        self.assertIs(cache.get('a'), MISSING)
+        self.assertTrue(cache.set('a', 'new', generation=cache.generation()))
+        self.assertEqual(cache.get('a'), 'new')
+
+    def test_evicts_least_recently_used(self):
+        """Test that the oldest untouched entry is evicted when full"""
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIs(cache.get('b'), MISSING)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_expire(self):
+        """Test that entries older than the TTL are treated as misses"""
+        now = [100.0]
+        cache = LRUCache(maxsize=10, ttl=5, clock=lambda: now[0])
+        cache.set('a', None)
+        self.assertIsNone(cache.get('a'))
+
+        now[0] += 6
+        self.assertIs(cache.get('a'), MISSING)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (1, 1, 1))
+
+
+class TestReadThroughCache(TempDatabaseTestCase):
+    """Test caching in front of get_product and is_favorite"""
+
+    db_name = 'cache.db'
+
+    def setUp(self):
+        super().setUp()
+        self.product = {
+            'asin': 'B0CACHE001',
+            'title': 'Cached Product',
+            'current_price': 10.0,
+            'peak_price': 12.0,
+            'lowest_price': 9.0,
+            'price_data': [12.0, 9.0, 10.0]
+        }
+        save_product(self.product)
+
+    def test_get_product_served_from_cache(self):
+        """Test that a repeat lookup is a cache hit and returns a fresh copy"""
+        first = get_product('B0CACHE001')
+        hits = database.PRODUCT_CACHE.hits
+        first['price_data'].append(1.0)
+
+        second = get_product('B0CACHE001')
+        self.assertEqual(database.PRODUCT_CACHE.hits, hits + 1)
+        self.assertEqual(second['price_data'], [12.0, 9.0, 10.0])
+
+    def test_save_invalidates_product(self):
+        """Test that saving a product drops the stale cached copy"""
+        get_product('B0CACHE001')
+        save_product({**self.product, 'current_price': 8.0})
+        self.assertEqual(get_product('B0CACHE001')['current_price'], 8.0)
+
+    def test_read_racing_a_save_is_not_cached(self):
+        """Test a row read before a concurrent save commits never outlives that save in the cache"""
+        load = database._load_product
+
+        def load_then_save(asin):
+            old = load(asin)
+            save_product({**self.product, 'current_price': 7.0})  # commits while the reader holds the old row
+            return old
+
+        with mock.patch.object(database, '_load_product', load_then_save):
+            self.assertEqual(get_product('B0CACHE001')['current_price'], 10.0)
+        self.assertEqual(get_product('B0CACHE001')['current_price'], 7.0)
+        self.assertGreater(database.PRODUCT_CACHE.stats()['stale_sets'], 0)
+
+    def test_toggle_invalidates_favorite(self):
+        """Test that toggling a favorite is visible through the cache"""
+        self.assertFalse(is_favorite('B0CACHE001'))
+        toggle_favorite('B0CACHE001')
+        self.assertTrue(is_favorite('B0CACHE001'))
+        self.assertIn('favorites', database.get_cache_stats())
+
+
+class TestHttpClient(unittest.TestCase):
+    """Test the shared HTTP session"""
+
+    def setUp(self):
+        self.original_config = dict(http_client.HTTP_CONFIG)
+        http_client.configure(backoff_factor=0)
+        http_client.reset_host_stats()
+
+    def tearDown(self):
+        http_client.configure(**self.original_config)
+        http_client.reset_host_stats()
+
+    def test_retries_retryable_status(self):
+        """Test that a 503 is retried and the eventual 200 is returned"""
+        server = ScriptedServer([(503, {}, b'busy'), (200, {}, b'ok')])
+        try:
+            response = http_client.get(server.url + '/item')
+        finally:
+            server.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_retry_after_is_capped(self):
+        """Test that a long Retry-After is cut to max_retry_after instead of blocking the thread"""
+        http_client.configure(max_retry_after=0.1)
+        server = ScriptedServer([(503, {'Retry-After': '600'}, b'busy'), (200, {}, b'ok')])
+        try:
+            start = time.perf_counter()
+            response = http_client.get(server.url + '/item')
+            elapsed = time.perf_counter() - start
+        finally:
+            server.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(server.requests), 2)
+        self.assertLess(elapsed, 2)
+
+    def test_session_is_shared_and_stats_recorded(self):
+        """Test that calls reuse one session and record per-host latency"""
+        server = ScriptedServer([(200, {}, b'ok')])
+        try:
+            session = http_client.get_session()
+            http_client.get(server.url + '/a')
+            http_client.head(server.url + '/b')
+            self.assertIs(http_client.get_session(), session)
+        finally:
+            server.close()
+
+        stats = http_client.get_host_stats()['127.0.0.1']
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['errors'], 0)
+        self.assertGreaterEqual(stats['p95_ms'], stats['p50_ms'])
+
+    def test_configure_rejects_unknown_option(self):
+        """Test that typos in configure() fail loudly"""
+        with self.assertRaises(ValueError):
+            http_client.configure(retry=3)
+
+
+class TestCircuitBreakers(unittest.TestCase):
+    """Test the per-host circuit breakers and adaptive timeouts"""
+
+    def setUp(self):
+        self.original_config = dict(http_client.HTTP_CONFIG)
+        http_client.configure(backoff_factor=0, retries=0, breaker_failures=2, breaker_reset=60)
+        http_client.reset_host_stats()
+        http_client.reset_breakers()
+
+    def tearDown(self):
+        http_client.configure(**self.original_config)
+        http_client.reset_host_stats()
+        http_client.reset_breakers()
+
+    def test_breaker_opens_and_skips_host(self):
+        """Test consecutive 503s open the breaker and later calls never reach the server"""
+        server = ScriptedServer([(503, {}, b'busy')])
+        try:
+            http_client.get(server.url + '/a')
+            http_client.get(server.url + '/b')
+            with self.assertRaises(http_client.CircuitOpenError):
+                http_client.get(server.url + '/c')
+        finally:
+            server.close()
+
+        self.assertEqual(len(server.requests), 2)
+        stats = http_client.get_breaker_stats()['127.0.0.1']
+        self.assertEqual(stats['state'], 'open')
+        self.assertEqual(stats['rejections'], 1)
+        self.assertEqual(stats['transitions'], {'closed->open': 1})
+
+    def test_captcha_page_counts_as_failure(self):
+        """Test a 200 captcha page counts against the breaker and a real page closes it"""
+        captcha = b'<html><form action="/errors/validateCaptcha"></form></html>'
+        server = ScriptedServer([(200, {}, captcha), (200, {}, b'<html>ok</html>')])
+        try:
+            http_client.get(server.url + '/a')
+            self.assertEqual(http_client.get_breaker_stats()['127.0.0.1']['consecutive_failures'], 1)
+            http_client.get(server.url + '/b')
+        finally:
+            server.close()
+
+        self.assertEqual(http_client.get_breaker_stats()['127.0.0.1']['consecutive_failures'], 0)
+
+    def test_half_open_probe_closes_breaker(self):
+        """Test the first call after reset_after is let through and its success closes the breaker"""
+        breaker = http_client.get_breaker('127.0.0.1')
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.reset_after = 0
+        server = ScriptedServer([(200, {}, b'ok')])
+        try:
+            response = http_client.get(server.url + '/probe')
+        finally:
+            server.close()
+
+        self.assertEqual(response.status_code, 200)
+        stats = http_client.get_breaker_stats()['127.0.0.1']
+        self.assertEqual(stats['state'], 'closed')
+        self.assertEqual(stats['transitions'], {'closed->open': 1, 'open->half_open': 1, 'half_open->closed': 1})
+
+    def test_open_breaker_serves_stale_cache(self):
+        """Test a stale cached page is served instead of an error while the host's breaker is open"""
+        original_path = response_cache.CACHE_PATH
+        tmpdir = tempfile.TemporaryDirectory()
+        response_cache.CACHE_PATH = os.path.join(tmpdir.name, 'http_cache.db')
+        try:
+            url = 'https://www.walmart.com/search?q=stale'
+            response_cache.store(url, None, 200, b'old page', ttl=-1)
+            breaker = http_client.get_breaker('www.walmart.com')
+            breaker.record_failure()
+            breaker.record_failure()
+            with mock.patch.object(http_client, 'get_session', side_effect=AssertionError('network used')):
+                response = response_cache.cached_get(url)
+        finally:
+            response_cache.close()
+            response_cache.CACHE_PATH = original_path
+            tmpdir.cleanup()
+
+        self.assertEqual(response.content, b'old page')
+
+    def test_adaptive_timeout_follows_p95(self):
+        """Test the timeout shrinks to a multiple of the host's p95 but never grows past the caller's"""
+        self.assertEqual(http_client.adaptive_timeout('fast.example', 10), 10)
+        for _ in range(http_client.HTTP_CONFIG['adaptive_min_samples']):
+            http_client._record('fast.example', 1.0, error=False)
+            http_client._record('slow.example', 9.0, error=False)
+
+        self.assertEqual(http_client.adaptive_timeout('fast.example', 10), 1.0 * http_client.HTTP_CONFIG['timeout_p95_factor'])
+        self.assertEqual(http_client.adaptive_timeout('slow.example', 10), 10)
+        self.assertEqual(http_client.adaptive_timeout('fast.example', (3, 10)), (3, 10))
+
+
+class TestLookupPipeline(unittest.TestCase):
+    """Test the concurrent Amazon/Walmart lookup orchestrator"""
+
+    def fake_amazon(self, delay):
+        def fetch(api, asin, demo_mode=False):
+            time.sleep(delay)
+            return {'asin': asin, 'title': f'Title {asin}', 'current_price': 10.0}
+        return fetch
+
+    def fake_walmart(self, delay):
+        def search(title):
+            time.sleep(delay)
+            return f'$9.99 for {title}'
+        return search
+
+    def test_first_lookup_searches_walmart_with_amazon_title(self):
+        """Test that Walmart is searched with the title Amazon returned"""
+        with mock.patch.object(utils, 'get_amazon_product_info', self.fake_amazon(0)), \
+             mock.patch.object(utils, 'search_walmart', self.fake_walmart(0)), \
+             mock.patch.object(database, 'get_product_summary', return_value=None):
+            result = pipeline.lookup_product('https://www.amazon.com/dp/B0PIPE0001')
+
+        self.assertEqual(result['asin'], 'B0PIPE0001')
+        self.assertEqual(result['walmart'], '$9.99 for Title B0PIPE0001')
+        self.assertEqual(result['timed_out'], [])
+
+    def test_known_title_fetches_concurrently(self):
+        """Test that a saved title lets Amazon and Walmart run side by side"""
+        with mock.patch.object(utils, 'get_amazon_product_info', self.fake_amazon(0.3)), \
+             mock.patch.object(utils, 'search_walmart', self.fake_walmart(0.3)), \
+             mock.patch.object(database, 'get_product_summary', return_value={'title': 'Saved title'}):
+            result = pipeline.lookup_product('B0PIPE0002')
+
+        self.assertEqual(result['walmart'], '$9.99 for Saved title')
+        self.assertLess(result['elapsed'], 0.55)
+
+    def test_deadline_returns_partial_results(self):
+        """Test that a slow retailer is cut off at the deadline"""
+        with mock.patch.object(utils, 'get_amazon_product_info', self.fake_amazon(0)), \
+             mock.patch.object(utils, 'search_walmart', self.fake_walmart(1.0)), \
+             mock.patch.object(database, 'get_product_summary', return_value=None):
+            start = time.perf_counter()
+            result = pipeline.lookup_product('B0PIPE0003', deadline=0.2)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(result['product']['title'], 'Title B0PIPE0003')
+        self.assertEqual(result['timed_out'], ['walmart'])
+        self.assertLess(elapsed, 0.6)
+
+    def test_slow_database_read_respects_deadline(self):
+        """Test that a locked database can't hold the lookup past its deadline"""
+        def locked_summary(asin):
+            time.sleep(1.0)
+            return {'title': 'Saved title'}
+
+        with mock.patch.object(utils, 'get_amazon_product_info', self.fake_amazon(0)), \
+             mock.patch.object(utils, 'search_walmart', self.fake_walmart(0)), \
+             mock.patch.object(database, 'get_product_summary', locked_summary):
+            start = time.perf_counter()
+            result = pipeline.lookup_product('B0PIPE0004', deadline=0.2)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(result['product']['title'], 'Title B0PIPE0004')
+        self.assertNotIn('amazon', result['timed_out'])
+        self.assertLess(elapsed, 0.6)
+
+    def test_batch_concurrency_is_bounded(self):
+        """Test that batch mode never runs more lookups than allowed"""
+        active = []
+        peak = [0]
+        lock = threading.Lock()
+
+        def fetch(api, asin, demo_mode=False):
+            with lock:
+                active.append(asin)
+                peak[0] = max(peak[0], len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(asin)
+            return {'asin': asin, 'title': asin}
+
+        asins = [f'B0BATCH{i:03d}' for i in range(6)]
+        with mock.patch.object(utils, 'get_amazon_product_info', fetch), \
+             mock.patch.object(utils, 'search_walmart', self.fake_walmart(0)), \
+             mock.patch.object(database, 'get_product_summary', return_value=None):
+            results = pipeline.lookup_many(asins, concurrency=2)
+
+        self.assertEqual([r['asin'] for r in results], asins)
+        self.assertLessEqual(peak[0], 2)
+
+
+class TestStaleWhileRevalidate(TempDatabaseTestCase):
+    """Test stale-while-revalidate lookups and single-flight refreshes"""
+
+    db_name = 'swr.db'
+
+    def setUp(self):
+        super().setUp()
+        self.fetches = []
+
+    def fake_amazon(self, price, delay=0):
+        def fetch(api, asin, demo_mode=False, enrich_title=True):
+            self.fetches.append(asin)
+            time.sleep(delay)
+            return {'asin': asin, 'title': f'Title {asin}', 'current_price': price, 'peak_price': price,
+                    'lowest_price': price, 'price_data': [price], 'demo': False}
+        return fetch
+
+    def _backdate(self, asin, seconds):
+        conn = database.get_connection()
+        with conn:
+            conn.execute("UPDATE products SET updated_at=? WHERE asin=?",
+                         ((datetime.now() - timedelta(seconds=seconds)).isoformat(), asin))
+
+    def test_miss_scrapes_then_fresh_row_is_served(self):
+        """Test the first lookup scrapes and saves, and the next one is served from SQLite"""
+        with mock.patch.object(utils, 'get_amazon_product_info', self.fake_amazon(10.0)), \
+             mock.patch.object(utils, 'search_walmart', return_value=None):
+            first = pipeline.lookup_product('B0SWR00001', max_age=60)
+            second = pipeline.lookup_product('B0SWR00001', max_age=60)
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertFalse(second['refreshing'])
+        self.assertEqual(second['product']['current_price'], 10.0)
+        self.assertEqual(self.fetches, ['B0SWR00001'])
+
+    def test_stale_row_served_and_refreshed_once(self):
+        """Test a stale row comes back at once while one shared background refresh updates it"""
+        database.save_product(self.fake_amazon(10.0)(None, 'B0SWR00002'))
+        self._backdate('B0SWR00002', 3600)
+        self.fetches.clear()
+
+        with mock.patch.object(utils, 'get_amazon_product_info', self.fake_amazon(8.0, delay=0.5)):
+            results = pipeline.lookup_many(['B0SWR00002'] * 4, concurrency=4, max_age=60)
+            pipeline.refresh_product('B0SWR00002').result(timeout=5)
+
+        self.assertTrue(all(result['cached'] and result['refreshing'] for result in results))
+        self.assertEqual(results[0]['product']['current_price'], 10.0)
+        self.assertEqual(self.fetches, ['B0SWR00002'])
+        self.assertEqual(database.get_product('B0SWR00002')['current_price'], 8.0)
+
+    def test_batch_save_skips_cached_and_demo_products(self):
+        """Test save=True leaves rows served from SQLite alone and never saves demo data"""
+        database.save_product({'asin': 'B0SWR00003', 'title': 'Saved', 'current_price': 3.0, 'peak_price': 3.0,
+                               'lowest_price': 1.0, 'price_data': [1.0, 2.0, 3.0]})
+        self._backdate('B0SWR00003', 30)
+        before = database.get_product_summary('B0SWR00003')['updated_at']
+
+        def demo(api, asin, demo_mode=False, enrich_title=True):
+            return {'asin': asin, 'title': 'Demo', 'current_price': 5.0, 'peak_price': 5.0,
+                    'lowest_price': 5.0, 'price_data': [5.0], 'demo': True}
+
+        with mock.patch.object(utils, 'get_amazon_product_info', demo), \
+             mock.patch.object(utils, 'search_walmart', return_value=None):
+            results = pipeline.lookup_many(['B0SWR00003', 'B0SWR00004'], save=True, max_age=3600)
+
+        self.assertTrue(results[0]['cached'])
+        self.assertEqual(database.get_product_summary('B0SWR00003')['updated_at'], before)
+        self.assertEqual(database.get_price_summary('B0SWR00003')['count'], 3)
+        self.assertIsNone(database.get_product('B0SWR00004'))
+
+    def test_single_flight_shares_result_and_errors(self):
+        """Test concurrent callers for one key share a single call, including its exception"""
+        flight = SingleFlight()
+        calls = []
+        gate = threading.Event()
+
+        def slow(value):
+            calls.append(value)
+            gate.wait(1)
+            return value * 2
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', slow, 21))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        gate.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(calls, [21])
+        self.assertFalse(flight.in_flight('k'))
+        with self.assertRaises(ZeroDivisionError):
+            flight.do('k', lambda: 1 / 0)
+
+
+class TestRequestCoalescing(unittest.TestCase):
+    """Test that concurrent lookups of one ASIN or search share a single fetch"""
+
+    def setUp(self):
+        for flight in (utils.AMAZON_FLIGHT, utils.SEARCH_FLIGHT, utils.SHORT_LINK_FLIGHT):
+            flight.reset_stats()
+
+    def _run_concurrently(self, func, count):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(func())) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_same_asin_scraped_once(self):
+        """Test eight sessions pasting one link trigger one scrape and each get their own copy"""
+        calls = []
+
+        def scrape(api, asin, demo_mode=False, enrich_title=True):
+            calls.append(asin)
+            time.sleep(0.2)
+            return {'asin': asin, 'title': 'Viral Gloss', 'current_price': 9.0, 'price_data': [10.0, 9.0]}
+
+        with mock.patch.object(utils, '_get_amazon_product_info', scrape):
+            results = self._run_concurrently(lambda: utils.get_amazon_product_info(None, 'B0VIRAL001'), 8)
+
+        self.assertEqual(calls, ['B0VIRAL001'])
+        self.assertEqual([result['title'] for result in results], ['Viral Gloss'] * 8)
+        results[0]['price_data'].append(1.0)
+        self.assertEqual(results[1]['price_data'], [10.0, 9.0])
+        stats = utils.get_coalescing_stats()['amazon']
+        self.assertEqual((stats['requests'], stats['executions'], stats['coalesced']), (8, 1, 7))
+
+    def test_same_walmart_query_fetched_once(self):
+        """Test concurrent searches for one title share one search page fetch"""
+        calls = []
+
+        def fetch(url, parser, headers, timeout):
+            calls.append(url)
+            time.sleep(0.2)
+            return {'title': 'Gloss', 'price': 7.5, 'url': 'https://www.walmart.com/ip/1'}
+
+        with mock.patch.object(utils, '_fetch_search_result', fetch):
+            results = self._run_concurrently(lambda: utils.search_walmart('Viral Gloss'), 5)
+            other = utils.search_walmart('Something Else')
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([result['price'] for result in results], [7.5] * 5)
+        self.assertEqual(other['price'], 7.5)
+        self.assertEqual(utils.get_coalescing_stats()['search']['coalesced'], 4)
+
+    def test_sequential_calls_are_not_cached(self):
+        """Test coalescing only joins calls in flight; a later call fetches again"""
+        with mock.patch.object(utils, '_get_amazon_product_info', return_value={'asin': 'B0SEQ00001'}) as scrape:
+            utils.get_amazon_product_info(None, 'B0SEQ00001')
+            utils.get_amazon_product_info(None, 'B0SEQ00001')
+
+        self.assertEqual(scrape.call_count, 2)
+        self.assertEqual(utils.get_coalescing_stats()['amazon']['coalesced'], 0)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test the on-disk HTTP response cache"""
+
+    def setUp(self):
+        self.original_path = response_cache.CACHE_PATH
+        self.original_offline = response_cache.OFFLINE
+        self.tmpdir = tempfile.TemporaryDirectory()
+        response_cache.CACHE_PATH = os.path.join(self.tmpdir.name, 'http_cache.db')
+        response_cache.set_offline(False)
+
+    def tearDown(self):
+        response_cache.close()
+        response_cache.CACHE_PATH = self.original_path
+        response_cache.set_offline(self.original_offline)
+        self.tmpdir.cleanup()
+
+    def test_fresh_entry_served_without_request(self):
+        """Test that a second GET within the TTL never reaches the server"""
+        server = ScriptedServer([(200, {'Content-Type': 'text/html'}, b'<html>page</html>')])
+        try:
+            first = response_cache.cached_get(server.url + '/dp/B0CACHED01')
+            second = response_cache.cached_get(server.url + '/dp/B0CACHED01')
+        finally:
+            server.close()
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.text, '<html>page</html>')
+
+    def test_stale_entry_revalidated_with_etag(self):
+        """Test that a stale entry sends If-None-Match and reuses the body on 304"""
+        server = ScriptedServer([
+            (200, {'ETag': '"v1"'}, b'original body'),
+            (304, {'ETag': '"v1"'}, b''),
+        ])
+        url = server.url + '/search?q=lipgloss'
+        try:
+            response_cache.cached_get(url)
+            response_cache.store(url, None, 200, b'original body', {'ETag': '"v1"'}, ttl=-1)
+            revalidated = response_cache.cached_get(url)
+        finally:
+            server.close()
+
+        self.assertEqual(server.requests[-1][2].get('If-None-Match'), '"v1"')
+        self.assertEqual(revalidated.content, b'original body')
+        self.assertTrue(response_cache.lookup(url)['fresh'])
+
+    def test_lowercase_response_headers(self):
+        """Test that lowercase etag/last-modified/content-type are stored and used to revalidate"""
+        headers = {'etag': '"v2"', 'last-modified': 'Wed, 01 Jan 2025 00:00:00 GMT',
+                   'content-type': 'text/html; charset=latin-1'}
+        server = ScriptedServer([(200, headers, b'caf\xe9'), (304, {'etag': '"v2"'}, b'')])
+        url = server.url + '/dp/B0LOWER001'
+        try:
+            response_cache.cached_get(url)
+            entry = response_cache.lookup(url)
+            conn = response_cache._get_connection()
+            conn.execute("UPDATE responses SET expires_at=0")
+            conn.commit()
+            revalidated = response_cache.cached_get(url)
+        finally:
+            server.close()
+
+        self.assertEqual(entry['etag'], '"v2"')
+        self.assertEqual(entry['last_modified'], 'Wed, 01 Jan 2025 00:00:00 GMT')
+        self.assertEqual(entry['response'].headers['Content-Type'], 'text/html; charset=latin-1')
+        self.assertEqual(server.requests[-1][2].get('If-None-Match'), '"v2"')
+        self.assertEqual(server.requests[-1][2].get('If-Modified-Since'), 'Wed, 01 Jan 2025 00:00:00 GMT')
+        self.assertTrue(revalidated.from_cache)
+        self.assertEqual(revalidated.text, 'café')
+
+    def test_size_cap_evicts_least_recently_used(self):
+        """Test that the oldest entries go once the cache exceeds its cap"""
+        original_max = response_cache.MAX_CACHE_BYTES
+        response_cache.MAX_CACHE_BYTES = 3000
+        try:
+            for i in range(5):
+                response_cache.store(f'https://example.com/{i}', None, 200, os.urandom(1000))
+        finally:
+            response_cache.MAX_CACHE_BYTES = original_max
+
+        self.assertIsNone(response_cache.lookup('https://example.com/0'))
+        self.assertIsNotNone(response_cache.lookup('https://example.com/4'))
+
+    def test_hits_only_restamp_old_entries(self):
+        """Test that a hit writes last_access only once ACCESS_UPDATE_INTERVAL has passed"""
+        url = 'https://example.com/hot'
+        response_cache.store(url, None, 200, b'hot page')
+        conn = response_cache._get_connection()
+        writes = conn.total_changes
+
+        for _ in range(10):
+            response_cache.lookup(url)
+        self.assertEqual(conn.total_changes, writes)
+
+        conn.execute("UPDATE responses SET last_access=last_access-?", (response_cache.ACCESS_UPDATE_INTERVAL,))
+        conn.commit()
+        writes = conn.total_changes
+        response_cache.lookup(url)
+        self.assertEqual(conn.total_changes, writes + 1)
+
+    def test_offline_replay_of_amazon_page(self):
+        """Test that a cached Amazon page is scraped with no network at all"""
+        html = (b'<html><body><span id="productTitle"> Cached Lip Gloss </span>'
+                b'<span class="a-price"><span class="a-offscreen">$12.50</span></span></body></html>')
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Language': 'en-US,en;q=0.9',
+        }
+        response_cache.store('https://www.amazon.com/dp/B0OFFLINE1', headers, 200, html,
+                             {'Content-Type': 'text/html; charset=utf-8'})
+        response_cache.set_offline(True)
+
+        with mock.patch.object(http_client, 'request', side_effect=AssertionError('network used')):
+            product = utils.get_amazon_product_info(None, 'B0OFFLINE1')
+            missing = response_cache.cached_get('https://www.walmart.com/search?q=nothing')
+
+        self.assertEqual(product['title'], 'Cached Lip Gloss')
+        self.assertEqual(product['current_price'], 12.5)
+        self.assertFalse(product['demo'])
+        self.assertEqual(missing.status_code, 504)
+
+
+class TestShortLinks(TempDatabaseTestCase):
+    """Test memoized a.co short link resolution"""
+
+    db_name = 'links.db'
+
+    def setUp(self):
+        super().setUp()
+        utils.SHORT_LINK_CACHE.clear()
+        self.followed = []
+
+    def tearDown(self):
+        utils.SHORT_LINK_CACHE.clear()
+        super().tearDown()
+
+    def follow(self, short_code):
+        self.followed.append(short_code)
+        if short_code.startswith('dead'):
+            raise ConnectionError('no route')
+        return f'B0{short_code.upper():0>8}'[:10]
+
+    def test_repeated_paste_skips_network(self):
+        """Test that the same short link is only followed once"""
+        with mock.patch.object(utils, '_follow_short_link', self.follow):
+            first = utils.extract_asin('https://a.co/d/8iGnbpL')
+            second = utils.extract_asin('https://a.co/d/8iGnbpL')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.followed, ['8iGnbpL'])
+
+    def test_mapping_persists_across_processes(self):
+        """Test that a cold in-process cache is filled from the short_links table"""
+        with mock.patch.object(utils, '_follow_short_link', self.follow):
+            asin = utils.resolve_short_link('abc1234')
+            utils.SHORT_LINK_CACHE.clear()
+            self.assertEqual(utils.resolve_short_link('abc1234'), asin)
+
+        self.assertEqual(self.followed, ['abc1234'])
+        self.assertEqual(database.get_short_links(['abc1234'])['abc1234'][0], asin)
+
+    def test_failures_are_negatively_cached(self):
+        """Test that a dead link falls back to the short code without retrying"""
+        with mock.patch.object(utils, '_follow_short_link', self.follow):
+            self.assertEqual(utils.extract_asin('https://a.co/d/dead123'), 'dead123')
+            utils.SHORT_LINK_CACHE.clear()
+            self.assertEqual(utils.extract_asin('https://a.co/d/dead123'), 'dead123')
+
+        self.assertEqual(self.followed, ['dead123'])
+
+    def test_bulk_resolve_follows_unknown_codes_concurrently(self):
+        """Test that bulk resolution follows each new code once, in parallel"""
+        barrier = threading.Barrier(3, timeout=2)
+
+        def follow(short_code):
+            barrier.wait()
+            return self.follow(short_code)
+
+        with mock.patch.object(utils, '_follow_short_link', self.follow):
+            utils.resolve_short_link('known01')
+        with mock.patch.object(utils, '_follow_short_link', follow):
+            results = utils.resolve_short_links(['known01', 'new0001', 'new0002', 'new0003', 'new0001'])
+
+        self.assertEqual(list(results), ['known01', 'new0001', 'new0002', 'new0003'])
+        self.assertEqual(sorted(self.followed), ['known01', 'new0001', 'new0002', 'new0003'])
+
+
+class TestAsinExtractor(unittest.TestCase):
+    """Test the precompiled extractor against the old pattern loop"""
+
+    EDGE_CASES = [
+        "https://www.amazon.com/ABCDEFGHIJ/dp/B0DPFIRST1/",  # /dp/ beats the loose pattern
+        "https://www.amazon.com/gp/product/B0GPPROD01/dp/B0DPLATER1",  # ...and /gp/product/ before it
+        "https://www.amazon.com/dp/SHORT/ASIN/B0ASINPTH1",
+        "https://www.amazon.com/dp/B0_UNDER_1/",  # underscores are word characters
+        "https://www.amazon.com/dp/B0DPSHORT",  # too short for /dp/, caught by nothing else
+        "https://www.amazon.com/gp/aw/d/B0MOBILE01?th=1",
+        "https://example.com/item?id=B0QUERY001&x=1",
+        "https://example.com",
+        "",
+    ]
+
+    def test_matches_legacy_extractor(self):
+        """Test that every URL gets exactly the ASIN the old loop returned"""
+        urls = self.EDGE_CASES + benchmarks.url_corpus(2000)
+        for url in urls:
+            self.assertEqual(utils.extract_asin(url), benchmarks._legacy_extract_asin(url), url)
+
+    def test_batch_keeps_order_and_dedupes(self):
+        """Test that extract_asins lines up with its input and parses each URL once"""
+        urls = ["https://www.amazon.com/dp/B0REPEAT01", "https://example.com",
+                "https://www.amazon.com/dp/B0REPEAT01", None]
+        with mock.patch.object(utils, '_extract_long_asin', wraps=utils._extract_long_asin) as parse:
+            asins = utils.extract_asins(urls)
+
+        self.assertEqual(asins, ["B0REPEAT01", None, "B0REPEAT01", None])
+        self.assertEqual(parse.call_count, 2)
+
+    def test_batch_resolves_short_links_together(self):
+        """Test that a batch's short links go through one resolve_short_links call"""
+        urls = ["https://a.co/d/aaaaaaa", "https://www.amazon.com/dp/B0LONGURL1", "https://a.co/d/bbbbbbb"]
+        with mock.patch.object(utils, 'resolve_short_links',
+                               return_value={'aaaaaaa': 'B0RESOLVED', 'bbbbbbb': None}) as resolve:
+            asins = utils.extract_asins(urls)
+
+        resolve.assert_called_once()
+        self.assertEqual(asins, ["B0RESOLVED", "B0LONGURL1", "bbbbbbb"])
+
+
+class TestPriceSimulator(unittest.TestCase):
+    """Test the vectorized demo price history generator"""
+
+    def test_rows_depend_only_on_asin(self):
+        """Test that an ASIN gets the same history alone or in any batch"""
+        alone = simulator.generate_price_histories(['B08N5KWB9H'])
+        batch = simulator.generate_price_histories(['B4BEAUTY01', 'B08N5KWB9H', 'B7FASHION1'])
+
+        self.assertTrue(np.array_equal(alone.row('B08N5KWB9H'), batch.row('B08N5KWB9H')))
+        self.assertFalse(np.array_equal(batch.row('B4BEAUTY01')[:10], batch.row('B7FASHION1')[:10]))
+
+    def test_matrix_shape_and_price_model(self):
+        """Test the batch shape, summary vectors and the price floor"""
+        asins = [f'B3SIM{i:05d}' for i in range(500)]
+        histories = simulator.generate_price_histories(asins, days=60)
+
+        self.assertEqual(histories.prices.shape, (500, 60))
+        self.assertEqual(set(histories.categories), {'beauty'})
+        self.assertTrue(np.array_equal(histories.peak, histories.prices.max(axis=1)))
+        floor = np.round(histories.base_prices * 0.7 * 0.9, 2) - 0.01
+        self.assertTrue((histories.prices >= floor[:, None]).all())
+        self.assertTrue(((histories.base_prices >= 15) & (histories.base_prices <= 80)).all())
+
+    def test_products_feed_save_products(self):
+        """Test that products() yields rows save_products accepts"""
+        products = list(simulator.generate_price_histories(['B0SIMSAVE1']).products({'B0SIMSAVE1': 'Sim Gloss'}))
+
+        self.assertEqual(products[0]['title'], 'Sim Gloss')
+        self.assertEqual(len(products[0]['price_data']), simulator.DEFAULT_DAYS)
+        self.assertEqual(products[0]['current_price'], products[0]['price_data'][-1])
+
+    def test_demo_mode_is_reproducible(self):
+        """Test that demo mode gives the same prices for the same ASIN every time"""
+        with mock.patch.object(response_cache, 'cached_get', side_effect=ConnectionError('offline')):
+            product1 = utils.get_amazon_product_info(None, 'B08N5KWB9H', demo_mode=True)
+            product2 = utils.get_amazon_product_info(None, 'B08N5KWB9H', demo_mode=True)
+
+        self.assertEqual(product1['price_data'], product2['price_data'])
+        self.assertEqual(product1['current_price'], product1['price_data'][-1])
+
+
+class TestOfflineSimulator(unittest.TestCase):
+    """Test that simulated products never touch the network"""
+
+    def setUp(self):
+        patcher = mock.patch.object(response_cache, 'cached_get', side_effect=AssertionError('network used'))
+        self.cached_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_simulate_products_is_pure(self):
+        """Test that thousands of products are simulated quickly with no I/O"""
+        asins = [f'B7OFF{i:05d}' for i in range(5000)]
+        start = time.perf_counter()
+        products = list(simulator.simulate_products(asins))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(products), 5000)
+        self.assertEqual(products[0]['category'], 'fashion')
+        self.assertIn(products[0]['title'], [t.format(asin=asins[0]) for t in simulator.TITLE_CATALOG['fashion']])
+        self.assertLess(elapsed, 5)
+        self.cached_get.assert_not_called()
+
+    def test_titles_are_deterministic(self):
+        """Test that the same ASIN always gets the same catalog title"""
+        first = simulator.simulate_product('B4TITLE001')
+        second = simulator.simulate_product('B4TITLE001')
+
+        self.assertEqual(first['title'], second['title'])
+        self.assertEqual(first['price_data'], second['price_data'])
+
+    def test_short_codes_get_their_own_catalog(self):
+        """Test the gaming laptop short code is gaming, and other short codes get tech titles"""
+        self.assertEqual(simulator.infer_category('7D2K2Wr'), 'gaming')
+        self.assertEqual(simulator.infer_category('8iGnbpL'), 'tech')
+
+        product = simulator.simulate_product('8iGnbpL')
+        self.assertIn(product['title'], [t.format(asin='8iGnbpL') for t in simulator.TITLE_CATALOG['tech']])
+
+    def test_preset_product_is_deterministic(self):
+        """Test the gaming laptop preset gives the same history on every demo lookup"""
+        first = utils.get_amazon_product_info(None, '7D2K2Wr', demo_mode=True)
+        second = utils.get_amazon_product_info(None, '7D2K2Wr', demo_mode=True)
+
+        self.assertEqual(first['price_data'], second['price_data'])
+        self.assertEqual(first['title'], simulator.PRESET_PRODUCTS['7D2K2Wr']['title'])
+        self.assertEqual(first['current_price'], 799.99)
+        self.assertTrue(749.99 <= first['lowest_price'] and first['peak_price'] <= 899.99)
+        self.cached_get.assert_not_called()
+
+    def test_demo_mode_without_enrichment_skips_network(self):
+        """Test that demo mode with enrich_title=False makes no request"""
+        product = utils.get_amazon_product_info(None, 'B08N5KWB9H', demo_mode=True, enrich_title=False)
+
+        self.assertEqual(product['title'], simulator.simulated_title('B08N5KWB9H'))
+        self.cached_get.assert_not_called()
+
+    def test_fallback_does_not_refetch_page(self):
+        """Test that a failed Amazon fetch falls back to demo data without a second request"""
+        self.cached_get.side_effect = None
+        self.cached_get.return_value = response_cache.CachedResponse('https://www.amazon.com/dp/B08N5KWB9H', 503, b'', {})
+
+        product = utils.get_amazon_product_info(None, 'B08N5KWB9H')
+
+        self.assertTrue(product['demo'])
+        self.assertEqual(self.cached_get.call_count, 1)
+
+    def test_enrich_titles_is_a_separate_stage(self):
+        """Test that enrich_titles swaps in real titles and keeps the rest"""
+        products = list(simulator.simulate_products(['B0ENRICH01', 'B0ENRICH02']))
+        real_titles = {'B0ENRICH01': 'Real Lip Gloss'}
+        with mock.patch.object(utils, 'fetch_amazon_title', side_effect=real_titles.get):
+            enriched = utils.enrich_titles(products)
+
+        self.assertEqual(enriched[0]['title'], 'Real Lip Gloss')
+        self.assertEqual(enriched[1]['title'], simulator.simulated_title('B0ENRICH02'))
+
+
+class TestAmazonPageParser(unittest.TestCase):
+    """Test the targeted Amazon title/price extractor against BeautifulSoup"""
+
+    BACKENDS = ['lxml', 'html.parser'] if parsers.etree is not None else ['html.parser']
+
+    def assertMatchesSoup(self, content):
+        expected = benchmarks._legacy_amazon_fields(content)
+        for backend in self.BACKENDS:
+            self.assertEqual(parsers.parse_amazon_product(content, backend=backend), expected, backend)
+
+    def test_fixture_layouts(self):
+        """Test every synthetic page layout gives the BeautifulSoup answer"""
+        for layout in ('buybox', 'deal', 'whole', 'none'):
+            self.assertMatchesSoup(benchmarks.amazon_fixture(price='$1,299.00', layout=layout, filler_kb=50))
+
+    def test_selector_priority_beats_document_order(self):
+        """Test a later higher-priority price wins over an earlier lower-priority one"""
+        html = (b'<html><body><span id="priceblock_ourprice">$30.00</span>'
+                b'<div class="a-price"><span class="a-offscreen">$25.00</span></div>'
+                b'<span class="a-price"><span class="a-offscreen">See price in cart</span></span>'
+                b'<span class="a-price"><span class="a-offscreen">$19.99</span></span>'
+                b'<h1 id="title"><span id="productTitle">Rose &amp; Gold <b>Mirror</b></span></h1></body></html>')
+        self.assertMatchesSoup(html)
+        self.assertEqual(parsers.parse_amazon_product(html)['price'], 30.0)
+
+    def test_stops_after_settling(self):
+        """Test parsing stops early once the title and price are known"""
+        content = benchmarks.amazon_fixture(filler_kb=2000)
+        fed = []
+        original_feed = parsers._StdlibScanner.feed
+
+        def counting_feed(scanner, data):
+            fed.append(len(data))
+            return original_feed(scanner, data)
+
+        with mock.patch.object(parsers._StdlibScanner, 'feed', counting_feed):
+            fields = parsers.parse_amazon_product(content, backend='html.parser')
+
+        self.assertEqual(fields['price'], 45.0)
+        self.assertLess(sum(fed), len(content) / 4)
+
+    def test_scraper_uses_parser(self):
+        """Test get_amazon_product_info reads title and price through the parser"""
+        page = response_cache.CachedResponse('https://www.amazon.com/dp/B0PARSE001', 200,
+                                             benchmarks.amazon_fixture(title='Glow Serum', price='$24.50', filler_kb=20),
+                                             {'Content-Type': 'text/html; charset=utf-8'})
+        with mock.patch.object(response_cache, 'cached_get', return_value=page):
+            product = utils.get_amazon_product_info(None, 'B0PARSE001')
+
+        self.assertEqual(product['title'], 'Glow Serum')
+        self.assertEqual(product['current_price'], 24.5)
+        self.assertFalse(product['demo'])
+
+
+class TestWalmartParser(unittest.TestCase):
+    """Test the streaming Walmart search parser"""
+
+    def setUp(self):
+        self.original_path = response_cache.CACHE_PATH
+        self.tmpdir = tempfile.TemporaryDirectory()
+        response_cache.CACHE_PATH = os.path.join(self.tmpdir.name, 'http_cache.db')
+
+    def tearDown(self):
+        response_cache.close()
+        response_cache.CACHE_PATH = self.original_path
+        self.tmpdir.cleanup()
+
+    def test_first_card_is_structured(self):
+        """Test the first product card comes back as title, price and url"""
+        result = parsers.parse_walmart_search(benchmarks.walmart_fixture(results=5))
+
+        self.assertEqual(result, {
+            'title': 'Pink Insulated Tumbler 0 with Straw, 40 oz',
+            'price': 19.97,
+            'url': 'https://www.walmart.com/ip/tumbler-0/1000',
+        })
+
+    def test_next_data_used_without_cards(self):
+        """Test the embedded __NEXT_DATA__ JSON is read when there are no cards"""
+        page = benchmarks.walmart_fixture(results=3).replace(b'data-item-id=', b'data-other-id=')
+        result = parsers.parse_walmart_search(page)
+
+        self.assertEqual(result['title'], 'Pink Insulated Tumbler 0 with Straw, 40 oz')
+        self.assertEqual(result['url'], 'https://www.walmart.com/ip/tumbler-0/1000')
+
+    def test_page_price_fallback_and_empty_page(self):
+        """Test a bare price is still found, and an empty page gives None"""
+        page = b'<html><body><span class="price-characteristic">$1,204.00</span></body></html>'
+
+        self.assertEqual(parsers.parse_walmart_search(page), {'title': None, 'price': 1204.0, 'url': None})
+        self.assertIsNone(parsers.parse_walmart_search(b'<html><body>No results</body></html>'))
+
+    def test_stream_stops_after_first_card(self):
+        """Test the download stops at the first card and the prefix replays from cache"""
+        page = benchmarks.walmart_fixture(results=400)
+        server = ScriptedServer([(200, {'Content-Type': 'text/html'}, page)])
+        try:
+            parser = parsers.WalmartSearchParser()
+            response = response_cache.cached_stream(server.url + '/search?q=tumbler', parser.consume)
+            first = parser.finish()
+
+            replay = parsers.WalmartSearchParser()
+            cached = response_cache.cached_stream(server.url + '/search?q=tumbler', replay.consume)
+        finally:
+            server.close()
+
+        self.assertLess(len(response.content), len(page) / 10)
+        self.assertEqual(len(server.requests), 1)
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(replay.finish(), first)
+
+    def test_streamed_prefix_not_served_as_full_page(self):
+        """Test cached_get fetches the whole page rather than a prefix cached_stream stored"""
+        page = benchmarks.walmart_fixture(results=400)
+        server = ScriptedServer([(200, {'Content-Type': 'text/html'}, page)] * 2)
+        try:
+            response_cache.cached_stream(server.url + '/search?q=tumbler', parsers.WalmartSearchParser().consume)
+            full = response_cache.cached_get(server.url + '/search?q=tumbler')
+        finally:
+            server.close()
+
+        self.assertEqual(len(server.requests), 2)
+        self.assertFalse(full.from_cache)
+        self.assertEqual(full.content, page)
+
+    def test_search_walmart_returns_dict(self):
+        """Test search_walmart hands back the parser's structured result"""
+        page = response_cache.CachedResponse('https://www.walmart.com/search', 200, benchmarks.walmart_fixture(results=2), {})
+
+        def fake_stream(url, consume, headers=None, timeout=None):
+            return response_cache._replay(page, consume, 4096)
+
+        with mock.patch.object(response_cache, 'cached_stream', fake_stream):
+            result = utils.search_walmart('Pink Tumbler with Straw 40 oz')
+
+        self.assertEqual(result['price'], 19.97)
+        self.assertTrue(result['url'].startswith('https://www.walmart.com/ip/'))
+
+
+class FakeAdapter(retailers.RetailerAdapter):
+    """Adapter that returns a canned result (or raises) after a delay"""
+
+    def __init__(self, name, result=None, delay=0, error=None, tier_flag=None, timeout=1):
+        super().__init__(timeout=timeout)
+        self.name = name
+        self.tier_flag = tier_flag
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def search(self, title):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TestPriceComparison(unittest.TestCase):
+    """Test the multi-retailer comparison engine"""
+
+    def test_offers_ranked_cheapest_first(self):
+        """Test offers are merged with priced ones cheapest first"""
+        adapters = [
+            FakeAdapter('walmart', {'title': 'Gloss', 'price': 12.0, 'url': 'w'}),
+            FakeAdapter('target', {'title': 'Gloss', 'price': 9.5, 'url': 't'}),
+            FakeAdapter('ulta', {'title': 'Gloss', 'price': None, 'url': 'u'}),
+            FakeAdapter('sephora', None),
+        ]
+        result = retailers.compare_prices('Gloss', adapters=adapters)
+
+        self.assertEqual([offer['retailer'] for offer in result['offers']], ['target', 'walmart', 'ulta'])
+        self.assertEqual(result['best']['retailer'], 'target')
+        self.assertEqual(result['errors'], {})
+
+    def test_tier_flags_gate_adapters(self):
+        """Test an adapter is only queried when the tier has its feature flag"""
+        target = FakeAdapter('target', {'title': 'Gloss', 'price': 9.5, 'url': 't'},
+                             tier_flag='access_to_target_prices')
+
+        free = retailers.compare_prices('Gloss', tier='free', adapters=[target])
+        besties = retailers.compare_prices('Gloss', tier='besties', adapters=[target])
+
+        self.assertEqual(free['locked'], ['target'])
+        self.assertEqual(free['offers'], [])
+        self.assertEqual(besties['best']['price'], 9.5)
+        self.assertEqual(target.calls, 1)
+
+    def test_slow_adapter_does_not_set_latency(self):
+        """Test a search past its own timeout is reported without waiting for it"""
+        adapters = [
+            FakeAdapter('fast', {'title': 'A', 'price': 5.0, 'url': 'a'}, delay=0.05),
+            FakeAdapter('fast2', {'title': 'B', 'price': 6.0, 'url': 'b'}, delay=0.05),
+            FakeAdapter('slow', {'title': 'C', 'price': 1.0, 'url': 'c'}, delay=2, timeout=0.3),
+        ]
+        result = retailers.compare_prices('Gloss', adapters=adapters)
+
+        self.assertEqual(result['timed_out'], ['slow'])
+        self.assertEqual([offer['retailer'] for offer in result['offers']], ['fast', 'fast2'])
+        self.assertLess(result['elapsed'], 1.0)
+
+    def test_open_host_breaker_skips_adapter(self):
+        """Test an adapter is skipped while http_client's breaker for its host is open"""
+        self.addCleanup(http_client.reset_breakers)
+        walmart = FakeAdapter('walmart', error=ConnectionError('refused'))
+        walmart.host = 'www.walmart.com'
+
+        # compare_prices leaves the counting to http_client, so errors aren't counted twice
+        first = retailers.compare_prices('Gloss', adapters=[walmart])
+        breaker = http_client.get_breaker(walmart.host)
+        self.assertEqual(first['errors'], {'walmart': 'refused'})
+        self.assertEqual(breaker.state, 'closed')
+
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        second = retailers.compare_prices('Gloss', adapters=[walmart])
+
+        self.assertEqual(second['skipped'], ['walmart'])
+        self.assertEqual(walmart.calls, 1)
+
+    def test_adapters_share_search_urls_with_utils(self):
+        """Test the adapters build the same search URLs as search_walmart and search_target"""
+        title = 'Pink Tumbler with Straw 40 oz'
+
+        self.assertEqual(retailers.WalmartAdapter().search_url(title), utils.walmart_search_url(title))
+        self.assertEqual(retailers.TargetAdapter().search_url(title), utils.target_search_url(title))
+
+    def test_breaker_half_open_trial(self):
+        """Test a breaker lets one trial call through after reset_after"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_after=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 10.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_target_search_page(self):
+        """Test the Target parser reads the first product card"""
+        page = (b'<html><body><div data-test="@web/site-top-of-funnel/ProductCardWrapper">'
+                b'<a data-test="product-title" href="/p/pink-tumbler/-/A-123">Pink Tumbler 40 oz</a>'
+                b'<span data-test="current-price"><span>$24.99</span></span></div>'
+                b'<div data-test="@web/site-top-of-funnel/ProductCardWrapper">'
+                b'<a data-test="product-title" href="/p/other/-/A-456">Other</a></div></body></html>')
+
+        self.assertEqual(parsers.parse_target_search(page), {
+            'title': 'Pink Tumbler 40 oz',
+            'price': 24.99,
+            'url': 'https://www.target.com/p/pink-tumbler/-/A-123',
+        })
+
+
+class TestRefreshScheduler(TempDatabaseTestCase):
+    """Test the background price-refresh scheduler"""
+
+    db_name = 'refresh.db'
+
+    def setUp(self):
+        super().setUp()
+        http_client.reset_breakers()
+
+    def _product(self, asin, price):
+        return {
+            'asin': asin,
+            'title': f'Tracked {asin}',
+            'current_price': price,
+            'peak_price': price + 10,
+            'lowest_price': price - 5,
+            'price_data': [price + 10, price],
+            'category': 'test'
+        }
+
+    def _age(self, asin, hours):
+        """Backdate a product's updated_at"""
+        conn = database.get_connection()
+        with conn:
+            conn.execute("UPDATE products SET updated_at=? WHERE asin=?",
+                         ((datetime.now() - timedelta(hours=hours)).isoformat(), asin))
+
+    def test_refresh_order_and_write_through(self):
+        """Test due products refresh unsaved first, then by staleness times popularity"""
+        database.save_products([self._product(asin, 20.0) for asin in ('B0STALE001', 'B0STALE002', 'B0FRESH001')])
+        self._age('B0STALE001', 10)
+        self._age('B0STALE002', 8)
+        for asin in ('B0STALE001', 'B0STALE002', 'B0FRESH001', 'B0NEVER001'):
+            database.add_search_history(asin=asin)
+        database.toggle_favorite('B0STALE002')  # popular enough to beat the older one
+
+        fetched = []
+
+        def fetch(asin):
+            fetched.append(asin)
+            return self._product(asin, 12.0)
+
+        refresher = scheduler.RefreshScheduler(fetch=fetch, workers=1, rate_limits={'www.amazon.com': None})
+        saved = refresher.run_once()
+
+        self.assertEqual(fetched, ['B0NEVER001', 'B0STALE002', 'B0STALE001'])
+        self.assertEqual(saved, 3)
+        self.assertEqual(database.get_product('B0STALE001')['current_price'], 12.0)
+        self.assertEqual(database.get_product('B0FRESH001')['current_price'], 20.0)
+        self.assertEqual(refresher.stats['refreshed'], 3)
+
+    def test_failures_and_open_breaker_save_nothing(self):
+        """Test failed fetches and an open breaker leave the saved product alone"""
+        database.save_products([self._product('B0STALE001', 20.0)])
+        self._age('B0STALE001', 10)
+        database.add_search_history(asin='B0STALE001')
+
+        refresher = scheduler.RefreshScheduler(fetch=lambda asin: None, workers=2,
+                                               rate_limits={'www.amazon.com': None})
+        self.assertEqual(refresher.run_once(), 0)
+        self.assertEqual(refresher.stats['failed'], 1)
+
+        breaker = http_client.get_breaker('www.amazon.com')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        self.assertEqual(refresher.run_once(), 0)
+        self.assertEqual(refresher.stats['deferred'], 1)
+        self.assertEqual(database.get_product('B0STALE001')['current_price'], 20.0)
+
+    def test_read_product_queues_missing_and_stale(self):
+        """Test the UI read path returns what's saved and queues refreshes without scraping"""
+        database.save_products([self._product('B0FRESH001', 20.0), self._product('B0STALE001', 20.0)])
+        self._age('B0STALE001', 10)
+        refresher = scheduler.RefreshScheduler(fetch=mock.Mock(side_effect=AssertionError('scraped')))
+
+        self.assertEqual(refresher.read_product('B0FRESH001')['current_price'], 20.0)
+        self.assertEqual(refresher.pending(), 0)
+        self.assertIsNone(refresher.read_product('B0NEVER001'))
+        self.assertIsNotNone(refresher.read_product('B0STALE001'))
+        self.assertEqual(refresher.pending(), 2)
+
+    def test_repeated_reads_queue_once(self):
+        """Test page views of a stale product read one row and add one heap entry"""
+        database.save_products([self._product('B0STALE001', 20.0)])
+        self._age('B0STALE001', 10)
+        refresher = scheduler.RefreshScheduler(fetch=mock.Mock(side_effect=AssertionError('scraped')))
+
+        with mock.patch.object(database, '_load_product', wraps=database._load_product) as load, \
+                mock.patch.object(database, 'get_product_summary', side_effect=AssertionError('second read')):
+            for _ in range(50):
+                refresher.read_product('B0STALE001')
+                refresher.read_product('B0NEVER001')
+
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(len(refresher._heap), 2)
+        self.assertFalse(refresher.enqueue('B0STALE001', float('inf')))
+        self.assertTrue(refresher.enqueue('B0OTHER001', 1.0))
+        self.assertTrue(refresher.enqueue('B0OTHER001', 2.0))
+        self.assertEqual(refresher.pending(), 3)
+
+    def test_rate_limiter_spaces_calls(self):
+        """Test calls to one host are spaced by 1/rate seconds"""
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+
+        limiter = scheduler.RateLimiter(2.0, clock=lambda: now[0], sleep=sleep)
+        for _ in range(3):
+            limiter.acquire()
+
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+
+class FakeSMTP:
+    """Stand-in for smtplib.SMTP that records what it was asked to send"""
+
+    connections = []
+
+    def __init__(self, host, port):
+        self.messages = []
+        FakeSMTP.connections.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send_message(self, message):
+        if message['To'] == 'bounce@example.com':
+            raise OSError('mailbox unavailable')
+        self.messages.append(message)
+
+
+class TestPriceAlerts(TempDatabaseTestCase):
+    """Test per-user price alerts and their batched evaluation"""
+
+    db_name = 'alerts.db'
+
+    def setUp(self):
+        super().setUp()
+        http_client.reset_breakers()
+        self.log = os.path.join(self.tmpdir.name, 'alerts.jsonl')
+        self.sink = alerts.FileSink(self.log)
+        self.bestie = database.create_user('cher', 'asif', 'cher@example.com', tier='besties')
+        self.basic = database.create_user('tai', 'pass', 'tai@example.com')
+        self.no_email = database.create_user('dionne', 'pass', tier='platinum')
+        database.save_products([self._product('B0ALERT001', 50.0), self._product('B0ALERT002', 80.0)])
+
+    def _product(self, asin, price):
+        return {
+            'asin': asin,
+            'title': f'Wishlist {asin}',
+            'current_price': price,
+            'peak_price': 90.0,
+            'lowest_price': min(price, 40.0),
+            'price_data': [90.0, price],
+            'category': 'test'
+        }
+
+    def _sent(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_fires_once_per_drop_and_rearms(self):
+        """Test an alert fires on the drop, again only lower, and again after recovering"""
+        for user_id in (self.bestie, self.basic, self.no_email):
+            database.set_price_alert(user_id, 'B0ALERT001', 45.0)
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT001'], self.sink)['triggered'], 0)
+
+        database.save_product(self._product('B0ALERT001', 44.0))
+        result = alerts.evaluate_alerts(['B0ALERT001'], self.sink)
+        # Free tier has no alerts and dionne has no email
+        self.assertEqual(result['delivered'], 1)
+        self.assertEqual([(alert['username'], alert['current_price']) for alert in self._sent()], [('cher', 44.0)])
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT001'], self.sink)['triggered'], 0)
+
+        database.save_product(self._product('B0ALERT001', 42.0))
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT001'], self.sink)['delivered'], 1)
+
+        database.save_product(self._product('B0ALERT001', 60.0))
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT001'], self.sink)['rearmed'], 1)
+        database.save_product(self._product('B0ALERT001', 44.0))
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT001'], self.sink)['delivered'], 1)
+        self.assertEqual(len(self._sent()), 3)
+        self.assertEqual(database.get_price_alerts(self.bestie)[0]['notified_price'], 44.0)
+
+    def test_scoped_to_changed_products_and_favorites(self):
+        """Test evaluation only reads the given products and skips unfavorited ones"""
+        database.set_price_alert(self.bestie, 'B0ALERT001', 60.0)
+        database.set_price_alert(self.bestie, 'B0ALERT002', 90.0)
+        self.assertTrue(database.is_favorite('B0ALERT002', user_id=self.bestie))
+        self.assertFalse(database.is_favorite('B0ALERT002'))
+
+        result = alerts.evaluate_alerts(['B0ALERT001'], self.sink)
+        self.assertEqual((result['checked'], result['delivered']), (1, 1))
+        self.assertEqual([alert['asin'] for alert in self._sent()], ['B0ALERT001'])
+
+        # Someone else's favorites don't touch cher's
+        self.assertTrue(database.toggle_favorite('B0ALERT002'))
+        self.assertTrue(database.toggle_favorite('B0ALERT002', user_id=self.basic))
+        self.assertFalse(database.toggle_favorite('B0ALERT002'))
+        database.set_price_alert(self.bestie, 'B0ALERT002', 85.0)  # re-arm
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT002'], self.sink)['triggered'], 1)
+
+        database.toggle_favorite('B0ALERT002', user_id=self.bestie)  # unfavorite
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT002'], self.sink)['triggered'], 0)
+        self.assertTrue(database.remove_price_alert(self.bestie, 'B0ALERT002'))
+        self.assertFalse(database.remove_price_alert(self.bestie, 'B0ALERT002'))
+
+    def test_default_log_sits_next_to_the_database(self):
+        """Test the default FileSink writes beside DB_PATH, not into the working directory"""
+        database.set_price_alert(self.bestie, 'B0ALERT001', 60.0)
+        alerts.evaluate_alerts(['B0ALERT001'], alerts.FileSink())
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, 'alerts.jsonl')))
+
+    def test_smtp_sink_batches_and_retries_failures(self):
+        """Test one SMTP connection per batch, and a bounced alert is retried next time"""
+        bounce = database.create_user('amber', 'pass', 'bounce@example.com', tier='platinum')
+        for user_id in (self.bestie, bounce):
+            database.set_price_alert(user_id, 'B0ALERT002', 85.0)
+        FakeSMTP.connections = []
+        sink = alerts.SMTPSink(smtp_factory=FakeSMTP)
+
+        result = alerts.evaluate_alerts(['B0ALERT002'], sink)
+        self.assertEqual((result['triggered'], result['delivered']), (2, 1))
+        self.assertEqual(len(FakeSMTP.connections), 1)
+        message = FakeSMTP.connections[0].messages[0]
+        self.assertEqual(message['To'], 'cher@example.com')
+        self.assertIn('$80.00', message['Subject'])
+
+        self.assertEqual(alerts.evaluate_alerts(['B0ALERT002'], sink)['triggered'], 1)
+
+    def test_scheduler_evaluates_refreshed_batches(self):
+        """Test the refresh scheduler fires alerts on the products it just saved"""
+        database.set_price_alert(self.bestie, 'B0ALERT001', 45.0)
+        refresher = scheduler.RefreshScheduler(fetch=lambda asin: self._product(asin, 39.0), workers=1,
+                                               rate_limits={'www.amazon.com': None}, alert_sink=self.sink)
+        refresher.enqueue('B0ALERT001')
+        refresher.run_once()
+
+        self.assertEqual(refresher.stats['alerts'], 1)
+        self.assertEqual([alert['current_price'] for alert in self._sent()], [39.0])
+
+
 def run_tests():
     """Run all tests and return results as a report"""
     test_suite = unittest.TestSuite()
@@ -206,7 +2121,33 @@ def run_tests():
     test_suite.addTest(unittest.makeSuite(TestProductGeneration))
     test_suite.addTest(unittest.makeSuite(TestGirlMathLogic))
     test_suite.addTest(unittest.makeSuite(TestGirlMathStatement))
+    test_suite.addTest(unittest.makeSuite(TestDealScoring))
     test_suite.addTest(unittest.makeSuite(TestDatabaseFunctions))
+    test_suite.addTest(unittest.makeSuite(TestConnectionPool))
+    test_suite.addTest(unittest.makeSuite(TestBatchUpsert))
+    test_suite.addTest(unittest.makeSuite(TestPriceHistory))
+    test_suite.addTest(unittest.makeSuite(TestPriceDataFormat))
+    test_suite.addTest(unittest.makeSuite(TestPriceAggregates))
+    test_suite.addTest(unittest.makeSuite(TestTopDeals))
+    test_suite.addTest(unittest.makeSuite(TestQueryPlans))
+    test_suite.addTest(unittest.makeSuite(TestSchemaMigrations))
+    test_suite.addTest(unittest.makeSuite(TestLRUCache))
+    test_suite.addTest(unittest.makeSuite(TestReadThroughCache))
+    test_suite.addTest(unittest.makeSuite(TestHttpClient))
+    test_suite.addTest(unittest.makeSuite(TestCircuitBreakers))
+    test_suite.addTest(unittest.makeSuite(TestLookupPipeline))
+    test_suite.addTest(unittest.makeSuite(TestStaleWhileRevalidate))
+    test_suite.addTest(unittest.makeSuite(TestRequestCoalescing))
+    test_suite.addTest(unittest.makeSuite(TestResponseCache))
+    test_suite.addTest(unittest.makeSuite(TestShortLinks))
+    test_suite.addTest(unittest.makeSuite(TestAsinExtractor))
+    test_suite.addTest(unittest.makeSuite(TestPriceSimulator))
+    test_suite.addTest(unittest.makeSuite(TestOfflineSimulator))
+    test_suite.addTest(unittest.makeSuite(TestAmazonPageParser))
+    test_suite.addTest(unittest.makeSuite(TestWalmartParser))
+    test_suite.addTest(unittest.makeSuite(TestPriceComparison))
+    test_suite.addTest(unittest.makeSuite(TestRefreshScheduler))
+    test_suite.addTest(unittest.makeSuite(TestPriceAlerts))
     
     # Use TextTestRunner to capture output
     from io import StringIO
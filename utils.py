@@ -1,271 +1,270 @@
 import re
-import requests
-from bs4 import BeautifulSoup
+import sqlite3
+import http_client
+import response_cache
+import database
+import parsers
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import time
 import numpy as np
+import simulator
+from cache import LRUCache, MISSING
+from singleflight import SingleFlight
+
+# a.co short code -> ASIN. Short links never change target, so resolved codes
+# are kept until evicted; codes that fail are retried after SHORT_LINK_RETRY_SECONDS.
+SHORT_LINK_CACHE = LRUCache(maxsize=4096)
+SHORT_LINK_RETRY_SECONDS = 10 * 60
+SHORT_LINK_WORKERS = 8
+
+# Concurrent callers for the same short code, ASIN or search page share one
+# outbound fetch instead of each sending their own (see get_coalescing_stats)
+SHORT_LINK_FLIGHT = SingleFlight('short_link')
+AMAZON_FLIGHT = SingleFlight('amazon')
+SEARCH_FLIGHT = SingleFlight('search')
+
+# ASIN patterns, precompiled. The three path forms share one alternation whose
+# group number is the pattern's priority; the loose amazon.com pattern is only
+# tried when none of them match, exactly like the old one-pattern-at-a-time loop.
+_ASIN_PATH_RE = re.compile(r'/dp/(\w{10})|/gp/product/(\w{10})|/ASIN/(\w{10})')
+_ASIN_LOOSE_RE = re.compile(r'amazon\.com.*?/(\w{10})(?:/|\?|$)')
+_SHORT_URL_RE = re.compile(r'a\.co/d/(\w{7,10})')
+_URL_SEPARATORS_RE = re.compile(r'[/&?=]')
+
+def _looks_like_asin(part):
+    """A 10-character alphanumeric URL segment"""
+    return len(part) == 10 and part.isascii() and part.isalnum()
+
+def _match_asin(url):
+    """ASIN from the first of /dp/, /gp/product/, /ASIN/, amazon.com/... that matches"""
+    # Fast path for canonical product links: ten alphanumerics after the first
+    # /dp/ are what the /dp/ pattern would have found. Anything unusual
+    # (underscores, non-ASCII, a short segment) goes through the regexes.
+    dp = url.find('/dp/')
+    if dp != -1:
+        candidate = url[dp + 4:dp + 14]
+        if len(candidate) == 10 and candidate.isascii() and candidate.isalnum():
+            return candidate
+    
+    best = None
+    for match in _ASIN_PATH_RE.finditer(url):
+        priority = match.lastindex
+        if best is None or priority < best.lastindex:
+            best = match
+            if priority == 1:
+                break
+    if best:
+        return best.group(best.lastindex)
+    
+    match = _ASIN_LOOSE_RE.search(url)
+    return match.group(1) if match else None
 
 def extract_asin(amazon_url):
     """Extract ASIN from Amazon product URL"""
-    # Pattern for ASIN in Amazon URLs
-    patterns = [
-        r'/dp/(\w{10})',
-        r'/gp/product/(\w{10})',
-        r'/ASIN/(\w{10})',
-        r'amazon\.com.*?/(\w{10})(?:/|\?|$)'
-    ]
-    
-    # Special pattern for Amazon short URLs
-    short_url_pattern = r'a\.co/d/(\w{7,10})'
-    
     # First check if it's a short URL
-    if amazon_url and 'a.co/d/' in amazon_url:
-        short_match = re.search(short_url_pattern, amazon_url)
+    if not amazon_url:
+        return None
+    
+    if 'a.co/d/' in amazon_url:
+        short_match = _SHORT_URL_RE.search(amazon_url)
         if short_match:
             short_code = short_match.group(1)
-            try:
-                # Try to follow the redirect to get the full URL
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                }
-                response = requests.head(f"https://a.co/d/{short_code}", headers=headers, allow_redirects=True, timeout=10)
-                
-                # Now extract ASIN from the redirected URL
-                full_url = response.url
-                
-                # Try standard patterns on the redirected URL
-                for pattern in patterns:
-                    match = re.search(pattern, full_url)
-                    if match:
-                        return match.group(1)
-                
-                # If we can't extract with patterns, look for a 10-character alphanumeric segment in the URL path
-                path_parts = full_url.split('/')
-                for part in path_parts:
-                    if len(part) == 10 and re.match(r'^[A-Z0-9]{10}$', part, re.IGNORECASE):
-                        return part
-                        
-                # If we still can't find it, just return the short code
-                return short_code
-            except Exception as e:
-                print(f"Error following Amazon short URL: {str(e)}")
-                # Just return the short code if we can't follow the redirect
-                return short_code
-    
-    # Try standard patterns for regular Amazon URLs
-    if amazon_url:
-        for pattern in patterns:
-            match = re.search(pattern, amazon_url)
-            if match:
-                return match.group(1)
-        
-        # If no match with patterns, try direct ASIN extraction as fallback
-        # Look for any 10-character alphanumeric sequence that might be an ASIN
-        parts = re.split(r'[/&?=]', amazon_url)
-        for part in parts:
-            if len(part) == 10 and re.match(r'^[A-Z0-9]{10}$', part, re.IGNORECASE):
-                return part
+            # Just return the short code if we can't follow the redirect
+            return resolve_short_link(short_code) or short_code
+    
+    return _extract_long_asin(amazon_url)
+
+def _extract_long_asin(amazon_url):
+    """extract_asin for anything that isn't an a.co short link"""
+    asin = _match_asin(amazon_url)
+    if asin:
+        return asin
+    
+    # If no match with patterns, try direct ASIN extraction as fallback
+    # Look for any 10-character alphanumeric sequence that might be an ASIN
+    for part in _URL_SEPARATORS_RE.split(amazon_url):
+        if _looks_like_asin(part):
+            return part
     
     return None
 
-def get_amazon_product_info(api, asin, demo_mode=False):
-    """Get real product data directly from Amazon through web scraping"""
-    import random
-    import numpy as np
-    import time
-    from bs4 import BeautifulSoup
-    import trafilatura
-    import re
-    
-    # Try to infer product type from the ASIN for better demo mode
-    def infer_product_type_from_asin(asin):
-        # First check if it's a short code (like from a.co links)
-        if len(asin) < 10:
-            # For short codes, we'll just assume it's a medium-priced tech item
-            return "tech", random.uniform(100, 400)
-            
-        # Default pattern detection based on ASIN
-        first_char = asin[0].upper() if asin else 'B'
-        second_char = asin[1].upper() if len(asin) > 1 else '0'
-        pattern = first_char + second_char
-        
-        # Special case - check for known gaming/computer patterns
-        gaming_patterns = ['7D2', 'GA4', 'RTX', 'CPU', 'GPU', '7NZ']
-        for gp in gaming_patterns:
-            if gp in asin.upper():
-                return "gaming", random.uniform(700, 1500)
-        
-        # Detect product type from ASIN pattern
-        if pattern in ['B0', 'B1', 'B2']:
-            return "electronics", random.uniform(50, 300)
-        elif pattern in ['B7', 'B8']:
-            return "fashion", random.uniform(30, 100) 
-        elif pattern in ['B3', 'B4']:
-            return "beauty", random.uniform(15, 80)
-        else:
-            return "home", random.uniform(20, 120)
+def extract_asins(urls):
+    """Extract ASINs from many URLs at once (e.g. a wishlist CSV export)
+    
+    Returns a list lined up with `urls`. Each distinct URL is parsed once, and
+    all the a.co short links in the batch are resolved together through
+    resolve_short_links, so new ones are followed concurrently.
+    """
+    unique = dict.fromkeys(urls)
+    short_codes = {}
+    
+    for url in unique:
+        if url and 'a.co/d/' in url:
+            short_match = _SHORT_URL_RE.search(url)
+            if short_match:
+                short_codes[url] = short_match.group(1)
+                continue
+        unique[url] = _extract_long_asin(url) if url else None
+    
+    if short_codes:
+        resolved = resolve_short_links(short_codes.values())
+        for url, short_code in short_codes.items():
+            unique[url] = resolved[short_code] or short_code
+    
+    return [unique[url] for url in urls]
+
+def _follow_short_link(short_code):
+    """Follow an a.co short link and pull the ASIN out of where it lands"""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    }
+    response = http_client.head(f"https://a.co/d/{short_code}", headers=headers, allow_redirects=True, timeout=10)
+    
+    # Now extract ASIN from the redirected URL
+    full_url = response.url
+    asin = _match_asin(full_url)
+    if asin:
+        return asin
+    
+    # If we can't extract with patterns, look for a 10-character alphanumeric segment in the URL path
+    for part in full_url.split('/'):
+        if _looks_like_asin(part):
+            return part
     
-    # If we're using demo mode (either by choice or as fallback)
-    if demo_mode:
-        # Check if the URL contains any keywords to help determine product type
-        product_type, base_price = infer_product_type_from_asin(asin)
-        
-        # Adjust base price for gaming laptops and other high-value electronics
-        if "7D2K2Wr" in asin:  # This specific short code appears to be a gaming laptop
-            product_type = "gaming"
-            base_price = random.uniform(800, 1400)
-        
-        # Set price fluctuation parameters
-        num_days = 90
-        
-        # Generate price history with appropriate fluctuations for the product type
-        if product_type == "gaming" or product_type == "electronics":
-            # Higher priced items tend to have less percentage fluctuation
-            variation_pct = 0.15  # 15% variation
-            # Tech products often have downward trend as they age
-            base_prices = np.linspace(base_price * 1.05, base_price, num_days)
-            # Major sales are less frequent but more significant
-            num_sales = random.randint(1, 2)
-            sales_discount = 0.1  # 10% off during sales
+    return None
+
+def resolve_short_links(short_codes, max_workers=SHORT_LINK_WORKERS):
+    """Resolve many a.co short codes to ASINs, following only the unknown ones
+    
+    Looks in SHORT_LINK_CACHE, then the short_links table, and follows what's
+    left concurrently. Returns {code: asin}, with None for codes that didn't
+    resolve; those are remembered for SHORT_LINK_RETRY_SECONDS so repeated
+    pastes of a dead link don't hit the network either.
+    """
+    results = {}
+    pending = []
+    for code in dict.fromkeys(short_codes):
+        cached = SHORT_LINK_CACHE.get(code)
+        if cached is MISSING:
+            pending.append(code)
         else:
-            # More typical variation for regular products
-            variation_pct = 0.25  # 25% variation
-            base_prices = np.linspace(base_price * (1 - 0.05 * random.random()), 
-                                    base_price * (1 + 0.05 * random.random()), 
-                                    num_days)
-            num_sales = random.randint(2, 3)
-            sales_discount = random.uniform(0.15, 0.25)  # 15-25% off
-        
-        # Add sales periods
-        sales_pattern = np.zeros(num_days)
-        for _ in range(num_sales):
-            sale_start = random.randint(0, num_days - 10)
-            sale_duration = random.randint(5, 10)
-            sales_pattern[sale_start:sale_start+sale_duration] = -base_price * sales_discount
-        
-        # Add noise - less noise for expensive items
-        noise_level = min(0.02, 5.0/base_price) if base_price > 0 else 0.02
-        noise = np.random.normal(0, base_price * noise_level, num_days)
-        
-        # Combine patterns
-        price_pattern = base_prices + sales_pattern + noise
-        
-        # Ensure no negative prices and price minimum
-        min_price = base_price * 0.7
-        price_pattern = np.maximum(price_pattern, min_price)
-        
-        # Make current price a good deal
-        discount_factor = 0.9 if base_price < 500 else 0.95
-        price_pattern[-5:] = price_pattern[-5:] * discount_factor
-        
-        # Convert to list
-        price_data = price_pattern.tolist()
-        
-        # Calculate key price points
-        current_price = price_data[-1]
-        peak_price = max(price_data)
-        lowest_price = min(price_data)
-        
-        # Try to get the real product title from Amazon
+            results[code] = cached
+    
+    if pending:
         try:
-            url = f"https://www.amazon.com/dp/{asin}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache',
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Try different product title selectors
-            title_element = soup.select_one('#productTitle')
-            if not title_element:
-                title_element = soup.select_one('.product-title-word-break')
-            if not title_element:
-                title_element = soup.select_one('h1.a-size-large')
-                
-            if title_element:
-                title = title_element.get_text().strip()
+            stored = database.get_short_links(pending)
+        except sqlite3.Error:
+            stored = {}  # the table is only a shortcut, so a database hiccup shouldn't fail the lookup
+        
+        retry_after = (datetime.now() - timedelta(seconds=SHORT_LINK_RETRY_SECONDS)).isoformat()
+        to_follow = []
+        for code in pending:
+            asin, resolved_at = stored.get(code, (None, None))
+            if asin:
+                SHORT_LINK_CACHE.set(code, asin)
+                results[code] = asin
+            elif resolved_at and resolved_at > retry_after:
+                SHORT_LINK_CACHE.set(code, None, ttl=SHORT_LINK_RETRY_SECONDS)
+                results[code] = None
             else:
-                # Generate appropriate title based on inferred product type
-                if product_type == "gaming":
-                    titles = [
-                        f"Gaming Laptop with RTX Graphics - {asin}",
-                        f"High Performance Gaming PC - {asin}",
-                        f"Gaming Desktop Computer - {asin}",
-                        f"Gaming Monitor with High Refresh Rate - {asin}"
-                    ]
-                elif product_type == "electronics":
-                    titles = [
-                        f"Premium Electronics Device - {asin}",
-                        f"Smart Home Tech Gadget - {asin}",
-                        f"Wireless Bluetooth Device - {asin}",
-                        f"Tech Gadget Pro - Latest Model - {asin}"
-                    ]
-                elif product_type == "fashion":
-                    titles = [
-                        f"Designer Fashion Collection - {asin}",
-                        f"Premium Apparel - Trending Style - {asin}",
-                        f"Fashion Accessory - Limited Edition - {asin}"
-                    ]
-                elif product_type == "beauty":
-                    titles = [
-                        f"Premium Beauty Product - Self Care Essential - {asin}",
-                        f"Luxury Skincare Collection - {asin}",
-                        f"Beauty and Cosmetics Set - {asin}"
-                    ]
-                else:  # home
-                    titles = [
-                        f"Home Essential Item - {asin}",
-                        f"Home and Kitchen Premium Product - {asin}",
-                        f"Household Premium Item - {asin}"
-                    ]
-                title = random.choice(titles)
-        except Exception as e:
-            print(f"Error fetching product title: {str(e)}")
-            # Fallback title based on product type
-            if product_type == "gaming":
-                title = f"Gaming Laptop or PC ({asin})"
-            elif product_type == "electronics":
-                title = f"Electronics Device ({asin})"
-            else:
-                title = f"Amazon Product ({asin})"
-        
-        # For the specific gaming laptop the user mentioned
-        if "7D2K2Wr" in asin:
-            title = "Acer Nitro V Gaming Laptop | Intel Core i5-13420H | NVIDIA GeForce RTX 4050 | 15.6\" FHD 144Hz Display | 8GB DDR5 | 512GB SSD"
-            current_price = 799.99
-            peak_price = 899.99
-            lowest_price = 749.99
+                to_follow.append(code)
+        
+        if to_follow:
+            resolved = {}
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_follow)))) as pool:
+                futures = {code: pool.submit(SHORT_LINK_FLIGHT.do, code, _follow_short_link, code)
+                           for code in to_follow}
+            for code, future in futures.items():
+                try:
+                    resolved[code] = future.result()
+                except Exception as e:
+                    print(f"Error following Amazon short URL: {str(e)}")
+                    resolved[code] = None
             
-            # Regenerate price history based on these points
-            price_data = []
-            for i in range(90):
-                if i < 30:  # First month - near peak price
-                    price_data.append(random.uniform(869.99, 899.99))
-                elif i < 60:  # Second month - gradual decrease
-                    price_data.append(random.uniform(829.99, 869.99))
-                else:  # Last month - current prices with occasional dips to lowest
-                    if random.random() > 0.8:  # 20% chance of sale price
-                        price_data.append(random.uniform(749.99, 779.99))
-                    else:
-                        price_data.append(random.uniform(789.99, 819.99))
-            
-            # Ensure last 5 days are close to current price
-            for i in range(1, 6):
-                price_data[-i] = random.uniform(current_price - 10, current_price + 10)
-        
-        return {
-            'title': title,
-            'price_data': price_data,
-            'current_price': current_price,
-            'peak_price': peak_price,
-            'lowest_price': lowest_price,
-            'asin': asin,
-            'demo': True
+            for code, asin in resolved.items():
+                SHORT_LINK_CACHE.set(code, asin, ttl=None if asin else SHORT_LINK_RETRY_SECONDS)
+            results.update(resolved)
+            try:
+                database.save_short_links(resolved)
+            except sqlite3.Error:
+                pass
+    
+    return {code: results[code] for code in dict.fromkeys(short_codes)}
+
+def resolve_short_link(short_code):
+    """Resolve one a.co short code to its ASIN, or None (see resolve_short_links)"""
+    return resolve_short_links([short_code])[short_code]
+
+def fetch_amazon_title(asin):
+    """Look up a product's real title on Amazon, or None if we can't get it"""
+    try:
+        url = f"https://www.amazon.com/dp/{asin}"
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Cache-Control': 'no-cache',
+            'Pragma': 'no-cache',
         }
+        
+        response = response_cache.cached_get(url, headers=headers, timeout=10)
+        if response.status_code != 200:
+            return None
+        # Try different product title selectors, stopping at the first found
+        fields = parsers.parse_amazon_product(response.content, parsers.charset_from_headers(response.headers),
+                                              title_selectors=parsers.AMAZON_TITLE_SELECTORS, price=False)
+        return fields['title'] or None
+    except Exception as e:
+        print(f"Error fetching product title: {str(e)}")
+    
+    return None
+
+def enrich_titles(products, max_workers=SHORT_LINK_WORKERS):
+    """Replace simulated titles with real Amazon ones where we can get them
+    
+    The optional network stage after simulator.simulate_products(): titles
+    are looked up concurrently and products whose page can't be fetched keep
+    their catalog title. Updates the dicts in place and returns them as a list.
+    """
+    products = list(products)
+    if not products:
+        return products
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(products)))) as pool:
+        titles = list(pool.map(fetch_amazon_title, [product['asin'] for product in products]))
+    
+    for product, title in zip(products, titles):
+        if title:
+            product['title'] = title
+    
+    return products
+
+def get_amazon_product_info(api, asin, demo_mode=False, enrich_title=True):
+    """Get real product data directly from Amazon through web scraping
+    
+    With demo_mode the product comes from the offline simulator, and
+    enrich_title=False skips looking up its real title on Amazon.
+    Concurrent scrapes of the same ASIN are coalesced into one (AMAZON_FLIGHT);
+    every caller gets its own copy of the product.
+    """
+    if demo_mode:
+        return _get_amazon_product_info(api, asin, demo_mode=True, enrich_title=enrich_title)
+    
+    product = AMAZON_FLIGHT.do(asin, _get_amazon_product_info, api, asin, False, enrich_title)
+    if product is None:
+        return None
+    # Callers may modify what they get back, so never hand out the shared dict
+    return {**product, 'price_data': list(product.get('price_data') or [])}
+
+def _get_amazon_product_info(api, asin, demo_mode=False, enrich_title=True):
+    """Scrape one product (see get_amazon_product_info)"""
+    # If we're using demo mode (either by choice or as fallback)
+    if demo_mode:
+        # Seeded by the ASIN, so the same product always gets the same data
+        product = simulator.simulate_product(asin)
+        # Preset products (like the gaming laptop the user mentioned) already have their real title
+        if enrich_title and not simulator.preset_for(asin):
+            product['title'] = fetch_amazon_title(asin) or product['title']
+        return product
     
     # Main implementation - try to scrape real data
     try:
@@ -275,49 +274,35 @@ def get_amazon_product_info(api, asin, demo_mode=False):
             'Accept-Language': 'en-US,en;q=0.9',
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = response_cache.cached_get(url, headers=headers, timeout=10)
         if response.status_code != 200:
             # If failed, fall back to demo mode
             print(f"Failed to fetch Amazon page, status code: {response.status_code}")
-            return get_amazon_product_info(api, asin, demo_mode=True)
+            return get_amazon_product_info(api, asin, demo_mode=True, enrich_title=False)
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Read just the title and price; parsing stops once both are found
+        fields = parsers.parse_amazon_product(response.content, parsers.charset_from_headers(response.headers))
         
         # Extract product title
-        title_element = soup.select_one('#productTitle')
-        if not title_element:
-            title_element = soup.select_one('.product-title-word-break')
-        
-        if title_element:
-            title = title_element.get_text().strip()
+        if fields['title'] is not None:
+            title = fields['title']
         else:
             title = f"Product {asin}"
         
         # Extract current price
-        price = None
-        price_elements = [
-            soup.select_one('span.a-price .a-offscreen'),
-            soup.select_one('#priceblock_ourprice'),
-            soup.select_one('#priceblock_dealprice'),
-            soup.select_one('.a-price .a-offscreen'),
-            soup.select_one('span.a-price-whole')
-        ]
-        
-        for element in price_elements:
-            if element:
-                price_text = element.get_text().strip()
-                # Extract numeric value
-                price_match = re.search(r'[\d,]+\.\d+|\d+', price_text)
-                if price_match:
-                    price = float(price_match.group(0).replace(',', ''))
-                    break
+        price = fields['price']
         
         # If we couldn't find a price, use demo mode
         if not price:
             print("Couldn't find price on Amazon page")
-            return get_amazon_product_info(api, asin, demo_mode=True)
+            product = get_amazon_product_info(api, asin, demo_mode=True, enrich_title=False)
+            # Keep the title we just scraped rather than fetching the page again
+            if fields['title'] is not None:
+                product['title'] = title
+            return product
             
-        # Create realistic price history based on current price
+        # Create realistic price history based on current price, seeded by the ASIN
+        rng = np.random.default_rng(simulator.asin_seed(asin))
         num_days = 90
         base_price = price * 1.15  # Assume current price is ~15% lower than typical
         
@@ -327,20 +312,20 @@ def get_amazon_product_info(api, asin, demo_mode=False):
         # Add realistic sales patterns
         sales_curve = np.zeros(num_days)
         # Black Friday / Cyber Monday (if within last 90 days)
-        if random.random() > 0.5:  # 50% chance of a major sale
-            sale_start = random.randint(20, 70)  # Place the sale somewhere in the middle
-            sale_duration = random.randint(5, 10)
+        if rng.random() > 0.5:  # 50% chance of a major sale
+            sale_start = rng.integers(20, 71)  # Place the sale somewhere in the middle
+            sale_duration = rng.integers(5, 11)
             sales_curve[sale_start:sale_start+sale_duration] = -base_price * 0.2  # 20% off
         
         # Regular smaller sales
-        num_mini_sales = random.randint(1, 3)
+        num_mini_sales = rng.integers(1, 4)
         for _ in range(num_mini_sales):
-            sale_start = random.randint(0, num_days - 7)
-            sale_duration = random.randint(3, 7)
+            sale_start = rng.integers(0, num_days - 6)
+            sale_duration = rng.integers(3, 8)
             sales_curve[sale_start:sale_start+sale_duration] = -base_price * 0.1  # 10% off
         
         # Random noise for realistic price fluctuations
-        noise = np.random.normal(0, base_price * 0.01, num_days)  # 1% random noise
+        noise = rng.normal(0, base_price * 0.01, num_days)  # 1% random noise
         
         # Combine all patterns
         price_pattern = base_curve + sales_curve + noise
@@ -354,13 +339,16 @@ def get_amazon_product_info(api, asin, demo_mode=False):
         # Ensure all prices are reasonable (not negative or too low)
         price_pattern = np.maximum(price_pattern, price * 0.7)
         
-        # Make the history realistic - prices usually don't change every day
+        # Make the history realistic - prices usually don't change every day.
+        # Done on plain floats: indexing a NumPy array one day at a time is slower.
+        prices = price_pattern.tolist()
+        hold_below = base_price * 0.005  # Less than 0.5% change
         for i in range(1, num_days):
-            if abs(price_pattern[i] - price_pattern[i-1]) < base_price * 0.005:  # Less than 0.5% change
-                price_pattern[i] = price_pattern[i-1]  # Keep price the same
+            if abs(prices[i] - prices[i-1]) < hold_below:
+                prices[i] = prices[i-1]  # Keep price the same
         
-        # Convert to list and round to 2 decimal places
-        price_data = [round(p, 2) for p in price_pattern.tolist()]
+        # Round to 2 decimal places
+        price_data = [round(p, 2) for p in prices]
         
         # Calculate price metrics
         current_price = price
@@ -380,120 +368,129 @@ def get_amazon_product_info(api, asin, demo_mode=False):
     except Exception as e:
         print(f"Error getting Amazon product info: {str(e)}")
         # Fallback to demo mode
-        return get_amazon_product_info(api, asin, demo_mode=True)
+        return get_amazon_product_info(api, asin, demo_mode=True, enrich_title=False)
+
+def search_query(item_title):
+    """The few words of a product title worth searching other retailers for, '+'-joined"""
+    # Limit the query to the first few important words to improve search results
+    words = item_title.split()
+    
+    # Remove common words that don't help with searches
+    common_words = ['with', 'for', 'and', 'the', 'a', 'an', 'in', 'on', 'at', 'by']
+    filtered_words = [word for word in words if word.lower() not in common_words]
+    
+    # Use first 4-6 words for a more targeted search
+    query = ' '.join(filtered_words[:6])
+    
+    # Format search query
+    return query.replace(' ', '+')
+
+def walmart_search_url(item_title):
+    """Walmart search page URL for a product title"""
+    return f"https://www.walmart.com/search?q={search_query(item_title)}"
+
+def target_search_url(item_title):
+    """Target search page URL for a product title"""
+    return f"https://www.target.com/s?searchTerm={search_query(item_title)}"
+
+# Headers for retailer search pages, set to mimic a browser with a recent user agent
+WALMART_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.walmart.com/',
+    'sec-ch-ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-site': 'same-origin',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Cache-Control': 'max-age=0',
+}
+TARGET_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.target.com/',
+}
+
+def get_coalescing_stats():
+    """Return the single-flight counters for each kind of outbound fetch"""
+    return {flight.name: flight.stats() for flight in (SHORT_LINK_FLIGHT, AMAZON_FLIGHT, SEARCH_FLIGHT)}
+
+class SearchError(Exception):
+    """A retailer search page couldn't be fetched"""
+
+def fetch_search_result(url, parser, headers=None, timeout=15):
+    """Stream a search page into a SearchResultParser and return its first result
+    
+    Returns {'title', 'price', 'url'} or None when the page has no products,
+    and raises SearchError (or the network error) when the page can't be fetched.
+    Concurrent fetches of the same URL are coalesced into one (SEARCH_FLIGHT).
+    """
+    result = SEARCH_FLIGHT.do(url, _fetch_search_result, url, parser, headers, timeout)
+    return dict(result) if result else result
+
+def _fetch_search_result(url, parser, headers, timeout):
+    # Stream the page and stop reading at the first product
+    response = response_cache.cached_stream(url, parser.consume, headers=headers, timeout=timeout)
+    
+    # Check if request was successful
+    if response.status_code != 200:
+        raise SearchError(f"status code: {response.status_code}")
+    
+    return parser.finish()
 
 def search_walmart(item_title):
-    """Search Walmart for a product and return the price and product information"""
+    """Search Walmart for a product and return its first result
+    
+    Returns {'title': str or None, 'price': float or None, 'url': str or None},
+    or None when the search fails or finds nothing.
+    """
     try:
-        # Limit the query to the first few important words to improve search results
-        words = item_title.split()
-        
-        # Remove common words that don't help with searches
-        common_words = ['with', 'for', 'and', 'the', 'a', 'an', 'in', 'on', 'at', 'by']
-        filtered_words = [word for word in words if word.lower() not in common_words]
-        
-        # Use first 4-6 words for a more targeted search
-        query = ' '.join(filtered_words[:6])
-        
-        # Format search query
-        query = query.replace(' ', '+')
-        url = f"https://www.walmart.com/search?q={query}"
-        
-        # Set headers to mimic a browser with a more recent user agent
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.walmart.com/',
-            'sec-ch-ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"',
-            'sec-fetch-dest': 'document',
-            'sec-fetch-mode': 'navigate',
-            'sec-fetch-site': 'same-origin',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Cache-Control': 'max-age=0',
-        }
-        
-        # Send request
-        response = requests.get(url, headers=headers, timeout=15)
-        
-        # Check if request was successful
-        if response.status_code != 200:
-            print(f"Failed to get Walmart results, status code: {response.status_code}")
-            return None
-        
-        # Parse HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Try to find product items 
-        product_items = soup.select('div[data-item-id]')
-        
-        # If we can't find products with the new selector, try older ones
-        if not product_items:
-            product_items = soup.select('.search-result-gridview-item')
-        if not product_items:
-            product_items = soup.select('.product-card')
-            
-        if not product_items:
-            # If we still can't find products, look for any price
-            # Different possible selectors for Walmart prices
-            price_selectors = [
-                'span[data-automation-id="product-price"]',
-                'span.price-characteristic',
-                'span.price-group',
-                'div.product-price-container span.price',
-                'span.display-price'
-            ]
-            
-            # Try each selector
-            for selector in price_selectors:
-                prices = soup.select(selector)
-                if prices and len(prices) > 0:
-                    return prices[0].text.strip()
-            
-            # If we really can't find anything useful
+        result = fetch_search_result(walmart_search_url(item_title), parsers.WalmartSearchParser(), headers=WALMART_HEADERS, timeout=15)
+        if result is None:
             print("Couldn't find Walmart product items in search results")
-            return None
-        
-        # Take the first product (best match)
-        first_product = product_items[0]
-        
-        # Try to get price with various selectors that have worked in the past
-        price_element = None
-        price_selectors = [
-            'span[data-automation-id="product-price"]',
-            'span.product-price-container',
-            'span.price-characteristic',
-            '.product-price-container',
-            '.price-group'
-        ]
-        
-        for selector in price_selectors:
-            elements = first_product.select(selector)
-            if elements:
-                price_element = elements[0]
-                break
-        
-        if price_element:
-            price_text = price_element.get_text().strip()
-            
-            # Try to clean up the price
-            import re
-            price_match = re.search(r'\$?(\d+\.\d{2}|\d+)', price_text)
-            if price_match:
-                return f"${price_match.group(1)}"
-            else:
-                return price_text
-        
-        # Fallback to the text content if we can't isolate the price
-        return "Found at Walmart (price unavailable)"
-        
+        return result
+    
+    except SearchError as e:
+        print(f"Failed to get Walmart results, {str(e)}")
+        return None
     except Exception as e:
         print(f"Error searching Walmart: {str(e)}")
-        return "Walmart comparison unavailable"
+        return None
+
+def search_target(item_title):
+    """Search Target for a product and return its first result (same shape as search_walmart)"""
+    try:
+        result = fetch_search_result(target_search_url(item_title), parsers.TargetSearchParser(), headers=TARGET_HEADERS, timeout=15)
+        if result is None:
+            print("Couldn't find Target product items in search results")
+        return result
+    
+    except SearchError as e:
+        print(f"Failed to get Target results, {str(e)}")
+        return None
+    except Exception as e:
+        print(f"Error searching Target: {str(e)}")
+        return None
+
+# Girl Math multipliers: savings look 10% bigger, percentages 5% bigger
+SAVINGS_BOOST = 1.1
+PERCENT_BOOST = 1.05
+
+# Deal tiers, best first. A price within NEAR_LOW_FACTOR of the lowest is
+# 'near_low'; otherwise the enhanced percentage off the peak decides.
+DEAL_TIERS = ('near_low', 'great', 'good', 'justified')
+NEAR_LOW_FACTOR = 1.1
+GREAT_DEAL_PERCENT = 30
+GOOD_DEAL_PERCENT = 15
+
+# Above this the statement pool also gets the "it's an investment" lines
+SPLURGE_PRICE = 100
 
 def girl_math_logic(current_price, peak_price, lowest_price):
     """Apply Girl Math logic to calculate savings"""
@@ -505,21 +502,71 @@ def girl_math_logic(current_price, peak_price, lowest_price):
     
     # Girl Math always makes it look like a better deal!
     # The higher the difference between peak and current, the better the deal
-    enhanced_savings = savings_from_peak * 1.1  # Enhance savings by 10% (Girl Math magic!)
-    enhanced_percentage = savings_percentage * 1.05  # Enhance percentage by 5%
+    enhanced_savings = savings_from_peak * SAVINGS_BOOST  # Enhance savings by 10% (Girl Math magic!)
+    enhanced_percentage = savings_percentage * PERCENT_BOOST  # Enhance percentage by 5%
     
     return enhanced_savings, enhanced_percentage
 
+def deal_tier(current_price, lowest_price, percent):
+    """Name of the DEAL_TIERS entry for a price and its enhanced percentage off the peak"""
+    if current_price <= lowest_price * NEAR_LOW_FACTOR:
+        return 'near_low'
+    if percent >= GREAT_DEAL_PERCENT:
+        return 'great'
+    if percent >= GOOD_DEAL_PERCENT:
+        return 'good'
+    return 'justified'
+
+def _price_column(prices):
+    """A column as a float64 array, from an array, a list or a pandas Series"""
+    values = getattr(prices, 'to_numpy', None)
+    return np.asarray(values() if values else prices, dtype=np.float64)
+
+def score_deals(current_prices, peak_prices=None, lowest_prices=None):
+    """girl_math_logic and deal_tier for many products in one vectorized pass
+
+    Takes three equal-length arrays (or lists, or pandas Series), or a
+    single pandas DataFrame/mapping with current_price, peak_price and
+    lowest_price columns - e.g. straight from a products query. Returns a
+    dict of arrays: 'savings' and 'percentage' (bit-for-bit what
+    girl_math_logic returns for each row) and 'tier', int8 indexes into
+    DEAL_TIERS, so 0 is the best tier and sorting on it ranks deals.
+    """
+    if peak_prices is None and lowest_prices is None:
+        frame = current_prices
+        current_prices = frame['current_price']
+        peak_prices = frame['peak_price']
+        lowest_prices = frame['lowest_price']
+    current = _price_column(current_prices)
+    peak = _price_column(peak_prices)
+    lowest = _price_column(lowest_prices)
+
+    # Same operations in the same order as girl_math_logic, so the floats match
+    savings = peak - current
+    percentage = np.zeros_like(savings)
+    np.divide(savings, peak, out=percentage, where=peak > 0)
+    percentage *= 100
+    percentage *= PERCENT_BOOST
+    savings *= SAVINGS_BOOST
+
+    tier = np.full(current.shape, DEAL_TIERS.index('justified'), dtype=np.int8)
+    tier[percentage >= GOOD_DEAL_PERCENT] = DEAL_TIERS.index('good')
+    tier[percentage >= GREAT_DEAL_PERCENT] = DEAL_TIERS.index('great')
+    tier[current <= lowest * NEAR_LOW_FACTOR] = DEAL_TIERS.index('near_low')
+
+    return {'savings': savings, 'percentage': percentage, 'tier': tier}
+
 def girl_math_statement(current_price, peak_price, lowest_price):
     """Generate a fun girl math statement based on the price situation"""
     # Get the savings and percent from girl math logic
     savings, percent = girl_math_logic(current_price, peak_price, lowest_price)
+    tier = deal_tier(current_price, lowest_price, percent)
     
     # Create different statements based on the price situation
     statements = []
     
     # If it's a great deal (near lowest price)
-    if current_price <= lowest_price * 1.1:
+    if tier == 'near_low':
         statements.extend([
             "This is practically FREE by girl math standards! 💅",
             "At this price, it's basically paying YOU to buy it! 💖",
@@ -529,7 +576,7 @@ def girl_math_statement(current_price, peak_price, lowest_price):
         ])
     
     # If it's a good deal (significantly below peak)
-    elif percent >= 30:
+    elif tier == 'great':
         statements.extend([
             "That's like getting paid to shop! 💅",
             "Think of all the money you're saving! 💰",
@@ -539,7 +586,7 @@ def girl_math_statement(current_price, peak_price, lowest_price):
         ])
     
     # If it's an OK deal (somewhat below peak)
-    elif percent >= 15:
+    elif tier == 'good':
         statements.extend([
             "It's on sale, so you basically HAVE to buy it! 💁‍♀️",
             "Think of how sad you'll be if it sells out! 😢",
@@ -559,7 +606,7 @@ def girl_math_statement(current_price, peak_price, lowest_price):
         ])
     
     # If it's expensive but we justify it
-    if current_price > 100:
+    if current_price > SPLURGE_PRICE:
         statements.extend([
             "It's not a want, it's a NEED at this point! 💯",
             "Quality items cost more but last longer - it's an investment! 💸",